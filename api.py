@@ -0,0 +1,254 @@
+"""Headless JSON API for Cutiefy stall operations.
+
+Runs as a separate entry point next to the Streamlit UI on the same stall_core StallManager,
+reading credentials from .streamlit/secrets.toml:
+
+    python api.py --host 0.0.0.0 --port 8080 --workers 16
+
+Set CUTIEFY_API_TOKEN to require an "Authorization: Bearer <token>" header. Requests are served
+for the stall named in an "X-Stall-ID" header, else CUTIEFY_STALL_ID (or the default stall).
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import Any, Dict
+from urllib.parse import parse_qs, urlparse
+
+import stall_core
+from stall_core import Result
+
+API_TOKEN = os.environ.get("CUTIEFY_API_TOKEN", "")
+MAX_BODY_BYTES = 1024 * 1024
+# Idle keep-alive connections are dropped after this long, so they cannot hold every worker
+KEEPALIVE_TIMEOUT_SECONDS = 15
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+# HTTP status for each failed Result code
+RESULT_STATUS = {"invalid": 422, "not_found": 404, "unavailable": 503, "error": 500}
+
+_backend = None
+_managers: Dict[Any, stall_core.StallManager] = {}
+_managers_lock = threading.Lock()
+
+def get_manager(stall_id: str = stall_core.DEFAULT_STALL_ID) -> stall_core.StallManager:
+    """Shared StallManager per stall for all API workers (its methods keep no per-request state)"""
+    global _backend
+    with _managers_lock:
+        if stall_id not in _managers:
+            secrets = stall_core.load_local_secrets()
+            stall = stall_core.stall_config_from_secrets(secrets, stall_id)
+            if stall is None:
+                raise ApiError(404, f"Unknown stall '{stall_id}'")
+            if _backend is None:
+                _backend = stall_core.initialize_backend(secrets["firebase"])
+            db, aio = _backend
+            _managers[stall_id] = stall_core.StallManager(db, aio, stall_core.email_config_from_secrets(secrets), stall=stall)
+        return _managers[stall_id]
+
+def to_json(value: Any) -> bytes:
+    def default(obj):
+        if isinstance(obj, (datetime, date)):
+            return obj.isoformat()
+        return str(obj)
+    return json.dumps(value, default=default).encode("utf-8")
+
+class ApiError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+def unwrap(result: Result):
+    """Value of a successful core result, or an ApiError carrying its errors"""
+    if not result.ok:
+        raise ApiError(RESULT_STATUS.get(result.code, 500), "; ".join(result.errors))
+    return result.value
+
+class PooledHTTPServer(HTTPServer):
+    """HTTP server that handles requests on a fixed-size worker pool"""
+
+    daemon_threads = True
+
+    def __init__(self, server_address, handler_class, workers: int):
+        super().__init__(server_address, handler_class)
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="api-worker")
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._process_request_worker, request, client_address)
+
+    def _process_request_worker(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=False)
+
+class StallApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    timeout = KEEPALIVE_TIMEOUT_SECONDS
+
+    # 🔀 ROUTING
+    def do_GET(self):
+        self._dispatch({
+            r"/health": self.get_health,
+            r"/items": self.get_items,
+            r"/items/(?P<item_id>[^/]+)": self.get_item,
+            r"/sales": self.get_sales,
+            r"/reports/daily": self.get_daily_report
+        })
+
+    def do_POST(self):
+        self._dispatch({
+            r"/checkout": self.post_checkout
+        })
+
+    def _dispatch(self, routes: Dict[str, Any]):
+        url = urlparse(self.path)
+        try:
+            if API_TOKEN and self.headers.get("Authorization") != f"Bearer {API_TOKEN}":
+                raise ApiError(401, "Missing or invalid API token")
+            for pattern, handler in routes.items():
+                match = re.fullmatch(pattern, url.path.rstrip("/") or "/")
+                if match:
+                    query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+                    return handler(query, **match.groupdict())
+            raise ApiError(404, f"No route for {self.command} {url.path}")
+        except ApiError as e:
+            self._send_json(e.status, {"error": str(e)})
+        except stall_core.BackendUnavailable as e:
+            self._send_json(503, {"error": str(e)})
+        except Exception as e:
+            stall_core.logger.exception("API request failed: %s %s", self.command, self.path)
+            self._send_json(500, {"error": str(e)})
+
+    def manager(self) -> stall_core.StallManager:
+        return get_manager(self.headers.get("X-Stall-ID") or stall_core.DEFAULT_STALL_ID)
+
+    # 📤 RESPONSES
+    def _send(self, status: int, body: bytes, content_type: str, headers: Dict[str, str] = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status: int, payload: Any):
+        self._send(status, to_json(payload), "application/json")
+
+    def _read_json(self) -> Dict:
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            # Without a usable length the body cannot be skipped, so neither can the connection be reused
+            self.close_connection = True
+            raise ApiError(400, "Content-Length must be a non-negative integer")
+        if length > MAX_BODY_BYTES:
+            # The body is left unread, so the connection cannot carry another request
+            self.close_connection = True
+            raise ApiError(413, "Request body too large")
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError as e:
+            raise ApiError(400, f"Invalid JSON: {e}")
+        if not isinstance(body, dict):
+            raise ApiError(400, "Request body must be a JSON object")
+        return body
+
+    @staticmethod
+    def _query_date(query: Dict[str, str]) -> date:
+        try:
+            return date.fromisoformat(query["date"]) if "date" in query else date.today()
+        except ValueError:
+            raise ApiError(400, "date must be in YYYY-MM-DD format")
+
+    # 📦 ENDPOINTS
+    def get_health(self, query: Dict[str, str]):
+        self._send_json(200, self.manager().backend_health())
+
+    def get_items(self, query: Dict[str, str]):
+        self._send_json(200, {"items": unwrap(self.manager().get_all_items())})
+
+    def get_item(self, query: Dict[str, str], item_id: str):
+        self._send_json(200, unwrap(self.manager().get_item(item_id)))
+
+    def post_checkout(self, query: Dict[str, str]):
+        body = self._read_json()
+        customer = body.get("customer") or {}
+        lines = body.get("lines") or []
+        discount = body.get("discount") or {}
+        if not isinstance(customer, dict) or not isinstance(discount, dict):
+            raise ApiError(400, "Invalid checkout request: customer and discount must be JSON objects")
+        if not isinstance(lines, list) or not all(isinstance(line, dict) for line in lines):
+            raise ApiError(400, "Invalid checkout request: lines must be a list of JSON objects")
+        try:
+            discount_value = float(discount.get("value", 0))
+            delivery_charges = float(body.get("deliveryCharges", 0))
+        except (TypeError, ValueError) as e:
+            raise ApiError(400, f"Invalid checkout request: {e}")
+        result = self.manager().checkout(
+            customer,
+            lines,
+            discount_type=discount.get("type", "None"),
+            discount_value=discount_value,
+            delivery_charges=delivery_charges,
+            send_receipt=bool(body.get("sendReceipt", True))
+        )
+        receipt = unwrap(result)
+        self._send_json(201, {
+            "saleID": receipt.sale_id,
+            "cart": receipt.cart,
+            "subtotal": receipt.subtotal,
+            "discount": receipt.discount,
+            "deliveryCharges": receipt.delivery_charges,
+            "totalPaid": receipt.total_paid,
+            "emailSent": receipt.email_sent,
+            "messages": [message.text for message in result.messages]
+        })
+
+    def get_sales(self, query: Dict[str, str]):
+        selected_date = self._query_date(query)
+        self._send_json(200, {"date": selected_date, "sales": unwrap(self.manager().get_daily_sales(selected_date))})
+
+    def get_daily_report(self, query: Dict[str, str]):
+        selected_date = self._query_date(query)
+        refresh = query.get("refresh", "").lower() in ("1", "true", "yes")
+        report = unwrap(self.manager().generate_daily_report(selected_date, refresh))
+        filename = f"Daily_Sales_Accurate_Profit_Report_{selected_date.strftime('%Y-%m-%d')}.xlsx"
+        self._send(200, report, XLSX_MIME, {"Content-Disposition": f'attachment; filename="{filename}"'})
+
+    def log_message(self, format, *args):
+        stall_core.logger.info("%s - %s", self.address_string(), format % args)
+
+def main():
+    parser = argparse.ArgumentParser(description="Cutiefy stall HTTP API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=16, help="request worker pool size")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    get_manager()
+    server = PooledHTTPServer((args.host, args.port), StallApiHandler, args.workers)
+    print(f"Cutiefy API listening on http://{args.host}:{args.port} with {args.workers} workers")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
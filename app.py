@@ -1,29 +1,18 @@
+"""Cutiefy stall management Streamlit UI.
+
+Business logic lives in stall_core; this module renders pages and the messages carried by its results.
+"""
 import streamlit as st
 import pandas as pd
-import firebase_admin
-from firebase_admin import credentials, firestore
-import json
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from datetime import datetime, date
-import io
-import base64
-from typing import Dict, List, Any
-import uuid
-import qrcode
-from PIL import Image
+from datetime import date, datetime, timedelta
 
-# 🎨 PAGE CONFIG & STYLING
-st.set_page_config(
-    page_title="Cutiefy - Stall Management",
-    page_icon="🛒",
-    layout="wide",
-    initial_sidebar_state="expanded"
-)
+import profiling
+import stall_core
+from stall_core import LOW_STOCK_THRESHOLD, Money, Result, StallManager, submit_upi_qr
+from sales_archive import SALES_ARCHIVE_DIR, SalesArchive, archived_days
 
 # 🎨 CUSTOM CSS STYLING
-st.markdown("""
+PAGE_CSS = """
 <style>
     @import url('https://fonts.googleapis.com/css2?family=Dancing+Script:wght@400;500;600;700&family=Poppins:wght@300;400;500;600&display=swap');
     
@@ -129,583 +118,432 @@ st.markdown("""
         color: #B85450;
     }
 </style>
-""", unsafe_allow_html=True)
+"""
+
+# 🎨 PAGE CONFIG & STYLING
+def configure_page():
+    """Apply page config and styling (must run first in each Streamlit rerun)"""
+    st.set_page_config(
+        page_title="Cutiefy - Stall Management",
+        page_icon="🛒",
+        layout="wide",
+        initial_sidebar_state="expanded"
+    )
+    st.markdown(PAGE_CSS, unsafe_allow_html=True)
 
 # 🔧 FIREBASE CONFIGURATION - DIRECT CONNECTION
 @st.cache_resource
+def initialize_backend():
+    return stall_core.initialize_backend(st.secrets["firebase"])
 
-def initialize_firebase():
-    if not firebase_admin._apps:
-        cred = credentials.Certificate(dict(st.secrets["firebase"]))
-        firebase_admin.initialize_app(cred)
-    return firestore.client()
+@st.cache_resource
+def start_inventory_reconciler(stall_id):
+    """Start a stall's inventory summary reconciler once per Streamlit server process"""
+    db, _ = initialize_backend()
+    return stall_core.start_inventory_reconciler(stall_core.stall_client(db, stall_id))
 
 # 📧 EMAIL CONFIGURATION - SECURE FOR STREAMLIT CLOUD
 def get_email_config():
-    if hasattr(st, 'secrets') and 'email' in st.secrets:
-        return {
-            "smtp_server": "smtp.gmail.com",
-            "smtp_port": 587,
-            "email": st.secrets["email"]["address"],
-            "password": st.secrets["email"]["password"]
-        }
-    else:
-        # For local development
-        return {
-            "smtp_server": "smtp.gmail.com",
-            "smtp_port": 587,
-            "email": "dsharma.workmain@gmail.com",
-            "password": "etth ppbi rmpl ikyc"
-        }
+    return stall_core.email_config_from_secrets(st.secrets if hasattr(st, 'secrets') else {})
 
-EMAIL_CONFIG = get_email_config()
+# 🏬 STALL SELECTION
+def current_stall_id():
+    """Stall served by this session: ?stall=<id> in the URL, else CUTIEFY_STALL_ID (or the default stall)"""
+    return st.query_params.get("stall") or stall_core.DEFAULT_STALL_ID
 
-# 🏪 BUSINESS CONFIGURATION
-BUSINESS_INFO = {
-    "name": "Cutiefy",
-    "brand": "Cutiefy",
-    "logo_url": "https://i.ibb.co/h1ZWHFbP/Untitled-design-1.png",
-    "contact": "Contact: +91-97178 87616",
-    "address": "Delhi, India"
-}
+@st.cache_resource
+def get_manager(stall_id) -> StallManager:
+    """Shared StallManager per stall, with the stall's config loaded once (carts live in session_state)"""
+    stall = stall_core.stall_config_from_secrets(st.secrets, stall_id)
+    if stall is None:
+        raise ValueError(f"Unknown stall '{stall_id}' - add a [stalls.{stall_id}] section to the secrets")
+    db, aio = initialize_backend()
+    return StallManager(db, aio, get_email_config(), stall=stall)
 
-class StallManager:
-    def __init__(self):
-        try:
-            self.db = initialize_firebase()
-        except Exception as e:
-            st.error(f"Database connection error: {e}")
-            st.stop()
-            
-        if 'cart' not in st.session_state:
-            st.session_state.cart = []
-        if 'current_customer' not in st.session_state:
-            st.session_state.current_customer = {}
-    
-    # 📦 INVENTORY MANAGEMENT METHODS
-    def get_all_items(self) -> List[Dict]:
-        """Fetch all items from Firestore"""
-        try:
-            items_ref = self.db.collection('items')
-            items = items_ref.stream()
-            return [{'id': item.id, **item.to_dict()} for item in items]
-        except Exception as e:
-            st.error(f"Error fetching items: {e}")
-            return []
-    
-    def add_item(self, item_data: Dict) -> bool:
-        """Add new item to inventory"""
-        try:
-            # Check if itemID already exists
-            existing_items = self.get_all_items()
-            if any(item['itemID'] == item_data['itemID'] for item in existing_items):
-                st.error(f"Item ID '{item_data['itemID']}' already exists!")
-                return False
-            
-            self.db.collection('items').add(item_data)
-            return True
-        except Exception as e:
-            st.error(f"Error adding item: {e}")
-            return False
-    
-    def update_item(self, doc_id: str, item_data: Dict) -> bool:
-        """Update existing item"""
-        try:
-            self.db.collection('items').document(doc_id).update(item_data)
-            return True
-        except Exception as e:
-            st.error(f"Error updating item: {e}")
-            return False
-    
-    def delete_item(self, doc_id: str) -> bool:
-        """Delete item from inventory"""
-        try:
-            self.db.collection('items').document(doc_id).delete()
-            return True
-        except Exception as e:
-            st.error(f"Error deleting item: {e}")
-            return False
-    
-    # 🧾 BILLING METHODS
-    def add_to_cart(self, item: Dict, quantity: int) -> bool:
-        """Add item to cart with real-time inventory check"""
-        try:
-            # Get the latest inventory data to ensure accuracy
-            items_ref = self.db.collection('items')
-            current_items = list(items_ref.where('itemID', '==', item['itemID']).stream())
-            
-            if not current_items:
-                st.error(f"❌ Item '{item['itemName']}' not found in database!")
-                return False
-            
-            current_item_data = current_items[0].to_dict()
-            current_available = current_item_data.get('quantityAvailable', 0)
-            
-            # Check if item already in cart and calculate total needed
-            existing_in_cart = sum(cart_item['quantity'] for cart_item in st.session_state.cart 
-                                 if cart_item['itemID'] == item['itemID'])
-            total_needed = existing_in_cart + quantity
-            
-            if current_available < total_needed:
-                available_to_add = max(0, current_available - existing_in_cart)
-                if available_to_add > 0:
-                    st.error(f"❌ Only {available_to_add} more items available! (You already have {existing_in_cart} in cart)")
-                else:
-                    st.error(f"❌ No more items available! (You already have {existing_in_cart} in cart, only {current_available} in stock)")
-                return False
-            
-            # Add to cart
-            cart_item = {
-                'itemID': item['itemID'],
-                'itemName': item['itemName'],
-                'salePrice': current_item_data['salePrice'],  # Use latest price
-                'quantity': quantity,
-                'total': current_item_data['salePrice'] * quantity
-            }
+def show(result: Result) -> Result:
+    """Render a core result's stock alerts and messages, then hand it back for its value"""
+    for alert in result.alerts:
+        st.warning(alert.text)
+    for message in result.messages:
+        getattr(st, message.level)(message.text)
+    return result
+
+# 🧩 PAGE FRAGMENTS
+# Each fragment reruns on its own when its widgets change, fetching only the data it shows.
+# A full st.rerun() is used only when an action changes data shown outside the fragment.
+@st.fragment
+def inventory_grid(manager: StallManager, snapshot: stall_core.InventorySnapshot):
+    # Editable grid: change any number of rows, then save them together
+    grid = pd.DataFrame([{
+        'id': doc_id,
+        'stock': "🔴" if item.get('quantityAvailable', 0) < LOW_STOCK_THRESHOLD else "🟢",
+        'itemName': item['itemName'],
+        'itemID': item['itemID'],
+        'purchasePrice': item['purchasePrice'],
+        'salePrice': item['salePrice'],
+        'quantityAvailable': item['quantityAvailable'],
+        'delete': False
+    } for doc_id, item in snapshot.items.items()]).set_index('id')
+    
+    edited = st.data_editor(
+        grid,
+        key=f"inventory_grid_{st.session_state.inventory_grid_version}",
+        hide_index=True,
+        use_container_width=True,
+        disabled=['stock', 'itemID'],
+        column_config={
+            'stock': st.column_config.TextColumn("", width="small"),
+            'itemName': st.column_config.TextColumn("Item Name", required=True),
+            'itemID': st.column_config.TextColumn("Item ID"),
+            'purchasePrice': st.column_config.NumberColumn("Purchase Price (₹)", min_value=0.0, step=0.01, format="%.2f", required=True),
+            'salePrice': st.column_config.NumberColumn("Sale Price (₹)", min_value=0.0, step=0.01, format="%.2f", required=True),
+            'quantityAvailable': st.column_config.NumberColumn("Quantity", min_value=0, step=1, required=True),
+            'delete': st.column_config.CheckboxColumn("🗑️ Delete")
+        }
+    )
+    
+    edits = edited.drop(columns=['stock', 'delete']).to_dict('index')
+    to_delete = edited.index[edited['delete']].tolist()
+    edited_count = sum(1 for doc_id, row in edits.items()
+                       if doc_id not in to_delete and stall_core.diff_item_fields(snapshot.items[doc_id], row))
+    st.caption(f"✏️ {edited_count} items edited · 🗑️ {len(to_delete)} marked for deletion")
+    
+    col_save, col_reload = st.columns(2)
+    with col_save:
+        if st.button("💾 Save Changes", disabled=not edited_count and not to_delete, key="save_inventory_grid"):
+            st.session_state.inventory_notices = [manager.bulk_update_items(
+                snapshot, {doc_id: row for doc_id, row in edits.items() if doc_id not in to_delete}, to_delete)]
+            st.session_state.inventory_sync_due = True
+            st.rerun()
+    with col_reload:
+        if st.button("🔄 Reload Inventory", key="reload_inventory_grid"):
+            st.session_state.inventory_sync_due = True
+            st.rerun()
+
+@st.fragment
+def customer_details(manager: StallManager):
+    # Returning customer lookup
+    customer_lookup = st.text_input("🔍 Find Returning Customer", placeholder="Start typing name, phone or email")
+    if customer_lookup:
+        matches = show(manager.search_customers(customer_lookup)).value
+        if matches:
+            for match in matches:
+                label = (f"{match['name']} · {match['phone']} · {match['email']} "
+                         f"({match.get('visitCount', 0)} visits, ₹{match.get('lifetimeSpend', 0):.2f})")
+                if st.button(label, key=f"customer_match_{match['id']}"):
+                    st.session_state.current_customer = {
+                        'name': match['name'],
+                        'email': match['email'],
+                        'phone': match['phone']
+                    }
+                    st.rerun(scope="fragment")
+        else:
+            st.caption("No matching customers - enter their details below.")
+    
+    current_customer = st.session_state.current_customer
+    with st.form("customer_info"):
+        col1, col2 = st.columns(2)
+        with col1:
+            customer_name = st.text_input("Customer Name*", value=current_customer.get('name', ''), placeholder="Enter customer name")
+            customer_email = st.text_input("Email Address*", value=current_customer.get('email', ''), placeholder="customer@email.com")
+        with col2:
+            customer_phone = st.text_input("Phone Number*", value=current_customer.get('phone', ''), placeholder="+91-XXXXXXXXXX")
+        
+        if st.form_submit_button("💾 Save Customer Info"):
+            if customer_name and customer_email and customer_phone:
+                st.session_state.current_customer = {
+                    'name': customer_name,
+                    'email': customer_email,
+                    'phone': customer_phone
+                }
+                st.success("✅ Customer information saved!")
+            else:
+                st.error("Please fill in all customer details.")
+
+@st.fragment
+def add_to_cart_form(manager: StallManager):
+    # The catalog is kept for the billing session; add_to_cart re-checks live stock and price anyway
+    if st.session_state.get('billing_items') is None:
+        st.session_state.billing_items = show(manager.get_all_items()).value
+    items = st.session_state.billing_items
+    if items:
+        with st.form("add_to_cart"):
+            col1, col2, col3 = st.columns([3, 1, 1])
             
-            # Check if item already in cart
-            existing_index = next((i for i, cart_item_check in enumerate(st.session_state.cart) 
-                                  if cart_item_check['itemID'] == item['itemID']), None)
+            with col1:
+                # Create searchable dropdown
+                item_options = [f"{item['itemName']} (ID: {item['itemID']})" for item in items]
+                selected_item_text = st.selectbox("Select Item", item_options)
             
-            if existing_index is not None:
-                st.session_state.cart[existing_index]['quantity'] += quantity
-                st.session_state.cart[existing_index]['total'] = (
-                    st.session_state.cart[existing_index]['quantity'] * 
-                    current_item_data['salePrice']
-                )
-            else:
-                st.session_state.cart.append(cart_item)
+            with col2:
+                quantity = st.number_input("Quantity", min_value=1, value=1, step=1)
             
-            return True
+            with col3:
+                st.write("")  # Space
+                st.write("")  # Space
+                add_to_cart = st.form_submit_button("➕ Add to Cart")
             
-        except Exception as e:
-            st.error(f"Error adding to cart: {e}")
-            return False
-    
-    def remove_from_cart(self, index: int):
-        """Remove item from cart"""
-        if 0 <= index < len(st.session_state.cart):
-            st.session_state.cart.pop(index)
-    
-    def calculate_cart_total(self) -> float:
-        """Calculate total cart amount"""
-        return sum(item['total'] for item in st.session_state.cart)
-    
-    def validate_cart_inventory(self) -> bool:
-        """Validate that all cart items have sufficient inventory"""
-        try:
-            for cart_item in st.session_state.cart:
-                items_ref = self.db.collection('items')
-                current_items = list(items_ref.where('itemID', '==', cart_item['itemID']).stream())
-                
-                if not current_items:
-                    st.error(f"❌ Item '{cart_item['itemName']}' no longer exists!")
-                    return False
+            if add_to_cart and selected_item_text:
+                # Find the selected item
+                selected_item = next(item for item in items if f"{item['itemName']} (ID: {item['itemID']})" == selected_item_text)
                 
-                current_available = current_items[0].to_dict().get('quantityAvailable', 0)
-                if current_available < cart_item['quantity']:
-                    st.error(f"❌ Insufficient stock for '{cart_item['itemName']}': Need {cart_item['quantity']}, Available {current_available}")
-                    return False
-            
-            return True
-        except Exception as e:
-            st.error(f"Error validating inventory: {e}")
-            return False
-    
-    def apply_discount(self, subtotal: float, discount_type: str, discount_value: float) -> float:
-        """Apply discount to subtotal"""
-        if discount_type == "Percentage":
-            return subtotal * (discount_value / 100)
-        else:  # Flat discount
-            return min(discount_value, subtotal)
-    
-    def save_sale(self, customer_data: Dict, cart_items: List, subtotal: float, 
-                  discount: float, total_paid: float) -> str:
-        """Save sale to Firestore and update inventory quantities"""
-        try:
-            # Enhance cart items with ACCURATE profit calculation considering discount
-            enhanced_cart = []
-            items_ref = self.db.collection('items')
-            total_cost = 0
+                # Add to cart with real-time inventory check
+                if show(manager.add_to_cart(st.session_state.cart, selected_item, quantity)).ok:
+                    st.success(f"✅ Added {quantity} x {selected_item['itemName']} to cart!")
+                    # The cart is its own fragment, so show the new line with a full rerun
+                    st.rerun()
+    
+    if st.button("🔄 Refresh Item List", key="refresh_billing_items"):
+        st.session_state.billing_items = None
+        st.rerun(scope="fragment")
+
+@st.fragment
+def cart_and_checkout(manager: StallManager):
+    # Display Cart
+    if st.session_state.cart:
+        st.markdown('<h3 class="section-header">🛒 Current Cart</h3>', unsafe_allow_html=True)
+        
+        for i, cart_item in enumerate(st.session_state.cart):
+            col1, col2, col3, col4, col5 = st.columns([3, 1, 1, 1, 1])
             
-            for cart_item in cart_items:
-                # Get current item data including purchase price
-                current_items = list(items_ref.where('itemID', '==', cart_item['itemID']).stream())
-                if current_items:
-                    item_data = current_items[0].to_dict()
-                    purchase_price = item_data.get('purchasePrice', 0)
-                    
-                    enhanced_item = cart_item.copy()
-                    enhanced_item['purchasePrice'] = purchase_price
-                    
-                    # Calculate item cost and profit BEFORE discount
-                    item_cost = purchase_price * cart_item['quantity']
-                    total_cost += item_cost
+            with col1:
+                st.write(f"**{cart_item['itemName']}** (ID: {cart_item['itemID']})")
+            with col2:
+                st.write(f"₹{cart_item['salePrice']:.2f}")
+            with col3:
+                st.write(f"Qty: {cart_item['quantity']}")
+            with col4:
+                st.write(f"₹{cart_item['total']:.2f}")
+            with col5:
+                if st.button("🗑️", key=f"remove_cart_{i}", help="Remove from cart"):
+                    manager.remove_from_cart(st.session_state.cart, i)
+                    st.rerun(scope="fragment")
+        
+        st.divider()
+        
+        # Cart Summary and Checkout
+        subtotal = manager.calculate_cart_total(st.session_state.cart)
+        
+        st.markdown('<h3 class="section-header">💰 Billing Summary</h3>', unsafe_allow_html=True)
+        
+        # Discount section
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            discount_type = st.selectbox("Discount Type", ["None", "Percentage", "Flat Amount"])
+        with col2:
+            discount_value = st.number_input("Discount Value", min_value=0.0, step=0.01) if discount_type != "None" else 0
+        with col3:
+            delivery_charges = st.number_input("Delivery Charges", min_value=0.0, step=0.01, value=0.0)
+        # Calculate totals
+        discount_amount = 0
+        if discount_type != "None":
+            discount_amount = manager.apply_discount(subtotal, discount_type, discount_value)
+        final_total = (Money.of(subtotal) - Money.of(discount_amount) + Money.of(delivery_charges)).rupees
+        # Display totals
+        col1, col2 = st.columns(2)
+        with col2:
+            st.markdown(f"""
+            <div class="metric-card">
+                <div style="display: flex; justify-content: space-between; margin: 5px 0;">
+                    <span>Subtotal:</span>
+                    <span>₹{subtotal:.2f}</span>
+                </div>
+                <div style="display: flex; justify-content: space-between; margin: 5px 0;">
+                    <span>Discount:</span>
+                    <span>-₹{discount_amount:.2f}</span>
+                </div>
+                <div style="display: flex; justify-content: space-between; margin: 5px 0;">
+                    <span>Delivery Charges:</span>
+                    <span>₹{delivery_charges:.2f}</span>
+                </div>
+                <div style="display: flex; justify-content: space-between; margin: 15px 0 5px 0; font-size: 1.2rem; font-weight: bold; border-top: 2px solid #B85450; padding-top: 10px;">
+                    <span>Total:</span>
+                    <span>₹{final_total:.2f}</span>
+                </div>
+            </div>
+            """, unsafe_allow_html=True)
+        # Checkout button
+        # Customer details live in another fragment, so check them on click rather than disabling the button
+        if st.button("🎯 Generate Bill & Send Receipt"):
+            if st.session_state.current_customer:
+                # Validate inventory before processing sale
+                if show(manager.validate_cart_inventory(st.session_state.cart)).ok:
+                    # Render the payment QR while the sale is being saved
+                    qr_future = submit_upi_qr(final_total, manager.stall.payment_info)
                     
-                    # Store the cost for this item
-                    enhanced_item['totalCost'] = item_cost
-                    enhanced_cart.append(enhanced_item)
+                    # Save sale to database and update inventory
+                    saved = show(manager.save_sale(
+                        st.session_state.current_customer,
+                        st.session_state.cart,
+                        subtotal,
+                        discount_amount,
+                        final_total
+                    ))
+                    if saved.ok:
+                        sale_id = saved.value.sale_id
+                        # Send email receipt with delivery charges and QR code
+                        email_sent = show(manager.send_email_receipt(
+                            st.session_state.current_customer['email'],
+                            st.session_state.current_customer['name'],
+                            st.session_state.cart,
+                            subtotal,
+                            discount_amount,
+                            final_total,
+                            sale_id,
+                            delivery_charges,
+                            qr_future
+                        )).ok
+                        show(manager.record_email_status(sale_id, 'sent' if email_sent else 'failed'))
+                        if email_sent:
+                            st.success(f"✅ Bill generated successfully! Receipt sent to {st.session_state.current_customer['email']}")
+                            st.success(f"🆔 Sale ID: {sale_id}")
+                        else:
+                            st.warning(f"✅ Bill saved (ID: {sale_id}) but email failed to send. Please check email configuration.")
+                        # Clear cart and customer info (and the catalog, whose stock just changed)
+                        st.session_state.cart = []
+                        st.session_state.current_customer = {}
+                        st.session_state.billing_items = None
+                        st.rerun()
                 else:
-                    # Fallback if item not found
-                    enhanced_item = cart_item.copy()
-                    enhanced_item['purchasePrice'] = 0
-                    enhanced_item['totalCost'] = 0
-                    enhanced_cart.append(enhanced_item)
-            
-            # Calculate ACCURATE total profit: Amount Actually Received - Total Cost
-            total_profit = total_paid - total_cost
-            
-            # Distribute profit proportionally among items based on their revenue contribution
-            if subtotal > 0:
-                for item in enhanced_cart:
-                    # Calculate item's share of total revenue
-                    item_revenue_share = item['total'] / subtotal
-                    
-                    # Assign proportional profit to this item
-                    item['totalProfit'] = total_profit * item_revenue_share
-                    
-                    # Calculate effective profit per unit after discount
-                    if item['quantity'] > 0:
-                        item['profitPerUnit'] = item['totalProfit'] / item['quantity']
-                    else:
-                        item['profitPerUnit'] = 0
-            
-            sale_data = {
-                'customerName': customer_data['name'],
-                'customerEmail': customer_data['email'],
-                'customerPhone': customer_data['phone'],
-                'cart': enhanced_cart,  # Now includes profit data
-                'subtotal': subtotal,
-                'discount': discount,
-                'totalPaid': total_paid,
-                'totalProfit': total_profit,  # Add total profit to sale record
-                'createdAt': datetime.now(),
-                'saleID': str(uuid.uuid4())[:8].upper()
-            }
-            
-            # Update inventory for each cart item
-            for cart_item in enhanced_cart:
-                # Find the item document
-                current_items = list(items_ref.where('itemID', '==', cart_item['itemID']).stream())
-                if current_items:
-                    item_doc = current_items[0]
-                    current_data = item_doc.to_dict()
-                    current_qty = current_data.get('quantityAvailable', 0)
-                    new_qty = max(0, current_qty - cart_item['quantity'])
-                    
-                    # Update inventory
-                    items_ref.document(item_doc.id).update({'quantityAvailable': new_qty})
-                    
-                    # Stock alerts
-                    if new_qty == 0:
-                        st.warning(f"⚠️ Item '{cart_item['itemName']}' is now out of stock!")
-                    elif new_qty < 10:
-                        st.warning(f"⚠️ Low stock alert: '{cart_item['itemName']}' has only {new_qty} items left!")
-            
-            # Save the sale
-            self.db.collection('sales').add(sale_data)
-            
-            st.success("✅ Inventory updated automatically!")
-            st.info(f"💰 Accurate Profit on this sale: ₹{total_profit:.2f}")
-            st.info(f"💸 Total Cost: ₹{total_cost:.2f} | 💵 Amount Received: ₹{total_paid:.2f}")
-            return sale_data['saleID']
-            
-        except Exception as e:
-            st.error(f"Error saving sale and updating inventory: {e}")
-            return None
+                    st.error("❌ Cannot complete sale - inventory validation failed. Please update your cart.")
+            else:
+                st.error("Please enter customer information first!")
     
-    def send_email_receipt(self, customer_email: str, customer_name: str, 
-                          cart_items: List, subtotal: float, discount: float, 
-                          total_paid: float, sale_id: str, delivery_charges: float = 0.0) -> bool:
-        """Send beautiful HTML email receipt with static QR code for payment and delivery charges"""
-        try:
-            st.info(f"📧 Sending email to {customer_email}...")
-
-            # Use static QR code image and provided UPI ID
-            upi_id = "sakshi.sharma28011@okhdfcbank"
-            qr_img_url = "https://i.ibb.co/jkx87sVM/qr.jpg"
-            qr_img_html = f'<img src="{qr_img_url}" alt="UPI QR Code" style="max-width:180px; margin: 20px auto; display:block;" />'
+    else:
+        st.info("Cart is empty. Add items to proceed with billing.")
 
-            # Create HTML email template
-            html_template = f"""
-            <!DOCTYPE html>
-            <html>
-            <head>
-                <meta charset="utf-8">
-                <meta name="viewport" content="width=device-width, initial-scale=1.0">
-                <title>Receipt - {BUSINESS_INFO['brand']}</title>
-                <style>
-                    body {{ font-family: 'Arial', sans-serif; background-color: #f5f5f5; margin: 0; padding: 20px; }}
-                    .container {{ max-width: 600px; margin: 0 auto; background: white; border-radius: 12px; overflow: hidden; box-shadow: 0 4px 12px rgba(0,0,0,0.1); }}
-                    .header {{ background: linear-gradient(135deg, #ECD0D4, #F5E6E8); padding: 30px; text-align: center; }}
-                    .logo {{ max-width: 150px; height: auto; border-radius: 8px; }}
-                    .brand-name {{ font-size: 2.5rem; color: #B85450; margin: 15px 0 5px 0; font-weight: bold; }}
-                    .content {{ padding: 30px; }}
-                    .receipt-title {{ font-size: 1.8rem; color: #B85450; margin-bottom: 20px; text-align: center; }}
-                    .customer-info {{ background: #F5E6E8; padding: 20px; border-radius: 8px; margin-bottom: 25px; }}
-                    .items-table {{ width: 100%; border-collapse: collapse; margin: 20px 0; }}
-                    .items-table th, .items-table td {{ padding: 12px; text-align: left; border-bottom: 1px solid #ECD0D4; }}
-                    .items-table th {{ background: #ECD0D4; color: #B85450; font-weight: bold; }}
-                    .total-section {{ background: #F5E6E8; padding: 20px; border-radius: 8px; margin-top: 25px; }}
-                    .total-row {{ display: flex; justify-content: space-between; margin: 8px 0; }}
-                    .final-total {{ font-size: 1.3rem; font-weight: bold; color: #B85450; border-top: 2px solid #ECD0D4; padding-top: 15px; margin-top: 15px; }}
-                    .footer {{ background: #ECD0D4; padding: 20px; text-align: center; color: #B85450; }}
-                    .thank-you {{ font-size: 1.2rem; font-weight: bold; margin-bottom: 10px; }}
-                </style>
-            </head>
-            <body>
-                <div class="container">
-                    <div class="header">
-                        <img src="{BUSINESS_INFO['logo_url']}" alt="Logo" class="logo">
-                        <div class="brand-name">{BUSINESS_INFO['brand']}</div>
-                    </div>
-                    
-                    <div class="content">
-                        <h2 class="receipt-title">🧾 Purchase Receipt</h2>
-                        
-                        <div class="customer-info">
-                            <h3 style="margin-top: 0; color: #B85450;">Customer Details</h3>
-                            <p><strong>Name:</strong> {customer_name}</p>
-                            <p><strong>Email:</strong> {customer_email}</p>
-                            <p><strong>Receipt ID:</strong> {sale_id}</p>
-                            <p><strong>Date:</strong> {datetime.now().strftime("%B %d, %Y at %I:%M %p")}</p>
-                        </div>
-                        
-                        <h3 style="color: #B85450;">Items Purchased</h3>
-                        <table class="items-table">
-                            <thead>
-                                <tr>
-                                    <th>Item</th>
-                                    <th>Qty</th>
-                                    <th>Price</th>
-                                    <th>Total</th>
-                                </tr>
-                            </thead>
-                            <tbody>
-            """
-            
-            # Add cart items to email
-            for item in cart_items:
-                html_template += f"""
-                                <tr>
-                                    <td>{item['itemName']}</td>
-                                    <td>{item['quantity']}</td>
-                                    <td>₹{item['salePrice']:.2f}</td>
-                                    <td>₹{item['total']:.2f}</td>
-                                </tr>
-                """
-            
-            html_template += f"""
-                            </tbody>
-                        </table>
-                        
-                        <div class="total-section">
-                            <div class="total-row">
-                                <span>Subtotal:</span>
-                                <span>₹{subtotal:.2f}</span>
-                            </div>
-                            <div class="total-row">
-                                <span>Discount:</span>
-                                <span>-₹{discount:.2f}</span>
-                            </div>
-                            <div class="total-row">
-                                <span>Delivery Charges:</span>
-                                <span>₹{delivery_charges:.2f}</span>
-                            </div>
-                            <div class="total-row final-total">
-                                <span>Total Paid:</span>
-                                <span>₹{total_paid:.2f}</span>
-                            </div>
-                        </div>
-                        <div style="text-align:center; margin-top:30px;">
-                            <h3 style="color:#B85450;">Pay via UPI</h3>
-                            {qr_img_html}
-                            <p style="color:#B85450; font-weight:bold;">UPI ID: {upi_id}</p>
-                            <p style="color:#B85450;">Please scan the QR code above or pay to the UPI ID. After payment, reply to this email with a screenshot of your payment showing the <b>UPIRF number</b> for confirmation.</p>
-                        </div>
-                    </div>
-                    
-                    <div class="footer">
-                        <div class="thank-you">Thank you for shopping with us! 💖</div>
-                        <p>{BUSINESS_INFO['contact']}</p>
-                        <p>{BUSINESS_INFO['address']}</p>
-                    </div>
-                </div>
-            </body>
-            </html>
-            """
-            
-            # Send email with detailed error handling
-            msg = MIMEMultipart('alternative')
-            msg['From'] = EMAIL_CONFIG['email']
-            msg['To'] = customer_email
-            msg['Subject'] = f"Receipt from {BUSINESS_INFO['brand']}"
-            
-            html_part = MIMEText(html_template, 'html')
-            msg.attach(html_part)
-            
-            st.info("🔗 Connecting to Gmail SMTP server...")
-            server = smtplib.SMTP(EMAIL_CONFIG['smtp_server'], EMAIL_CONFIG['smtp_port'])
-            server.starttls()
-            
-            st.info("🔐 Logging into Gmail...")
-            server.login(EMAIL_CONFIG['email'], EMAIL_CONFIG['password'])
-            
-            st.info("📤 Sending email...")
-            server.send_message(msg)
-            server.quit()
-            
-            st.success("✅ Email sent successfully!")
-            return True
-            
-        except smtplib.SMTPAuthenticationError as e:
-            st.error(f"❌ Gmail Authentication Failed: {e}")
-            st.error("Check if your app password is correct and 2FA is enabled")
-            return False
-        except smtplib.SMTPException as e:
-            st.error(f"❌ SMTP Error: {e}")
-            return False
-        except Exception as e:
-            st.error(f"❌ Email Error: {e}")
-            st.error("Make sure your Gmail credentials are correct")
-            return False
-    
-    # 📊 REPORTING METHODS
-    def get_daily_sales(self, selected_date: date) -> List[Dict]:
-        """Get all sales for a specific date"""
-        try:
-            start_date = datetime.combine(selected_date, datetime.min.time())
-            end_date = datetime.combine(selected_date, datetime.max.time())
-            
-            sales_ref = self.db.collection('sales')
-            sales = sales_ref.where('createdAt', '>=', start_date).where('createdAt', '<=', end_date).stream()
-            
-            return [{'id': sale.id, **sale.to_dict()} for sale in sales]
-        except Exception as e:
-            st.error(f"Error fetching daily sales: {e}")
-            return []
-    
-    def generate_daily_report(self, selected_date: date) -> bytes:
-        """Generate Excel report for daily sales with ALWAYS ACCURATE profit analysis"""
-        sales = self.get_daily_sales(selected_date)
+@st.fragment
+def report_details(manager: StallManager, selected_date: date):
+    refresh_report = st.checkbox("🔄 Include sales saved on other devices", value=False,
+                                 help="Re-read this day's sales from the database instead of the local report shard")
+    
+    # Get the day's report lines (one row per cart line) from the local shard
+    report_lines = show(manager.get_daily_report_lines(selected_date, refresh_report)).value
+    
+    if not report_lines.empty:
+        # Summary metrics count each sale once; profit is ALWAYS recalculated from the amount received
+        daily_sales = report_lines.drop_duplicates('saleID')
+        total_sales = len(daily_sales)
+        total_revenue = daily_sales['saleTotalPaid'].sum()
+        total_profit = daily_sales['saleProfit'].sum()
+        total_cost = daily_sales['saleCost'].sum()
         
-        if not sales:
-            return None
+        total_items_sold = len(report_lines)
+        profit_margin = (total_profit / total_revenue * 100) if total_revenue > 0 else 0
         
-        # Get current inventory for fallback profit calculations
-        items_ref = self.db.collection('items')
-        current_inventory = {item.to_dict()['itemID']: item.to_dict() for item in items_ref.stream()}
+        # Display enhanced metrics
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("Total Sales", total_sales)
+        with col2:
+            st.metric("Total Revenue", f"₹{total_revenue:.2f}")
+        with col3:
+            st.metric("Total Profit", f"₹{total_profit:.2f}", f"{profit_margin:.1f}% margin")
+        with col4:
+            st.metric("Items Sold", total_items_sold)
         
-        # Prepare data for Excel with ALWAYS ACCURATE profit calculations
-        report_data = []
-        total_revenue = 0
-        total_profit = 0
-        total_cost = 0
+        # Additional profit insights
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            avg_profit_per_sale = total_profit / total_sales if total_sales > 0 else 0
+            st.metric("Avg Profit/Sale", f"₹{avg_profit_per_sale:.2f}")
+        with col2:
+            avg_revenue_per_sale = total_revenue / total_sales if total_sales > 0 else 0
+            st.metric("Avg Revenue/Sale", f"₹{avg_revenue_per_sale:.2f}")
+        with col3:
+            st.metric("Total Cost", f"₹{total_cost:.2f}")
         
-        for sale in sales:
-            sale_total_paid = sale['totalPaid']
-            sale_discount = sale.get('discount', 0)
-            sale_subtotal = sale.get('subtotal', sale_total_paid + sale_discount)
-            
-            # ALWAYS recalculate profit accurately - ignore stored values
-            sale_cost = 0
-            for item in sale['cart']:
-                item_id = item['itemID']
-                item_purchase_price = item.get('purchasePrice', 0)
-                
-                # Fallback to current inventory if no purchase price in sale record
-                if item_purchase_price == 0 and item_id in current_inventory:
-                    item_purchase_price = current_inventory[item_id].get('purchasePrice', 0)
-                
-                sale_cost += item_purchase_price * item['quantity']
-            
-            # ACCURATE profit = Amount actually received - Total cost
-            sale_profit = sale_total_paid - sale_cost
-            
-            for item in sale['cart']:
-                # Get accurate item data
-                item_purchase_price = item.get('purchasePrice', 0)
-                
-                # Fallback to current inventory if no purchase price in sale record
-                if item_purchase_price == 0 and item['itemID'] in current_inventory:
-                    item_purchase_price = current_inventory[item['itemID']].get('purchasePrice', 0)
-                
-                # Calculate item cost
-                item_total_cost = item_purchase_price * item['quantity']
-                
-                # Calculate accurate item profit (proportional share of total sale profit)
-                if sale_subtotal > 0:
-                    item_revenue_share = item['total'] / sale_subtotal
-                    item_total_profit = sale_profit * item_revenue_share
-                    item_profit_per_unit = item_total_profit / item['quantity'] if item['quantity'] > 0 else 0
-                else:
-                    item_total_profit = 0
-                    item_profit_per_unit = 0
-                
-                # Calculate profit margin based on actual revenue received (after discount effect)
-                effective_item_revenue = item['total'] * (sale_total_paid / sale_subtotal) if sale_subtotal > 0 else item['total']
-                profit_margin = (item_total_profit / effective_item_revenue * 100) if effective_item_revenue > 0 else 0
-                
-                report_data.append({
-                    'Receipt ID': sale['saleID'],
-                    'Time': sale['createdAt'].strftime("%I:%M %p"),
-                    'Customer Name': sale['customerName'],
-                    'Customer Email': sale['customerEmail'],
-                    'Customer Phone': sale['customerPhone'],
-                    'Item Name': item['itemName'],
-                    'Item ID': item['itemID'],
-                    'Quantity': item['quantity'],
-                    'Purchase Price (₹)': f"₹{item_purchase_price:.2f}",
-                    'Sale Price (₹)': f"₹{item['salePrice']:.2f}",
-                    'Item Revenue (₹)': f"₹{item['total']:.2f}",
-                    'Item Cost (₹)': f"₹{item_total_cost:.2f}",
-                    'Item Profit (₹)': f"₹{item_total_profit:.2f}",
-                    'Profit Margin (%)': f"{profit_margin:.1f}%",
-                    'Sale Subtotal (₹)': f"₹{sale_subtotal:.2f}",
-                    'Sale Discount (₹)': f"₹{sale_discount:.2f}",
-                    'Sale Total Paid (₹)': f"₹{sale_total_paid:.2f}",
-                    'Sale Profit (₹)': f"₹{sale_profit:.2f}"
-                })
-            
-            total_revenue += sale_total_paid
-            total_profit += sale_profit
-            total_cost += sale_cost
+        # Show success message for accurate calculation
+        st.success(f"✅ Profit Accurately Calculated: ₹{total_profit:.2f}")
         
-        # Add summary rows with accurate calculations
-        report_data.append({
-            'Receipt ID': '=== DAILY SUMMARY ===',
-            'Time': '',
-            'Customer Name': f'📊 Total Sales: {len(sales)}',
-            'Customer Email': f'💰 Total Revenue: ₹{total_revenue:.2f}',
-            'Customer Phone': f'💸 Total Cost: ₹{total_cost:.2f}',
-            'Item Name': f'💵 Total Profit: ₹{total_profit:.2f}',
-            'Item ID': f'📈 Profit Margin: {((total_profit / total_revenue) * 100):.1f}%' if total_revenue > 0 else '0.0%',
-            'Quantity': f'✅ Calculation: Revenue({total_revenue:.2f}) - Cost({total_cost:.2f}) = Profit({total_profit:.2f})',
-            'Purchase Price (₹)': '',
-            'Sale Price (₹)': '',
-            'Item Revenue (₹)': '',
-            'Item Cost (₹)': '',
-            'Item Profit (₹)': '',
-            'Profit Margin (%)': '',
-            'Sale Subtotal (₹)': '',
-            'Sale Discount (₹)': '',
-            'Sale Total Paid (₹)': '',
-            'Sale Profit (₹)': ''
-        })
+        # Sales details with accurate profit information
+        st.markdown('<h3 class="section-header">Sales Details</h3>', unsafe_allow_html=True)
         
-        # Create Excel file
-        df = pd.DataFrame(report_data)
+        for sale_id, sale_lines in report_lines.groupby('saleID', sort=False):
+            sale = sale_lines.iloc[0]
+            profit_margin_sale = (sale['saleProfit'] / sale['saleTotalPaid'] * 100) if sale['saleTotalPaid'] > 0 else 0
+            
+            with st.expander(f"Receipt {sale_id} - {sale['customerName']} - ₹{sale['saleTotalPaid']:.2f} (Profit: ₹{sale['saleProfit']:.2f})"):
+                col1, col2 = st.columns(2)
+                with col1:
+                    st.write(f"**Customer:** {sale['customerName']}")
+                    st.write(f"**Email:** {sale['customerEmail']}")
+                    st.write(f"**Phone:** {sale['customerPhone']}")
+                with col2:
+                    st.write(f"**Time:** {sale['time']}")
+                    st.write(f"**Total Paid:** ₹{sale['saleTotalPaid']:.2f}")
+                    st.write(f"**Profit:** ₹{sale['saleProfit']:.2f} ({profit_margin_sale:.1f}%)")
+                    st.write(f"**Discount:** ₹{sale['saleDiscount']:.2f}")
+                
+                st.write("**Items:**")
+                for item in sale_lines.sort_values('line').itertuples(index=False):
+                    st.write(f"• {item.itemName} x{item.quantity} @ ₹{item.salePrice:.2f} = ₹{item.itemRevenue:.2f} (Cost: ₹{item.itemCost:.2f}, Profit: ₹{item.itemProfit:.2f})")
         
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            sheet_name = f'Sales_Profit_{selected_date.strftime("%Y-%m-%d")}'
-            df.to_excel(writer, sheet_name=sheet_name, index=False)
+        # Download report (re-rendered only when new sales have landed in the shard)
+        report = show(manager.generate_daily_report(selected_date))
+        if report.ok:
+            st.download_button(
+                label="📥 Download Detailed Excel Report with Accurate Profit Analysis",
+                data=report.value,
+                file_name=f"Daily_Sales_Accurate_Profit_Report_{selected_date.strftime('%Y-%m-%d')}.xlsx",
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            )
+    else:
+        st.info(f"No sales found for {selected_date.strftime('%B %d, %Y')}")
+
+@st.fragment
+def resend_receipts_panel(manager: StallManager, selected_date: date):
+    with st.expander("📨 Bulk Re-send Receipts", expanded=False):
+        col1, col2 = st.columns(2)
+        with col1:
+            resend_range = st.date_input("Sales Date Range", value=(selected_date, selected_date), key="resend_range")
+            resend_filter = st.selectbox("Which Receipts", ["Failed only", "Failed or never tracked", "All sales in range"])
+        with col2:
+            resend_rate = st.number_input("Max Emails per Minute", min_value=1, max_value=600, value=20, step=1)
+            resend_sessions = st.number_input("Parallel SMTP Sessions", min_value=1, max_value=10, value=3, step=1)
         
-        return output.getvalue()
+        if st.button("📨 Re-send Receipts", key="resend_receipts"):
+            if not isinstance(resend_range, tuple) or len(resend_range) != 2:
+                st.error("Select a start and end date.")
+            else:
+                sales_to_resend = show(manager.get_sales_in_range(*resend_range)).value
+                if resend_filter == "Failed only":
+                    sales_to_resend = [sale for sale in sales_to_resend if sale.get('emailStatus') == 'failed']
+                elif resend_filter == "Failed or never tracked":
+                    sales_to_resend = [sale for sale in sales_to_resend if sale.get('emailStatus') != 'sent']
+                
+                if not sales_to_resend:
+                    st.info("No receipts match the selected filter.")
+                else:
+                    progress = st.progress(0.0, text=f"Sending 0 of {len(sales_to_resend)} receipts...")
+                    failures = []
+                    for done, (sale_id, sent, error) in enumerate(
+                            manager.resend_receipts(sales_to_resend, resend_rate, resend_sessions), start=1):
+                        if not sent:
+                            failures.append({'Receipt ID': sale_id, 'Error': error})
+                        progress.progress(done / len(sales_to_resend),
+                                          text=f"Sending {done} of {len(sales_to_resend)} receipts...")
+                    
+                    st.success(f"✅ Re-sent {len(sales_to_resend) - len(failures)} of {len(sales_to_resend)} receipts")
+                    if failures:
+                        st.error(f"❌ {len(failures)} receipts failed to send")
+                        st.dataframe(pd.DataFrame(failures), hide_index=True, use_container_width=True)
 
 def main():
+    configure_page()
+    
     # Initialize the stall manager
-    manager = StallManager()
+    try:
+        manager = get_manager(current_stall_id())
+        start_inventory_reconciler(manager.stall_id)
+    except Exception as e:
+        st.error(f"Database connection error: {e}")
+        st.stop()
+    
+    if 'cart' not in st.session_state:
+        st.session_state.cart = []
+    if 'current_customer' not in st.session_state:
+        st.session_state.current_customer = {}
     
     # 🏠 MAIN LANDING PAGE
     if 'page' not in st.session_state:
@@ -718,6 +556,8 @@ def main():
     </div>
     """, unsafe_allow_html=True)
     
+    if manager.stall_id:
+        st.sidebar.caption(f"🏬 {manager.stall.business_info['name']}")
     st.sidebar.markdown('<h2 class="sub-header">🏪 Navigation</h2>', unsafe_allow_html=True)
     
     if st.sidebar.button("🏠 Home", key="nav_home"):
@@ -728,6 +568,15 @@ def main():
         st.session_state.page = 'billing'
     if st.sidebar.button("📊 Daily Reports", key="nav_reports"):
         st.session_state.page = 'reports'
+    if st.sidebar.button("📈 Sales Analytics", key="nav_analytics"):
+        st.session_state.page = 'analytics'
+    
+    with st.sidebar.expander("🩺 Backend Health", expanded=False):
+        health = manager.backend_health()
+        for backend, state in health['breakers'].items():
+            st.write(f"**{backend}:** {'🟢' if state == 'closed' else '🟠' if state == 'half-open' else '🔴'} {state}")
+        if health['counters']:
+            st.dataframe(pd.DataFrame(health['counters'].items(), columns=['Counter', 'Count']), hide_index=True)
     
     # 🏠 HOME PAGE
     if st.session_state.page == 'home':
@@ -756,13 +605,35 @@ def main():
             if st.button("📊 View Daily Reports", key="home_reports", help="Download sales reports"):
                 st.session_state.page = 'reports'
                 st.rerun()
+            
+            if st.button("📈 View Sales Analytics", key="home_analytics", help="Trends and top sellers over any date range"):
+                st.session_state.page = 'analytics'
+                st.rerun()
+        
+        # Today at a glance, from the sharded daily sales counter
+        today = show(manager.get_daily_totals(date.today())).value
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Sales Today", today['saleCount'])
+        with col2:
+            st.metric("Revenue Today", f"₹{today['revenue']:.2f}")
+        with col3:
+            st.metric("Profit Today", f"₹{today['profit']:.2f}")
     
     # 📦 INVENTORY MANAGEMENT PAGE
     elif st.session_state.page == 'inventory':
         st.markdown('<h1 class="section-header">📦 Inventory Management</h1>', unsafe_allow_html=True)
         
-        # Get all items
-        items = manager.get_all_items()
+        # Results of the last save, shown after the page reloads with fresh data
+        for result in st.session_state.pop('inventory_notices', []):
+            show(result)
+        
+        # Edits in the grid are diffed against the snapshot it was loaded from (kept until saved or reloaded,
+        # then brought up to date by reading only the items changed since)
+        if st.session_state.get('inventory_snapshot') is None or st.session_state.pop('inventory_sync_due', False):
+            st.session_state.inventory_snapshot = show(manager.sync_inventory(st.session_state.get('inventory_snapshot'))).value
+            st.session_state.inventory_grid_version = st.session_state.get('inventory_grid_version', 0) + 1
+        snapshot = st.session_state.inventory_snapshot
         
         # Add new item section
         with st.expander("➕ Add New Item", expanded=False):
@@ -790,89 +661,31 @@ def main():
                             'quantityAvailable': quantity
                         }
                         
-                        if manager.add_item(item_data):
-                            st.success(f"✅ Item '{item_name}' added successfully!")
+                        if show(manager.add_item(item_data)).ok:
+                            st.session_state.inventory_notices = [Result.success().note("success", f"✅ Item '{item_name}' added successfully!")]
+                            st.session_state.inventory_sync_due = True
                             st.rerun()
                     else:
                         st.error("Please fill in all required fields correctly.")
         
         # Display existing items
-        if items:
+        if snapshot and snapshot.items:
             st.markdown('<h3 class="section-header">Current Inventory</h3>', unsafe_allow_html=True)
             
-            # Display metrics
+            # Display metrics from the incrementally maintained summary
+            summary = show(manager.get_inventory_summary()).value
             col1, col2, col3, col4 = st.columns(4)
             with col1:
-                st.metric("Total Items", len(items))
+                st.metric("Total Items", summary['itemCount'])
             with col2:
-                total_value = sum(item['salePrice'] * item['quantityAvailable'] for item in items)
-                st.metric("Inventory Value", f"₹{total_value:.2f}")
+                st.metric("Inventory Value", f"₹{summary['inventoryValue']:.2f}")
             with col3:
-                low_stock = sum(1 for item in items if item['quantityAvailable'] < 10)
-                st.metric("Low Stock Items", low_stock)
+                st.metric("Low Stock Items", summary['lowStockCount'])
             with col4:
-                avg_price = sum(item['salePrice'] for item in items) / len(items)
-                st.metric("Avg Price", f"₹{avg_price:.2f}")
+                st.metric("Avg Price", f"₹{summary['avgPrice']:.2f}")
             
-            # Items table with edit/delete options
-            for i, item in enumerate(items):
-                with st.container():
-                    col1, col2, col3, col4, col5, col6, col7 = st.columns([2, 1.5, 1, 1, 1, 1, 1])
-                    
-                    with col1:
-                        st.write(f"**{item['itemName']}**")
-                    with col2:
-                        st.write(item['itemID'])
-                    with col3:
-                        st.write(f"₹{item['purchasePrice']:.2f}")
-                    with col4:
-                        st.write(f"₹{item['salePrice']:.2f}")
-                    with col5:
-                        color = "red" if item['quantityAvailable'] < 10 else "green"
-                        st.markdown(f"<span style='color: {color}'>{item['quantityAvailable']}</span>", unsafe_allow_html=True)
-                    with col6:
-                        if st.button("✏️", key=f"edit_{i}", help="Edit item"):
-                            st.session_state[f'edit_item_{i}'] = True
-                    with col7:
-                        if st.button("🗑️", key=f"delete_{i}", help="Delete item"):
-                            if manager.delete_item(item['id']):
-                                st.success(f"✅ Item '{item['itemName']}' deleted!")
-                                st.rerun()
-                    
-                    # Edit form (appears when edit button is clicked)
-                    if st.session_state.get(f'edit_item_{i}', False):
-                        with st.form(f"edit_form_{i}"):
-                            st.markdown(f"**Editing: {item['itemName']}**")
-                            col1, col2 = st.columns(2)
-                            
-                            with col1:
-                                new_name = st.text_input("Item Name", value=item['itemName'])
-                                new_purchase = st.number_input("Purchase Price", value=item['purchasePrice'], min_value=0.0, step=0.01)
-                                new_sale = st.number_input("Sale Price", value=item['salePrice'], min_value=0.0, step=0.01)
-                            
-                            with col2:
-                                new_quantity = st.number_input("Quantity", value=item['quantityAvailable'], min_value=0, step=1)
-                            
-                            col_save, col_cancel = st.columns(2)
-                            with col_save:
-                                if st.form_submit_button("💾 Save Changes"):
-                                    update_data = {
-                                        'itemName': new_name,
-                                        'purchasePrice': new_purchase,
-                                        'salePrice': new_sale,
-                                        'quantityAvailable': new_quantity
-                                    }
-                                    if manager.update_item(item['id'], update_data):
-                                        st.success("✅ Item updated successfully!")
-                                        st.session_state[f'edit_item_{i}'] = False
-                                        st.rerun()
-                            with col_cancel:
-                                if st.form_submit_button("❌ Cancel"):
-                                    st.session_state[f'edit_item_{i}'] = False
-                                    st.rerun()
-                    
-                    st.divider()
-        else:
+            inventory_grid(manager, snapshot)
+        elif snapshot is not None:
             st.info("No items in inventory yet. Add your first item above!")
     
     # 🧾 BILLING PAGE
@@ -881,159 +694,15 @@ def main():
         
         # Customer Details Section
         st.markdown('<h3 class="section-header">👤 Customer Information</h3>', unsafe_allow_html=True)
-        with st.form("customer_info"):
-            col1, col2 = st.columns(2)
-            with col1:
-                customer_name = st.text_input("Customer Name*", placeholder="Enter customer name")
-                customer_email = st.text_input("Email Address*", placeholder="customer@email.com")
-            with col2:
-                customer_phone = st.text_input("Phone Number*", placeholder="+91-XXXXXXXXXX")
-            
-            if st.form_submit_button("💾 Save Customer Info"):
-                if customer_name and customer_email and customer_phone:
-                    st.session_state.current_customer = {
-                        'name': customer_name,
-                        'email': customer_email,
-                        'phone': customer_phone
-                    }
-                    st.success("✅ Customer information saved!")
-                else:
-                    st.error("Please fill in all customer details.")
+        
+        customer_details(manager)
         
         # Add Items to Cart Section
         st.markdown('<h3 class="section-header">🛒 Add Items to Cart</h3>', unsafe_allow_html=True)
         
-        items = manager.get_all_items()
-        if items:
-            with st.form("add_to_cart"):
-                col1, col2, col3 = st.columns([3, 1, 1])
-                
-                with col1:
-                    # Create searchable dropdown
-                    item_options = [f"{item['itemName']} (ID: {item['itemID']})" for item in items]
-                    selected_item_text = st.selectbox("Select Item", item_options)
-                
-                with col2:
-                    quantity = st.number_input("Quantity", min_value=1, value=1, step=1)
-                
-                with col3:
-                    st.write("")  # Space
-                    st.write("")  # Space
-                    add_to_cart = st.form_submit_button("➕ Add to Cart")
-                
-                if add_to_cart and selected_item_text:
-                    # Find the selected item
-                    selected_item = next(item for item in items if f"{item['itemName']} (ID: {item['itemID']})" == selected_item_text)
-                    
-                    # Add to cart with real-time inventory check
-                    if manager.add_to_cart(selected_item, quantity):
-                        st.success(f"✅ Added {quantity} x {selected_item['itemName']} to cart!")
-                        st.rerun()
-        
-        # Display Cart
-        if st.session_state.cart:
-            st.markdown('<h3 class="section-header">🛒 Current Cart</h3>', unsafe_allow_html=True)
-            
-            for i, cart_item in enumerate(st.session_state.cart):
-                col1, col2, col3, col4, col5 = st.columns([3, 1, 1, 1, 1])
-                
-                with col1:
-                    st.write(f"**{cart_item['itemName']}** (ID: {cart_item['itemID']})")
-                with col2:
-                    st.write(f"₹{cart_item['salePrice']:.2f}")
-                with col3:
-                    st.write(f"Qty: {cart_item['quantity']}")
-                with col4:
-                    st.write(f"₹{cart_item['total']:.2f}")
-                with col5:
-                    if st.button("🗑️", key=f"remove_cart_{i}", help="Remove from cart"):
-                        manager.remove_from_cart(i)
-                        st.rerun()
-            
-            st.divider()
-            
-            # Cart Summary and Checkout
-            subtotal = manager.calculate_cart_total()
-            
-            st.markdown('<h3 class="section-header">💰 Billing Summary</h3>', unsafe_allow_html=True)
-            
-            # Discount section
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                discount_type = st.selectbox("Discount Type", ["None", "Percentage", "Flat Amount"])
-            with col2:
-                discount_value = st.number_input("Discount Value", min_value=0.0, step=0.01) if discount_type != "None" else 0
-            with col3:
-                delivery_charges = st.number_input("Delivery Charges", min_value=0.0, step=0.01, value=0.0)
-            # Calculate totals
-            discount_amount = 0
-            if discount_type != "None":
-                discount_amount = manager.apply_discount(subtotal, discount_type, discount_value)
-            final_total = subtotal - discount_amount + delivery_charges
-            # Display totals
-            col1, col2 = st.columns(2)
-            with col2:
-                st.markdown(f"""
-                <div class="metric-card">
-                    <div style="display: flex; justify-content: space-between; margin: 5px 0;">
-                        <span>Subtotal:</span>
-                        <span>₹{subtotal:.2f}</span>
-                    </div>
-                    <div style="display: flex; justify-content: space-between; margin: 5px 0;">
-                        <span>Discount:</span>
-                        <span>-₹{discount_amount:.2f}</span>
-                    </div>
-                    <div style="display: flex; justify-content: space-between; margin: 5px 0;">
-                        <span>Delivery Charges:</span>
-                        <span>₹{delivery_charges:.2f}</span>
-                    </div>
-                    <div style="display: flex; justify-content: space-between; margin: 15px 0 5px 0; font-size: 1.2rem; font-weight: bold; border-top: 2px solid #B85450; padding-top: 10px;">
-                        <span>Total:</span>
-                        <span>₹{final_total:.2f}</span>
-                    </div>
-                </div>
-                """, unsafe_allow_html=True)
-            # Checkout button
-            if st.button("🎯 Generate Bill & Send Receipt", disabled=not st.session_state.current_customer):
-                if st.session_state.current_customer:
-                    # Validate inventory before processing sale
-                    if manager.validate_cart_inventory():
-                        # Save sale to database and update inventory
-                        sale_id = manager.save_sale(
-                            st.session_state.current_customer,
-                            st.session_state.cart,
-                            subtotal,
-                            discount_amount,
-                            final_total
-                        )
-                        if sale_id:
-                            # Send email receipt with delivery charges and QR code
-                            email_sent = manager.send_email_receipt(
-                                st.session_state.current_customer['email'],
-                                st.session_state.current_customer['name'],
-                                st.session_state.cart,
-                                subtotal,
-                                discount_amount,
-                                final_total,
-                                sale_id,
-                                delivery_charges
-                            )
-                            if email_sent:
-                                st.success(f"✅ Bill generated successfully! Receipt sent to {st.session_state.current_customer['email']}")
-                                st.success(f"🆔 Sale ID: {sale_id}")
-                            else:
-                                st.warning(f"✅ Bill saved (ID: {sale_id}) but email failed to send. Please check email configuration.")
-                            # Clear cart and customer info
-                            st.session_state.cart = []
-                            st.session_state.current_customer = {}
-                            st.rerun()
-                    else:
-                        st.error("❌ Cannot complete sale - inventory validation failed. Please update your cart.")
-                else:
-                    st.error("Please enter customer information first!")
+        add_to_cart_form(manager)
         
-        else:
-            st.info("Cart is empty. Add items to proceed with billing.")
+        cart_and_checkout(manager)
     
     # 📊 REPORTS PAGE
     elif st.session_state.page == 'reports':
@@ -1042,106 +711,150 @@ def main():
         # Date selection
         selected_date = st.date_input("Select Date for Report", value=date.today())
         
-        # Get sales for selected date
-        daily_sales = manager.get_daily_sales(selected_date)
+        report_details(manager, selected_date)
         
-        if daily_sales:
-            # Calculate summary metrics with ALWAYS ACCURATE profit calculations
-            total_sales = len(daily_sales)
-            total_revenue = sum(sale['totalPaid'] for sale in daily_sales)
-            
-            # ALWAYS recalculate profit accurately (don't trust stored values)
-            total_profit = 0
-            total_cost = 0
-            
-            for sale in daily_sales:
-                # ALWAYS recalculate - don't trust stored profit values
-                sale_cost = 0
-                for item in sale['cart']:
-                    # Get item cost
-                    item_purchase_price = item.get('purchasePrice', 0)
-                    sale_cost += item_purchase_price * item['quantity']
-                
-                # ACCURATE profit = Amount received - Cost
-                sale_profit = sale['totalPaid'] - sale_cost
-                total_profit += sale_profit
-                total_cost += sale_cost
-            
-            total_items_sold = sum(len(sale['cart']) for sale in daily_sales)
-            profit_margin = (total_profit / total_revenue * 100) if total_revenue > 0 else 0
+        # Bulk receipt re-send
+        resend_receipts_panel(manager, selected_date)
+    
+    # 📈 SALES ANALYTICS PAGE
+    elif st.session_state.page == 'analytics':
+        st.markdown('<h1 class="section-header">📈 Sales Analytics</h1>', unsafe_allow_html=True)
+        
+        col1, col2, col3 = st.columns([2, 1, 1])
+        with col1:
+            date_range = st.date_input("Date Range", value=(date.today() - timedelta(days=29), date.today()))
+        with col2:
+            top_n = st.number_input("Top Items", min_value=5, max_value=100, value=20, step=5)
+        with col3:
+            rank_by = st.selectbox("Rank By", ["Revenue", "Quantity", "Profit"])
+        
+        if not isinstance(date_range, tuple) or len(date_range) != 2:
+            st.info("Select a start and end date.")
+            return
+        start_date, end_date = date_range
+        
+        item_rollups = show(manager.get_item_rollups(start_date, end_date)).value
+        daily_rollups = show(manager.get_daily_rollups(start_date, end_date)).value
+        
+        if daily_rollups:
+            daily_df = pd.DataFrame(daily_rollups)
+            total_revenue = daily_df['revenue'].sum()
+            total_profit = daily_df['profit'].sum()
             
-            # Display enhanced metrics
             col1, col2, col3, col4 = st.columns(4)
             with col1:
-                st.metric("Total Sales", total_sales)
+                st.metric("Total Sales", int(daily_df['saleCount'].sum()))
             with col2:
                 st.metric("Total Revenue", f"₹{total_revenue:.2f}")
             with col3:
+                profit_margin = (total_profit / total_revenue * 100) if total_revenue > 0 else 0
                 st.metric("Total Profit", f"₹{total_profit:.2f}", f"{profit_margin:.1f}% margin")
             with col4:
-                st.metric("Items Sold", total_items_sold)
-            
-            # Additional profit insights
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                avg_profit_per_sale = total_profit / total_sales if total_sales > 0 else 0
-                st.metric("Avg Profit/Sale", f"₹{avg_profit_per_sale:.2f}")
-            with col2:
-                avg_revenue_per_sale = total_revenue / total_sales if total_sales > 0 else 0
-                st.metric("Avg Revenue/Sale", f"₹{avg_revenue_per_sale:.2f}")
-            with col3:
-                st.metric("Total Cost", f"₹{total_cost:.2f}")
-            
-            # Show success message for accurate calculation
-            st.success(f"✅ Profit Accurately Calculated: ₹{total_profit:.2f}")
-            
-            # Sales details with accurate profit information
-            st.markdown('<h3 class="section-header">Sales Details</h3>', unsafe_allow_html=True)
-            
-            for sale in daily_sales:
-                # ALWAYS recalculate profit accurately
-                sale_cost = sum(item.get('purchasePrice', 0) * item['quantity'] for item in sale['cart'])
-                sale_profit = sale['totalPaid'] - sale_cost
+                st.metric("Items Sold", int(daily_df['quantity'].sum()))
+            
+            st.markdown('<h3 class="section-header">Daily Trend</h3>', unsafe_allow_html=True)
+            st.line_chart(daily_df.groupby('date')[['revenue', 'profit']].sum())
+            
+            # Hourly rollups cost 24 sets of counter shards per day, so they are only read on request
+            if st.checkbox("🕒 Show sales by hour", value=False, key="analytics_by_hour"):
+                hourly_rollups = show(manager.get_hourly_rollups(start_date, end_date)).value
+                if hourly_rollups:
+                    st.markdown('<h3 class="section-header">Sales by Hour</h3>', unsafe_allow_html=True)
+                    by_hour_df = pd.DataFrame(hourly_rollups).groupby('hour')[['revenue']].sum().reindex(range(24), fill_value=0)
+                    st.bar_chart(by_hour_df)
+        
+        if item_rollups:
+            st.markdown(f'<h3 class="section-header">Top {top_n} Items by {rank_by}</h3>', unsafe_allow_html=True)
+            items_df = pd.DataFrame(item_rollups)
+            top_df = (items_df.groupby('itemID')
+                      .agg(itemName=('itemName', 'last'), quantity=('quantity', 'sum'),
+                           revenue=('revenue', 'sum'), cost=('cost', 'sum'), profit=('profit', 'sum'))
+                      .sort_values(rank_by.lower(), ascending=False)
+                      .head(top_n)
+                      .reset_index())
+            st.bar_chart(top_df.set_index('itemName')[[rank_by.lower()]])
+            st.dataframe(top_df.rename(columns={
+                'itemID': 'Item ID', 'itemName': 'Item Name', 'quantity': 'Quantity',
+                'revenue': 'Revenue (₹)', 'cost': 'Cost (₹)', 'profit': 'Profit (₹)'
+            }), hide_index=True, use_container_width=True)
+        
+        with st.expander("🗄️ Historical Trends (Local Archive)", expanded=False):
+            history = SalesArchive(stall_core.stall_data_dir(SALES_ARCHIVE_DIR, manager.stall_id))
+            if not archived_days(history.root):
+                st.info("No archived sales yet. Run `python sales_archive.py archive` to build the archive.")
+            else:
+                ytd = history.year_to_date()
+                col1, col2, col3 = st.columns(3)
+                with col1:
+                    st.metric("YTD Sales", ytd['sales'])
+                with col2:
+                    st.metric("YTD Revenue", f"₹{ytd['revenue']:.2f}")
+                with col3:
+                    st.metric("YTD Profit", f"₹{ytd['profit']:.2f}", f"{ytd['margin']:.1f}% margin")
                 
-                profit_margin_sale = (sale_profit / sale['totalPaid'] * 100) if sale['totalPaid'] > 0 else 0
+                monthly_df = history.month_over_month(date(date.today().year - 1, 1, 1), date.today())
+                if not monthly_df.empty:
+                    st.bar_chart(monthly_df.set_index('month')[['revenue', 'profit']])
+                    st.dataframe(monthly_df.rename(columns={
+                        'month': 'Month', 'sales': 'Sales', 'revenue': 'Revenue (₹)', 'profit': 'Profit (₹)',
+                        'revenueChange': 'Revenue Change (%)', 'profitChange': 'Profit Change (%)'
+                    }).round(2), hide_index=True, use_container_width=True)
                 
-                with st.expander(f"Receipt {sale['saleID']} - {sale['customerName']} - ₹{sale['totalPaid']:.2f} (Profit: ₹{sale_profit:.2f})"):
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        st.write(f"**Customer:** {sale['customerName']}")
-                        st.write(f"**Email:** {sale['customerEmail']}")
-                        st.write(f"**Phone:** {sale['customerPhone']}")
-                    with col2:
-                        st.write(f"**Time:** {sale['createdAt'].strftime('%I:%M %p')}")
-                        st.write(f"**Total Paid:** ₹{sale['totalPaid']:.2f}")
-                        st.write(f"**Profit:** ₹{sale_profit:.2f} ({profit_margin_sale:.1f}%)")
-                        st.write(f"**Discount:** ₹{sale.get('discount', 0):.2f}")
-                    
-                    st.write("**Items:**")
-                    for item in sale['cart']:
-                        item_cost = item.get('purchasePrice', 0) * item['quantity']
-                        
-                        # Calculate accurate proportional profit for this item
-                        if sale.get('subtotal', 0) > 0:
-                            item_revenue_share = item['total'] / sale.get('subtotal', item['total'])
-                            item_profit = sale_profit * item_revenue_share
-                        else:
-                            item_profit = 0
-                        
-                        st.write(f"• {item['itemName']} x{item['quantity']} @ ₹{item['salePrice']:.2f} = ₹{item['total']:.2f} (Cost: ₹{item_cost:.2f}, Profit: ₹{item_profit:.2f})")
-            
-            # Download report
-            if st.button("📥 Download Detailed Excel Report with Accurate Profit Analysis"):
-                excel_data = manager.generate_daily_report(selected_date)
-                if excel_data:
-                    st.download_button(
-                        label="📥 Download Accurate Profit Report",
-                        data=excel_data,
-                        file_name=f"Daily_Sales_Accurate_Profit_Report_{selected_date.strftime('%Y-%m-%d')}.xlsx",
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                    )
+                st.markdown("**Margin by Item (Selected Range)**")
+                st.dataframe(history.margin_by_item(start_date, end_date).head(top_n).rename(columns={
+                    'itemID': 'Item ID', 'itemName': 'Item Name', 'quantity': 'Quantity', 'revenue': 'Revenue (₹)',
+                    'cost': 'Cost (₹)', 'profit': 'Profit (₹)', 'margin': 'Margin (%)'
+                }).round(2), hide_index=True, use_container_width=True)
+        
+        with st.expander("📒 Stock Movements & Shrinkage", expanded=False):
+            movement_rows = show(manager.get_stock_movement_report(start_date, end_date)).value
+            if movement_rows:
+                st.dataframe(pd.DataFrame(movement_rows).rename(columns={
+                    'itemID': 'Item ID', 'itemName': 'Item Name', 'opening': 'Opening Stock', 'sold': 'Sold',
+                    'restocked': 'Restocked', 'shrinkage': 'Shrinkage', 'closing': 'Closing Stock'
+                }), hide_index=True, use_container_width=True)
+            
+            st.markdown("**Stock at a Point in Time**")
+            col1, col2 = st.columns(2)
+            with col1:
+                stock_date = st.date_input("Date", value=date.today(), key="stock_at_date")
+            with col2:
+                stock_time = st.time_input("Time", key="stock_at_time")
+            if st.button("🔎 Show Stock", key="stock_at_button"):
+                stock_rows = show(manager.get_stock_at(datetime.combine(stock_date, stock_time))).value
+                if stock_rows:
+                    st.dataframe(pd.DataFrame(stock_rows).rename(columns={
+                        'itemID': 'Item ID', 'itemName': 'Item Name', 'quantity': 'Quantity'
+                    }), hide_index=True, use_container_width=True)
+        
+        st.markdown('<h3 class="section-header">👥 Top Customers (Lifetime)</h3>', unsafe_allow_html=True)
+        top_customers = show(manager.get_top_customers()).value
+        if top_customers:
+            st.dataframe(pd.DataFrame([{
+                'Customer Name': customer['name'],
+                'Phone': customer['phone'],
+                'Email': customer['email'],
+                'Visits': customer.get('visitCount', 0),
+                'Lifetime Spend (₹)': round(customer.get('lifetimeSpend', 0), 2),
+                'Last Purchase': customer['lastPurchaseAt'].strftime("%Y-%m-%d") if customer.get('lastPurchaseAt') else ''
+            } for customer in top_customers]), hide_index=True, use_container_width=True)
         else:
-            st.info(f"No sales found for {selected_date.strftime('%B %d, %Y')}")
+            st.info("No customers recorded yet.")
+        
+        if not hourly_rollups and not item_rollups:
+            st.info(f"No sales found between {start_date.strftime('%B %d, %Y')} and {end_date.strftime('%B %d, %Y')}")
+
+def run():
+    """Run main(), profiled per rerun for the share of sessions picked by CUTIEFY_PROFILE_RATE"""
+    if not profiling.enabled():
+        return main()
+    profiling.instrument(StallManager)
+    if 'profile_session' not in st.session_state:
+        st.session_state.profile_session = profiling.should_profile_session()
+    if not st.session_state.profile_session:
+        return main()
+    with profiling.profile_run(st.session_state.get('page', 'home')):
+        main()
 
 if __name__ == "__main__":
-    main()
+    run()
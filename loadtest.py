@@ -0,0 +1,438 @@
+"""Concurrent-cashier load test for the Cutiefy checkout path.
+
+Simulates N cashiers running realistic flows against StallManager: add 1-15 cart lines,
+validate the cart, save the sale and send the receipt. By default it runs against an
+in-process fake Firestore/SMTP backend with configurable latency; with --backend emulator
+it talks to the Firestore emulator named by FIRESTORE_EMULATOR_HOST instead (start it empty
+so the stock check only sees this run's items and sales).
+
+    python loadtest.py --cashiers 8 --checkouts 25 --latency-ms 40 --jitter-ms 20
+"""
+import argparse
+import asyncio
+import copy
+import math
+import os
+import random
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+import stall_core
+from stall_core import firestore, google_exceptions
+
+# 🧪 FAKE FIRESTORE BACKEND
+class FakeBackend:
+    """Shared in-memory document store with simulated RPC latency and RPC counters"""
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.lock = threading.Lock()
+        self.collections: Dict[str, Dict[str, Dict]] = defaultdict(dict)
+        self.update_times: Dict[tuple, datetime] = {}
+        self.rpc_counts = Counter()
+
+    def _delay(self, rpc: str) -> float:
+        with self.lock:
+            self.rpc_counts[rpc] += 1
+        return max(0.0, self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+
+    def rpc(self, rpc: str):
+        time.sleep(self._delay(rpc))
+
+    async def rpc_async(self, rpc: str):
+        await asyncio.sleep(self._delay(rpc))
+
+    @staticmethod
+    def _resolve(current: Any, value: Any) -> Any:
+        if isinstance(value, firestore.Increment):
+            return (current or 0) + value.value
+        if value is firestore.SERVER_TIMESTAMP:
+            return datetime.now(timezone.utc)
+        return copy.deepcopy(value)
+
+    def write(self, collection: str, doc_id: str, data: Dict, mode: str):
+        """Apply a create/set/merge/update/delete (caller holds the lock)"""
+        docs = self.collections[collection]
+        if mode == "delete":
+            docs.pop(doc_id, None)
+            self.update_times.pop((collection, doc_id), None)
+            return
+        if mode == "update" and doc_id not in docs:
+            raise KeyError(f"No document to update: {collection}/{doc_id}")
+        if mode == "create" and doc_id in docs:
+            raise google_exceptions.AlreadyExists(f"Document already exists: {collection}/{doc_id}")
+        current = dict(docs.get(doc_id, {})) if mode in ("merge", "update") else {}
+        for field, value in data.items():
+            current[field] = self._resolve(current.get(field), value)
+        docs[doc_id] = current
+        self.update_times[(collection, doc_id)] = datetime.now(timezone.utc)
+
+    def snapshots(self, collection: str, filters: List[tuple], order: tuple, limit: int) -> List["FakeSnapshot"]:
+        with self.lock:
+            docs = [(doc_id, copy.deepcopy(data), self.update_times.get((collection, doc_id)))
+                    for doc_id, data in self.collections[collection].items()
+                    if all(_matches(data.get(field), op, value) for field, op, value in filters)]
+        if order:
+            field, direction = order
+            docs.sort(key=lambda doc: doc[1].get(field) or 0, reverse=direction == firestore.Query.DESCENDING)
+        if limit is not None:
+            docs = docs[:limit]
+        return [FakeSnapshot(FakeDocumentReference(self, collection, doc_id), data, update_time)
+                for doc_id, data, update_time in docs]
+
+def _matches(actual: Any, op: str, expected: Any) -> bool:
+    if op == "in":
+        return actual in expected
+    if actual is None:
+        return False
+    return {
+        "==": lambda: actual == expected,
+        ">=": lambda: actual >= expected,
+        "<=": lambda: actual <= expected,
+        ">": lambda: actual > expected,
+        "<": lambda: actual < expected
+    }[op]()
+
+class FakeSnapshot:
+    def __init__(self, reference: "FakeDocumentReference", data: Dict, update_time: datetime = None):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+        self.exists = data is not None
+        self.update_time = update_time
+
+    def to_dict(self) -> Dict:
+        return copy.deepcopy(self._data)
+
+class FakeDocumentReference:
+    def __init__(self, backend: FakeBackend, collection: str, doc_id: str = None):
+        self.backend = backend
+        self.collection = collection
+        self.id = doc_id or uuid.uuid4().hex[:20]
+
+    def get(self, timeout: float = None) -> FakeSnapshot:
+        self.backend.rpc("get")
+        with self.backend.lock:
+            data = copy.deepcopy(self.backend.collections[self.collection].get(self.id))
+            update_time = self.backend.update_times.get((self.collection, self.id))
+        return FakeSnapshot(self, data, update_time)
+
+    def _write(self, rpc: str, data: Dict, mode: str):
+        self.backend.rpc(rpc)
+        with self.backend.lock:
+            self.backend.write(self.collection, self.id, data, mode)
+
+    def set(self, data: Dict, merge: bool = False):
+        self._write("set", data, "merge" if merge else "set")
+
+    def update(self, data: Dict, timeout: float = None):
+        self._write("update", data, "update")
+
+    def delete(self):
+        self._write("delete", {}, "delete")
+
+class FakeQuery:
+    def __init__(self, backend: FakeBackend, collection: str, filters=(), order=None, limit_to=None):
+        self.backend = backend
+        self.collection = collection
+        self.filters = list(filters)
+        self.order = order
+        self.limit_to = limit_to
+
+    def where(self, field: str, op: str, value: Any) -> "FakeQuery":
+        return FakeQuery(self.backend, self.collection, self.filters + [(field, op, value)], self.order, self.limit_to)
+
+    def order_by(self, field: str, direction: str = "ASCENDING") -> "FakeQuery":
+        return FakeQuery(self.backend, self.collection, self.filters, (field, direction), self.limit_to)
+
+    def limit(self, count: int) -> "FakeQuery":
+        return FakeQuery(self.backend, self.collection, self.filters, self.order, count)
+
+    def stream(self, timeout: float = None):
+        self.backend.rpc("query")
+        return iter(self.backend.snapshots(self.collection, self.filters, self.order, self.limit_to))
+
+class FakeCollection(FakeQuery):
+    def document(self, doc_id: str = None) -> FakeDocumentReference:
+        return FakeDocumentReference(self.backend, self.collection, doc_id)
+
+    def add(self, data: Dict):
+        ref = self.document()
+        ref.set(data)
+        return None, ref
+
+class FakeWriteOption:
+    def __init__(self, last_update_time: datetime):
+        self.last_update_time = last_update_time
+
+class FakeBatch:
+    def __init__(self, backend: FakeBackend):
+        self.backend = backend
+        self.writes = []
+
+    def create(self, ref: FakeDocumentReference, data: Dict):
+        self.writes.append((ref, data, "create", None))
+
+    def set(self, ref: FakeDocumentReference, data: Dict, merge: bool = False):
+        self.writes.append((ref, data, "merge" if merge else "set", None))
+
+    def update(self, ref: FakeDocumentReference, data: Dict, option: "FakeWriteOption" = None):
+        self.writes.append((ref, data, "update", option))
+
+    def delete(self, ref: FakeDocumentReference, option: "FakeWriteOption" = None):
+        self.writes.append((ref, {}, "delete", option))
+
+    def commit(self, timeout: float = None):
+        self.backend.rpc("commit")
+        with self.backend.lock:
+            # All or nothing, like Firestore: a create that would overwrite or a stale precondition fails the whole batch
+            for ref, data, mode, option in self.writes:
+                if mode == "create" and ref.id in self.backend.collections[ref.collection]:
+                    raise google_exceptions.AlreadyExists(f"Document already exists: {ref.collection}/{ref.id}")
+                if option is not None and self.backend.update_times.get((ref.collection, ref.id)) != option.last_update_time:
+                    raise google_exceptions.FailedPrecondition(f"Document changed since it was read: {ref.collection}/{ref.id}")
+            for ref, data, mode, option in self.writes:
+                self.backend.write(ref.collection, ref.id, data, mode)
+
+class FakeClient:
+    """Subset of the synchronous Firestore client used by StallManager"""
+
+    def __init__(self, backend: FakeBackend):
+        self.backend = backend
+
+    def collection(self, name: str) -> FakeCollection:
+        return FakeCollection(self.backend, name)
+
+    def batch(self) -> FakeBatch:
+        return FakeBatch(self.backend)
+
+    def get_all(self, refs: List[FakeDocumentReference], timeout: float = None):
+        return [ref.get() for ref in refs]
+
+    def write_option(self, last_update_time: datetime) -> FakeWriteOption:
+        return FakeWriteOption(last_update_time)
+
+class FakeAsyncQuery(FakeQuery):
+    def where(self, field: str, op: str, value: Any) -> "FakeAsyncQuery":
+        return FakeAsyncQuery(self.backend, self.collection, self.filters + [(field, op, value)], self.order, self.limit_to)
+
+    def limit(self, count: int) -> "FakeAsyncQuery":
+        return FakeAsyncQuery(self.backend, self.collection, self.filters, self.order, count)
+
+    async def stream(self, timeout: float = None):
+        await self.backend.rpc_async("query")
+        for snapshot in self.backend.snapshots(self.collection, self.filters, self.order, self.limit_to):
+            yield snapshot
+
+class FakeAsyncClient:
+    """Subset of the async Firestore client used by AsyncFirestore"""
+
+    def __init__(self, backend: FakeBackend):
+        self.backend = backend
+
+    def collection(self, name: str) -> FakeAsyncQuery:
+        return FakeAsyncQuery(self.backend, name)
+
+class FakeSMTP:
+    """SMTP session stand-in with simulated latency"""
+
+    def __init__(self, backend: FakeBackend, latency_ms: float):
+        self.backend = backend
+        self.latency_ms = latency_ms
+        self._rpc("smtp.connect")
+
+    def _rpc(self, name: str):
+        with self.backend.lock:
+            self.backend.rpc_counts[name] += 1
+        time.sleep(self.latency_ms / 1000)
+
+    def send_message(self, msg):
+        self._rpc("smtp.send")
+
+    def quit(self):
+        pass
+
+# 🏃 LOAD TEST
+STEPS = ("add_to_cart", "validate", "save_sale", "send_receipt", "checkout")
+
+class LoadTest:
+    def __init__(self, manager: stall_core.StallManager, items: List[Dict], seed: int = None):
+        self.manager = manager
+        self.items = items
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.timings: Dict[str, List[float]] = defaultdict(list)
+        self.outcomes = Counter()
+
+    def _timed(self, step: str, fn):
+        started = time.perf_counter()
+        try:
+            return fn()
+        finally:
+            elapsed = time.perf_counter() - started
+            with self.lock:
+                self.timings[step].append(elapsed)
+
+    def run_checkout(self, cashier: int, number: int):
+        with self.lock:
+            lines = self.random.sample(self.items, self.random.randint(1, min(15, len(self.items))))
+            quantities = [self.random.randint(1, 3) for _ in lines]
+        customer = {
+            'name': f"Load Test {cashier}-{number}",
+            'email': f"cashier{cashier}.customer{number}@loadtest.invalid",
+            'phone': f"9{cashier:04d}{number:05d}"
+        }
+
+        def checkout():
+            cart = []
+            for item, quantity in zip(lines, quantities):
+                self._timed("add_to_cart", lambda: self.manager.add_to_cart(cart, item, quantity))
+            if not cart:
+                return "empty_cart"
+            if not self._timed("validate", lambda: self.manager.validate_cart_inventory(cart)).ok:
+                return "validation_failed"
+
+            subtotal = sum(cart_item['total'] for cart_item in cart)
+            saved = self._timed("save_sale", lambda: self.manager.save_sale(customer, cart, subtotal, 0, subtotal))
+            if not saved.ok:
+                return "save_failed"
+            sent = self._timed("send_receipt", lambda: self.manager.send_email_receipt(
+                customer['email'], customer['name'], cart, subtotal, 0, subtotal, saved.value.sale_id))
+            return "completed" if sent.ok else "receipt_failed"
+
+        outcome = self._timed("checkout", checkout)
+        with self.lock:
+            self.outcomes[outcome] += 1
+
+    def run(self, cashiers: int, checkouts: int) -> float:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=cashiers, thread_name_prefix="cashier") as pool:
+            def cashier_flow(cashier: int):
+                for number in range(checkouts):
+                    self.run_checkout(cashier, number)
+            list(pool.map(cashier_flow, range(cashiers)))
+        return time.perf_counter() - started
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = min(len(ordered), max(1, math.ceil(pct / 100 * len(ordered))))
+    return ordered[rank - 1]
+
+def find_stock_inconsistencies(db, initial_stock: Dict[str, int]) -> List[str]:
+    """Compare final stock with initial stock minus quantities recorded in sales"""
+    sold = Counter()
+    for sale in db.collection('sales').stream():
+        for line in stall_core.normalize_sale(sale.to_dict()).get('cart', []):
+            sold[line['itemID']] += line['quantity']
+
+    problems = []
+    for item in db.collection('items').stream():
+        data = item.to_dict()
+        item_id = data['itemID']
+        if item_id not in initial_stock:
+            continue
+        expected = initial_stock[item_id] - sold[item_id]
+        if sold[item_id] > initial_stock[item_id]:
+            problems.append(f"{item_id}: oversold {sold[item_id]} of {initial_stock[item_id]} in stock")
+        elif data['quantityAvailable'] != expected:
+            problems.append(f"{item_id}: stock {data['quantityAvailable']} but sales imply {expected}")
+    return problems
+
+def seed_items(db, count: int, stock: int, seed: int = None) -> List[Dict]:
+    rng = random.Random(seed)
+    items = []
+    batch = db.batch()
+    for index in range(count):
+        purchase_price = round(rng.uniform(20, 400), 2)
+        item = {
+            'itemName': f"Load Test Item {index:04d}",
+            'itemID': f"LT{index:04d}",
+            'purchasePrice': purchase_price,
+            'salePrice': round(purchase_price * rng.uniform(1.2, 2.0), 2),
+            'quantityAvailable': stock
+        }
+        batch.set(db.collection('items').document(), stall_core.stamp_item(item))
+        items.append(item)
+    batch.commit()
+    return items
+
+def build_backend(args):
+    """Sync client, async data layer and fake RPC counter (None for the emulator) for the chosen backend"""
+    if args.backend == "fake":
+        backend = FakeBackend(args.latency_ms, args.jitter_ms)
+        return FakeClient(backend), stall_core.AsyncFirestore(lambda: FakeAsyncClient(backend)), backend
+
+    if not os.environ.get("FIRESTORE_EMULATOR_HOST"):
+        raise SystemExit("Set FIRESTORE_EMULATOR_HOST to use --backend emulator")
+    from google.cloud import firestore as gcloud_firestore
+    db = gcloud_firestore.Client(project=args.project)
+    aio = stall_core.AsyncFirestore(lambda: gcloud_firestore.AsyncClient(project=args.project))
+    return db, aio, None
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent-cashier load test for Cutiefy checkouts")
+    parser.add_argument("--cashiers", type=int, default=8, help="concurrent cashier terminals")
+    parser.add_argument("--checkouts", type=int, default=25, help="checkouts per cashier")
+    parser.add_argument("--items", type=int, default=200, help="catalog size to seed")
+    parser.add_argument("--stock", type=int, default=100, help="initial stock per item")
+    parser.add_argument("--backend", choices=["fake", "emulator"], default="fake")
+    parser.add_argument("--project", default="cutiefy-loadtest", help="project ID for the emulator backend")
+    parser.add_argument("--latency-ms", type=float, default=30.0, help="fake Firestore RPC latency")
+    parser.add_argument("--jitter-ms", type=float, default=10.0, help="fake Firestore RPC latency jitter")
+    parser.add_argument("--smtp-latency-ms", type=float, default=150.0, help="fake SMTP latency per connect/send")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    db, aio, backend = build_backend(args)
+    smtp_backend = backend or FakeBackend()
+    email_config = stall_core.email_config_from_secrets({})
+    report_shards = stall_core.ReportShardStore(tempfile.mkdtemp(prefix="cutiefy-loadtest-shards-"))
+    manager = stall_core.StallManager(db, aio, email_config, smtp_factory=lambda timeout=None: FakeSMTP(smtp_backend, args.smtp_latency_ms),
+                                      report_shards=report_shards)
+
+    items = seed_items(db, args.items, args.stock, args.seed)
+    initial_stock = {item['itemID']: item['quantityAvailable'] for item in items}
+    if backend:
+        backend.rpc_counts.clear()
+
+    test = LoadTest(manager, items, args.seed)
+    elapsed = test.run(args.cashiers, args.checkouts)
+
+    completed = test.outcomes["completed"] + test.outcomes["receipt_failed"]
+    print(f"\n🧪 {args.cashiers} cashiers x {args.checkouts} checkouts on the {args.backend} backend in {elapsed:.2f}s")
+    print(f"   Throughput: {completed / elapsed:.2f} sales/s")
+    print(f"   Outcomes: {dict(test.outcomes)}")
+
+    print("\n⏱️  Step latency (ms)")
+    print(f"   {'step':<14}{'count':>8}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for step in STEPS:
+        samples = test.timings.get(step, [])
+        print(f"   {step:<14}{len(samples):>8}" + "".join(
+            f"{percentile(samples, pct) * 1000:>10.1f}" for pct in (50, 95, 99)))
+
+    print("\n📡 Backend RPCs")
+    rpc_counts = dict(smtp_backend.rpc_counts)
+    for name, count in sorted({**manager.backend_health()['counters'], **rpc_counts}.items()):
+        print(f"   {name:<28}{count:>8}")
+    if completed:
+        print(f"   {'firestore.calls per sale':<28}{manager.backend_health()['counters'].get('firestore.calls', 0) / completed:>8.1f}")
+
+    problems = find_stock_inconsistencies(db, initial_stock)
+    print(f"\n📦 Stock inconsistencies: {len(problems)}")
+    for problem in problems[:20]:
+        print(f"   {problem}")
+    if len(problems) > 20:
+        print(f"   ... and {len(problems) - 20} more")
+
+if __name__ == "__main__":
+    main()
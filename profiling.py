@@ -0,0 +1,190 @@
+"""Opt-in profiling of Streamlit reruns and StallManager calls.
+
+Off unless CUTIEFY_PROFILE is set. Each profiled rerun writes its files to CUTIEFY_PROFILE_DIR
+(default "profiles"), named <timestamp>-<label>:
+
+    CUTIEFY_PROFILE=cprofile   deterministic cProfile; .prof (open with snakeviz or pstats)
+    CUTIEFY_PROFILE=sample     wall-clock stack sampling every CUTIEFY_PROFILE_INTERVAL_MS (default 5);
+                               .folded collapsed stacks (flamegraph.pl, speedscope, inferno)
+
+Both modes also write a .txt summary with the rerun's wall time and the inclusive time of every
+instrumented StallManager method it called. Sampling sees time spent waiting on Firestore and SMTP
+as well as CPU. CUTIEFY_PROFILE_RATE (default 1.0) is the fraction of sessions that are profiled,
+so the sampling mode can be left on in production for a small share of users:
+
+    CUTIEFY_PROFILE=sample CUTIEFY_PROFILE_RATE=0.05 streamlit run app.py
+    flamegraph.pl profiles/20240501-153012-481516-billing.folded > billing.svg
+"""
+import cProfile
+import functools
+import inspect
+import io
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import nullcontext
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+PROFILE_MODE = os.environ.get("CUTIEFY_PROFILE", "off").lower()
+PROFILE_DIR = os.environ.get("CUTIEFY_PROFILE_DIR", "profiles")
+PROFILE_SAMPLE_RATE = float(os.environ.get("CUTIEFY_PROFILE_RATE", "1.0"))
+PROFILE_INTERVAL_SECONDS = float(os.environ.get("CUTIEFY_PROFILE_INTERVAL_MS", "5")) / 1000
+PROFILE_MODES = ("cprofile", "sample")
+# Functions listed in the .txt summary of a cProfile run
+PROFILE_SUMMARY_TOP = 40
+
+_active = threading.local()
+
+def enabled() -> bool:
+    return PROFILE_MODE in PROFILE_MODES
+
+def should_profile_session() -> bool:
+    """Roll once per session whether its reruns are profiled"""
+    return enabled() and random.random() < PROFILE_SAMPLE_RATE
+
+def frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+class StackSampler:
+    """Samples one thread's stack at a fixed interval into collapsed-stack counts"""
+
+    def __init__(self, thread_id: int, interval_seconds: float = PROFILE_INTERVAL_SECONDS):
+        self.thread_id = thread_id
+        self.interval_seconds = interval_seconds
+        self.counts: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval_seconds):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(frame_label(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.counts[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.counts.most_common())
+
+class ProfileRun:
+    """One profiled unit of work (a rerun); the files are written on exit, even if it raised.
+
+    In cprofile mode a run that starts while another thread's cProfile run is active (which Python
+    3.12+ refuses) is left unprofiled and writes nothing.
+    """
+
+    def __init__(self, label: str, mode: str = PROFILE_MODE, directory: str = PROFILE_DIR,
+                 interval_seconds: float = PROFILE_INTERVAL_SECONDS):
+        self.label = label
+        self.mode = mode
+        self.directory = directory
+        self.interval_seconds = interval_seconds
+        self.calls: Dict[str, List[float]] = {}
+        self._profiler = None
+        self._sampler = None
+
+    def record_call(self, name: str, seconds: float):
+        self.calls.setdefault(name, []).append(seconds)
+
+    @property
+    def started(self) -> bool:
+        return self._profiler is not None or self._sampler is not None
+
+    def __enter__(self) -> "ProfileRun":
+        self._started = time.perf_counter()
+        if self.mode == "cprofile":
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Python 3.12+ allows one active profiler per process: leave this run unprofiled
+                return self
+            self._profiler = profiler
+        else:
+            self._sampler = StackSampler(threading.get_ident(), self.interval_seconds)
+            self._sampler.start()
+        self._outer, _active.run = getattr(_active, "run", None), self
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if not self.started:
+            return False
+        if self._profiler is not None:
+            self._profiler.disable()
+        if self._sampler is not None:
+            self._sampler.stop()
+        _active.run = self._outer
+        self.elapsed = time.perf_counter() - self._started
+        self.write()
+        return False
+
+    def _method_table(self) -> List[Tuple[str, int, float]]:
+        return sorted(((name, len(times), sum(times)) for name, times in self.calls.items()),
+                      key=lambda row: row[2], reverse=True)
+
+    def write(self) -> str:
+        """Write the profile and its summary; returns the common path prefix"""
+        os.makedirs(self.directory, exist_ok=True)
+        prefix = os.path.join(self.directory, f"{datetime.now():%Y%m%d-%H%M%S-%f}-{self.label}")
+        summary = io.StringIO()
+        summary.write(f"{self.label}: {self.elapsed * 1000:.1f} ms wall ({self.mode})\n\n")
+        summary.write("Instrumented calls (inclusive):\n")
+        for name, count, total in self._method_table():
+            summary.write(f"  {total * 1000:10.1f} ms  {count:4d}x  {name}\n")
+
+        if self._profiler is not None:
+            self._profiler.dump_stats(prefix + ".prof")
+            summary.write("\n")
+            pstats.Stats(self._profiler, stream=summary).sort_stats("cumulative").print_stats(PROFILE_SUMMARY_TOP)
+        else:
+            with open(prefix + ".folded", "w", encoding="utf-8") as folded:
+                folded.write(self._sampler.folded())
+        with open(prefix + ".txt", "w", encoding="utf-8") as text:
+            text.write(summary.getvalue())
+        return prefix
+
+def profile_run(label: str):
+    """Context manager profiling the enclosed work (a no-op when profiling is off)"""
+    return ProfileRun(label) if enabled() else nullcontext()
+
+def instrument(cls, prefix: str = None):
+    """Time every public method of a class into the calling thread's active ProfileRun.
+
+    Idempotent, so it can be called from a Streamlit script that re-executes on every rerun.
+    Outside a profiled run the wrappers only add a thread-local lookup.
+    """
+    prefix = prefix or cls.__name__
+    for name, method in list(vars(cls).items()):
+        if name.startswith("_") or not inspect.isfunction(method) or getattr(method, "__profiled__", False):
+            continue
+
+        def wrap(method, qualified_name):
+            @functools.wraps(method)
+            def timed(*args, **kwargs):
+                run = getattr(_active, "run", None)
+                if run is None:
+                    return method(*args, **kwargs)
+                started = time.perf_counter()
+                try:
+                    return method(*args, **kwargs)
+                finally:
+                    run.record_call(qualified_name, time.perf_counter() - started)
+            timed.__profiled__ = True
+            return timed
+
+        setattr(cls, name, wrap(method, f"{prefix}.{name}"))
+    return cls
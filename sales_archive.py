@@ -0,0 +1,223 @@
+"""Local columnar archive of historical sales for fast analytics.
+
+The archiver exports sales from Firestore into one Arrow IPC file per day
+(sales_archive/date=YYYY-MM-DD/lines.arrow) holding the flattened cart lines used by the daily
+report. Files are written uncompressed so queries can memory-map them and scan only the columns
+they need without copying or re-reading Firestore. Run it nightly, e.g. from cron:
+
+    python sales_archive.py archive                 # every day since the last archived one, up to yesterday
+    python sales_archive.py archive --since 2024-01-01
+    python sales_archive.py query ytd
+    python sales_archive.py query items --start 2024-01-01 --end 2024-12-31
+    python sales_archive.py query months --start 2024-01-01
+    python sales_archive.py --stall mall-road archive   # one stall's sales, under sales_archive/stall=mall-road
+"""
+import argparse
+import os
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, List
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+import stall_core
+from stall_core import REPORT_LINE_SCHEMA, Result, flatten_sale_lines
+
+SALES_ARCHIVE_DIR = os.environ.get("CUTIEFY_SALES_ARCHIVE_DIR", "sales_archive")
+ARCHIVE_SCHEMA = REPORT_LINE_SCHEMA.append(pa.field('date', pa.date32()))
+# Sales before this date are not expected when backfilling an empty archive
+ARCHIVE_EPOCH = date(2020, 1, 1)
+
+# 🗄️ ARCHIVER
+def partition_path(root: str, day: date) -> str:
+    return os.path.join(root, f"date={day.strftime('%Y-%m-%d')}", "lines.arrow")
+
+def archived_days(root: str = SALES_ARCHIVE_DIR) -> List[date]:
+    """Days that already have an archive partition, oldest first"""
+    if not os.path.isdir(root):
+        return []
+    days = []
+    for name in os.listdir(root):
+        if name.startswith("date=") and os.path.exists(os.path.join(root, name, "lines.arrow")):
+            days.append(date.fromisoformat(name[len("date="):]))
+    return sorted(days)
+
+def write_partition(root: str, day: date, rows: List[Dict]):
+    """Write (or replace) a day's partition; days without sales get an empty file to mark them done"""
+    path = partition_path(root, day)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    table = pa.Table.from_pylist([{**row, 'date': day} for row in rows], schema=ARCHIVE_SCHEMA)
+    with pa.OSFile(path + ".tmp", "wb") as sink:
+        with pa.ipc.new_file(sink, ARCHIVE_SCHEMA) as writer:
+            writer.write_table(table)
+    os.replace(path + ".tmp", path)
+
+def month_end(day: date) -> date:
+    next_month = date(day.year + day.month // 12, day.month % 12 + 1, 1)
+    return next_month - timedelta(days=1)
+
+def archive_sales(manager: stall_core.StallManager, since: date = None, until: date = None,
+                  root: str = SALES_ARCHIVE_DIR) -> Result[List[date]]:
+    """Export every day in [since, until] to the archive, one Firestore range query per calendar month.
+
+    since defaults to the day after the newest archived partition and until to yesterday, so a
+    nightly run only reads the sales of the days it has not archived yet. Each month's partitions
+    are written before the next month is read, so a long backfill holds one month in memory and
+    an interrupted one resumes after the last month it finished.
+    """
+    until = until or date.today() - timedelta(days=1)
+    if since is None:
+        days = archived_days(root)
+        since = days[-1] + timedelta(days=1) if days else ARCHIVE_EPOCH
+    if since > until:
+        return Result.success([])
+
+    items = manager.get_all_items()
+    current_inventory = {item['itemID']: item for item in items.value}
+
+    written, sale_count = [], 0
+    chunk_start = since
+    while chunk_start <= until:
+        chunk_end = min(month_end(chunk_start), until)
+        sales = manager.get_sales_in_range(chunk_start, chunk_end)
+        if not sales.ok:
+            failure = Result(ok=False, value=written, code=sales.code).extend(sales)
+            if written:
+                failure.note("info", f"Archived {len(written)} days up to {written[-1]} before the failure")
+            return failure.extend(items)
+
+        rows_by_day = defaultdict(list)
+        for sale in sales.value:
+            rows_by_day[sale['createdAt'].date()].extend(flatten_sale_lines(sale, current_inventory))
+        day = chunk_start
+        while day <= chunk_end:
+            write_partition(root, day, rows_by_day.get(day, []))
+            written.append(day)
+            day += timedelta(days=1)
+        sale_count += len(sales.value)
+        chunk_start = chunk_end + timedelta(days=1)
+
+    result = Result.success(written)
+    result.note("success", f"✅ Archived {sale_count} sales across {len(written)} days")
+    return result.extend(items)
+
+# 🔎 QUERY LAYER
+class SalesArchive:
+    """Memory-mapped range scans over the archive partitions"""
+
+    def __init__(self, root: str = SALES_ARCHIVE_DIR):
+        self.root = root
+
+    def scan(self, start: date, end: date, columns: List[str] = None) -> pa.Table:
+        """Lines of every archived day in [start, end]; only the requested columns are materialized"""
+        tables = []
+        for day in archived_days(self.root):
+            if start <= day <= end:
+                # Zero-copy: the table's buffers point into the mapped file
+                table = pa.ipc.open_file(pa.memory_map(partition_path(self.root, day), "r")).read_all()
+                tables.append(table.select(columns) if columns else table)
+        if not tables:
+            schema = pa.schema([ARCHIVE_SCHEMA.field(name) for name in columns]) if columns else ARCHIVE_SCHEMA
+            return schema.empty_table()
+        return pa.concat_tables(tables)
+
+    def sales(self, start: date, end: date, columns: List[str]) -> pa.Table:
+        """One row per sale (its first cart line) for sale-level totals"""
+        table = self.scan(start, end, ['line'] + [column for column in columns if column != 'line'])
+        return table.filter(pc.equal(table['line'], 0))
+
+    def totals(self, start: date, end: date) -> Dict[str, float]:
+        """Sales count, revenue, cost, profit and margin for a date range"""
+        sales = self.sales(start, end, ['saleTotalPaid', 'saleCost', 'saleProfit'])
+        revenue = pc.sum(sales['saleTotalPaid']).as_py() or 0
+        profit = pc.sum(sales['saleProfit']).as_py() or 0
+        return {
+            'sales': sales.num_rows,
+            'revenue': revenue,
+            'cost': pc.sum(sales['saleCost']).as_py() or 0,
+            'profit': profit,
+            'margin': (profit / revenue * 100) if revenue > 0 else 0
+        }
+
+    def year_to_date(self, today: date = None) -> Dict[str, float]:
+        today = today or date.today()
+        return self.totals(date(today.year, 1, 1), today)
+
+    def margin_by_item(self, start: date, end: date) -> pd.DataFrame:
+        """Quantity, revenue, cost, profit and margin per item, highest revenue first"""
+        lines = self.scan(start, end, ['itemID', 'itemName', 'quantity', 'itemCost', 'itemProfit'])
+        by_item = lines.group_by('itemID').aggregate([
+            ('itemName', 'max'), ('quantity', 'sum'), ('itemCost', 'sum'), ('itemProfit', 'sum')
+        ]).to_pandas().rename(columns={
+            'itemName_max': 'itemName', 'quantity_sum': 'quantity', 'itemCost_sum': 'cost', 'itemProfit_sum': 'profit'
+        })
+        # Revenue actually received for the line: cost plus its share of the sale profit
+        by_item['revenue'] = by_item['cost'] + by_item['profit']
+        by_item['margin'] = (by_item['profit'] / by_item['revenue'] * 100).where(by_item['revenue'] > 0, 0.0)
+        return (by_item[['itemID', 'itemName', 'quantity', 'revenue', 'cost', 'profit', 'margin']]
+                .sort_values('revenue', ascending=False)
+                .reset_index(drop=True))
+
+    def month_over_month(self, start: date, end: date) -> pd.DataFrame:
+        """Monthly sales, revenue and profit with the change against the previous month"""
+        sales = self.sales(start, end, ['date', 'saleTotalPaid', 'saleProfit'])
+        months = pc.strftime(sales['date'].cast(pa.timestamp('s')), format="%Y-%m")
+        monthly = (pa.table({'month': months, 'revenue': sales['saleTotalPaid'], 'profit': sales['saleProfit']})
+                   .group_by('month')
+                   .aggregate([('revenue', 'count'), ('revenue', 'sum'), ('profit', 'sum')])
+                   .to_pandas()
+                   .rename(columns={'revenue_count': 'sales', 'revenue_sum': 'revenue', 'profit_sum': 'profit'})
+                   .sort_values('month')
+                   .reset_index(drop=True))
+        monthly['revenueChange'] = monthly['revenue'].pct_change() * 100
+        monthly['profitChange'] = monthly['profit'].pct_change() * 100
+        return monthly
+
+def build_manager(stall_id: str = None) -> stall_core.StallManager:
+    secrets = stall_core.load_local_secrets()
+    stall = stall_core.stall_config_from_secrets(secrets, stall_id)
+    if stall is None:
+        raise SystemExit(f"Unknown stall '{stall_id}'")
+    db, aio = stall_core.initialize_backend(secrets["firebase"])
+    return stall_core.StallManager(db, aio, stall_core.email_config_from_secrets(secrets), stall=stall)
+
+def main():
+    parser = argparse.ArgumentParser(description="Cutiefy local sales archive")
+    parser.add_argument("--stall", default=stall_core.DEFAULT_STALL_ID, help="stall ID (default: CUTIEFY_STALL_ID)")
+    parser.add_argument("--root", help="archive directory (default: the stall's directory under sales_archive)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    archive = commands.add_parser("archive", help="export sales from Firestore into the archive")
+    archive.add_argument("--since", type=date.fromisoformat, help="first day to (re-)archive")
+    archive.add_argument("--until", type=date.fromisoformat, help="last day to archive (default: yesterday)")
+
+    query = commands.add_parser("query", help="run an analytics query against the archive")
+    query.add_argument("report", choices=["ytd", "items", "months"])
+    query.add_argument("--start", type=date.fromisoformat, default=date(date.today().year, 1, 1))
+    query.add_argument("--end", type=date.fromisoformat, default=date.today())
+    args = parser.parse_args()
+    args.root = args.root or stall_core.stall_data_dir(SALES_ARCHIVE_DIR, args.stall)
+
+    if args.command == "archive":
+        result = archive_sales(build_manager(args.stall), args.since, args.until, args.root)
+        for message in result.messages:
+            print(message.text)
+        raise SystemExit(0 if result.ok else 1)
+
+    sales_archive = SalesArchive(args.root)
+    started = datetime.now()
+    if args.report == "ytd":
+        totals = sales_archive.year_to_date(args.end)
+        print(f"📊 {args.end.year} to {args.end.isoformat()}: {totals['sales']} sales")
+        print(f"   💰 Revenue ₹{totals['revenue']:.2f} | 💸 Cost ₹{totals['cost']:.2f} | "
+              f"💵 Profit ₹{totals['profit']:.2f} ({totals['margin']:.1f}% margin)")
+    elif args.report == "items":
+        print(sales_archive.margin_by_item(args.start, args.end).to_string(index=False, float_format="%.2f"))
+    else:
+        print(sales_archive.month_over_month(args.start, args.end).to_string(index=False, float_format="%.2f"))
+    print(f"\n⏱️  {(datetime.now() - started).total_seconds() * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,2447 @@
+"""Cutiefy stall business core, independent of Streamlit.
+
+Operations take explicit inputs (carts, customers, dates) and return Result objects that carry
+the value, user-facing messages and stock alerts. The Streamlit UI (app.py) and the headless
+entry points (api.py, loadtest.py) decide how to present them, so the core can run in
+background threads, worker pools and batch jobs.
+"""
+import asyncio
+import bisect
+import copy
+import functools
+import io
+import logging
+import math
+import os
+import random
+import smtplib
+import threading
+import time
+import tomllib
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError, as_completed
+from dataclasses import dataclass, field
+from datetime import datetime, date, timedelta, timezone
+from decimal import Decimal, ROUND_HALF_UP
+from email.mime.image import MIMEImage
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from typing import Any, Dict, Generic, List, Optional, Tuple, TypeVar
+from urllib.parse import quote
+
+import firebase_admin
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import qrcode
+from firebase_admin import credentials, firestore, firestore_async
+from google.api_core import exceptions as google_exceptions
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+SECRETS_PATH = os.path.join(".streamlit", "secrets.toml")
+
+# 📋 RESULT TYPES
+T = TypeVar("T")
+
+@dataclass(frozen=True)
+class Message:
+    """User-facing message; level is one of success, info, warning or error"""
+    level: str
+    text: str
+
+@dataclass(frozen=True)
+class StockAlert:
+    """Raised when a sale leaves an item out of stock or below the low-stock threshold"""
+    item_id: str
+    item_name: str
+    quantity_left: int
+
+    @property
+    def text(self) -> str:
+        if self.quantity_left == 0:
+            return f"⚠️ Item '{self.item_name}' is now out of stock!"
+        return f"⚠️ Low stock alert: '{self.item_name}' has only {self.quantity_left} items left!"
+
+@dataclass
+class Result(Generic[T]):
+    """Outcome of a core operation.
+
+    code is "ok", "invalid" (bad input or insufficient stock), "not_found", "unavailable"
+    (backend unhealthy) or "error".
+    """
+    ok: bool = True
+    value: Optional[T] = None
+    code: str = "ok"
+    messages: List[Message] = field(default_factory=list)
+    alerts: List[StockAlert] = field(default_factory=list)
+
+    @classmethod
+    def success(cls, value: T = None) -> "Result[T]":
+        return cls(value=value)
+
+    @classmethod
+    def failure(cls, error: str, code: str = "error", value: T = None) -> "Result[T]":
+        return cls(ok=False, value=value, code=code, messages=[Message("error", error)])
+
+    @classmethod
+    def from_exception(cls, prefix: str, error: Exception, value: T = None) -> "Result[T]":
+        code = "unavailable" if isinstance(error, (BackendUnavailable, OutcomeUnknown)) else "error"
+        return cls.failure(f"{prefix}: {error}", code, value)
+
+    @property
+    def errors(self) -> List[str]:
+        return [message.text for message in self.messages if message.level == "error"]
+
+    def note(self, level: str, text: str) -> "Result[T]":
+        self.messages.append(Message(level, text))
+        return self
+
+    def extend(self, other: "Result") -> "Result[T]":
+        """Carry over another result's messages and stock alerts"""
+        self.messages.extend(other.messages)
+        self.alerts.extend(other.alerts)
+        return self
+
+@dataclass(frozen=True)
+class SavedSale:
+    sale_id: str
+    total_cost: float
+    total_profit: float
+    total_paid: float
+
+@dataclass(frozen=True)
+class InventorySnapshot:
+    """Items as loaded, with each document's update time for write preconditions.
+
+    high_water_mark is the newest item updatedAt (or tombstone deletedAt) applied, from which the
+    next delta sync reads; loaded_at is when the snapshot was last fully re-read.
+    """
+    items: Dict[str, Dict]
+    update_times: Dict[str, Any]
+    high_water_mark: Any = None
+    loaded_at: datetime = None
+
+@dataclass(frozen=True)
+class BulkEditOutcome:
+    updated: List[str]
+    conflicts: List[str]
+    unchanged: int
+    deleted: List[str] = field(default_factory=list)
+
+@dataclass(frozen=True)
+class CheckoutReceipt:
+    sale_id: str
+    cart: List[Dict]
+    subtotal: float
+    discount: float
+    delivery_charges: float
+    total_paid: float
+    email_sent: Optional[bool]
+
+# 💰 MONEY
+@dataclass(frozen=True, order=True)
+class Money:
+    """Exact rupee amount held as integer paise"""
+    paise: int = 0
+
+    @classmethod
+    def of(cls, rupees) -> "Money":
+        """From a rupee amount (float, str or Decimal), rounded half-up to the nearest paisa"""
+        return cls(int((Decimal(str(rupees)) * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP)))
+
+    @property
+    def rupees(self) -> float:
+        return self.paise / 100
+
+    def __add__(self, other: "Money") -> "Money":
+        return Money(self.paise + other.paise)
+
+    def __sub__(self, other: "Money") -> "Money":
+        return Money(self.paise - other.paise)
+
+    def __neg__(self) -> "Money":
+        return Money(-self.paise)
+
+    def __mul__(self, quantity: int) -> "Money":
+        return Money(self.paise * quantity)
+
+    __rmul__ = __mul__
+
+    def percent(self, percentage: float) -> "Money":
+        return Money(int((Decimal(self.paise) * Decimal(str(percentage)) / 100).quantize(Decimal(1), rounding=ROUND_HALF_UP)))
+
+    def allocate(self, weights: List[int]) -> List["Money"]:
+        """Split into parts proportional to weights that always sum exactly to this amount.
+
+        Uses the largest-remainder method: every part gets its floor share and the leftover paise
+        go to the parts with the largest fractional remainders. Zero total weight splits evenly.
+        """
+        if not weights:
+            return []
+        if sum(weights) <= 0:
+            weights = [1] * len(weights)
+        total_weight = sum(weights)
+        sign, amount = (-1 if self.paise < 0 else 1), abs(self.paise)
+        shares = [amount * weight // total_weight for weight in weights]
+        by_remainder = sorted(range(len(weights)), key=lambda i: amount * weights[i] % total_weight, reverse=True)
+        for i in by_remainder[:amount - sum(shares)]:
+            shares[i] += 1
+        return [Money(sign * share) for share in shares]
+
+    def __str__(self) -> str:
+        sign = "-" if self.paise < 0 else ""
+        return f"{sign}₹{abs(self.paise) // 100}.{abs(self.paise) % 100:02d}"
+
+def total_money(amounts) -> Money:
+    return sum(amounts, Money())
+
+# 🧾 SALE DOCUMENT ENCODING
+# Commits to try before giving up on a save: each retry follows a receipt ID collision (~N / 2^32
+# odds) or another terminal changing the stock of an item in the cart
+SALE_SAVE_ATTEMPTS = 8
+
+def new_sale_id() -> str:
+    """Short receipt ID shown to customers, also used as the sale's document ID"""
+    return uuid.uuid4().hex[:8].upper()
+
+# v2 sale documents store money as integer paise and each cart line as a compact map:
+# i=itemID, n=itemName, q=quantity, p=unit sale price, c=unit purchase price, f=line profit.
+# Line totals, costs and per-unit profit are derived, not stored.
+SALE_FORMAT_VERSION = 2
+
+def encode_sale_line(item_id: str, item_name: str, quantity: int, unit_price: Money, unit_cost: Money,
+                     profit: Money) -> Dict[str, Any]:
+    return {'i': item_id, 'n': item_name, 'q': quantity, 'p': unit_price.paise, 'c': unit_cost.paise, 'f': profit.paise}
+
+def normalize_sale(sale: Dict) -> Dict:
+    """Expand a compact v2 sale document into the rupee-valued shape readers use (legacy sales pass through)"""
+    if sale.get('v') != SALE_FORMAT_VERSION:
+        return sale
+    cart = []
+    for line in sale['lines']:
+        unit_price, unit_cost, profit, quantity = Money(line['p']), Money(line['c']), Money(line['f']), line['q']
+        cart.append({
+            'itemID': line['i'],
+            'itemName': line['n'],
+            'salePrice': unit_price.rupees,
+            'quantity': quantity,
+            'total': (unit_price * quantity).rupees,
+            'purchasePrice': unit_cost.rupees,
+            'totalCost': (unit_cost * quantity).rupees,
+            'totalProfit': profit.rupees,
+            'profitPerUnit': profit.rupees / quantity if quantity > 0 else 0
+        })
+    expanded = {key: value for key, value in sale.items()
+                if key not in ('v', 'lines', 'subtotalPaise', 'discountPaise', 'totalPaidPaise', 'totalProfitPaise')}
+    expanded.update({
+        'cart': cart,
+        'subtotal': Money(sale['subtotalPaise']).rupees,
+        'discount': Money(sale['discountPaise']).rupees,
+        'totalPaid': Money(sale['totalPaidPaise']).rupees,
+        'totalProfit': Money(sale['totalProfitPaise']).rupees
+    })
+    return expanded
+
+def rollup_amount(rollup: Dict, field_name: str) -> float:
+    """Rupee value of a rollup field, summing exact paise increments and any legacy float increments"""
+    return (rollup.get(f'{field_name}Paise', 0) + Money.of(rollup.get(field_name, 0)).paise) / 100
+
+# ⚡ ASYNC FIRESTORE DATA LAYER
+ASYNC_CONCURRENCY = 16
+
+class AsyncFirestore:
+    """Async Firestore client on a dedicated event loop, bridged back to synchronous callers.
+    
+    Independent reads and writes are issued concurrently (bounded by a semaphore), so an
+    operation touching N documents costs roughly one round trip of wall time instead of N.
+    """
+    
+    def __init__(self, client_factory, concurrency: int = ASYNC_CONCURRENCY):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="firestore-async", daemon=True)
+        self._thread.start()
+        self.client, self._semaphore = self.run(self._setup(client_factory, concurrency))
+    
+    @staticmethod
+    async def _setup(client_factory, concurrency: int):
+        # The client and semaphore must be created on the loop that will use them
+        return client_factory(), asyncio.Semaphore(concurrency)
+    
+    def run(self, coro, timeout: float = None):
+        """Run a coroutine on the data-layer loop and wait for its result (cancelling it on timeout)"""
+        future = asyncio.run_coroutine_threadsafe(coro, self._loop)
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise
+    
+    async def _bounded(self, coro):
+        async with self._semaphore:
+            return await coro
+    
+    async def gather(self, coros) -> List[Any]:
+        """Await coroutines concurrently, at most `concurrency` in flight"""
+        return await asyncio.gather(*(self._bounded(coro) for coro in coros))
+    
+    async def collect(self, query, timeout: float = None) -> List[Any]:
+        """Stream a query into a list of snapshots"""
+        return [snapshot async for snapshot in query.stream(timeout=timeout)]
+    
+    async def _find_item(self, item_id: str, timeout: float = None):
+        items_ref = self.client.collection('items')
+        snapshots = await self.collect(items_ref.where('itemID', '==', item_id).limit(1), timeout)
+        return snapshots[0] if snapshots else None
+    
+    def find_items(self, item_ids: List[str], timeout: float = None) -> Dict[str, Any]:
+        """Look up item documents by itemID concurrently; missing items are omitted"""
+        unique_ids = list(dict.fromkeys(item_ids))
+        snapshots = self.run(self.gather(self._find_item(item_id, timeout) for item_id in unique_ids), timeout)
+        return {item_id: snapshot for item_id, snapshot in zip(unique_ids, snapshots) if snapshot is not None}
+    
+    def collect_many(self, queries: List[Any], timeout: float = None) -> List[List[Any]]:
+        """Stream several independent queries concurrently"""
+        return self.run(self.gather(self.collect(query, timeout) for query in queries), timeout)
+    
+    def for_stall(self, stall_id: Optional[str]) -> "AsyncFirestore":
+        """This data layer (same loop and concurrency limit) with collections partitioned for one stall"""
+        if stall_id is None:
+            return self
+        scoped = copy.copy(self)
+        scoped.client = stall_client(self.client, stall_id)
+        return scoped
+
+# 🛡️ BACKEND CALL POLICY
+CALL_DEADLINES = {
+    "read": 5.0,
+    # Whole-collection and date-range streams, which grow with the stall's catalog and history
+    "scan": 60.0,
+    "write": 10.0,
+    "smtp": 30.0
+}
+# Extra wait past a deadline, so the RPC's own timeout normally fires first and frees its worker
+DEADLINE_GRACE_SECONDS = 1.0
+# Kinds that are side-effect free and so retried on transient failures
+IDEMPOTENT_KINDS = ("read", "scan")
+RETRY_ATTEMPTS = 3
+RETRY_BASE_DELAY_SECONDS = 0.2
+RETRY_MAX_DELAY_SECONDS = 2.0
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_RESET_SECONDS = 30
+BACKEND_CALL_WORKERS = 16
+TRANSIENT_ERRORS = (
+    TimeoutError,
+    ConnectionError,
+    smtplib.SMTPServerDisconnected,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.InternalServerError,
+    google_exceptions.TooManyRequests,
+    google_exceptions.Aborted
+)
+
+class BackendUnavailable(Exception):
+    """Raised without calling the backend while its circuit breaker is open"""
+
+class OutcomeUnknown(TimeoutError):
+    """A write or send timed out and may still have been applied"""
+
+class CircuitBreaker:
+    """Opens after consecutive transient failures and lets one trial call through after a cool-down"""
+    
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD, reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+    
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half-open" if time.monotonic() - self._opened_at >= self.reset_seconds else "open"
+    
+    def allow(self) -> bool:
+        """Whether a call may go to the backend now"""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at >= self.reset_seconds and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+    
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+    
+    def record_failure(self) -> bool:
+        """Record a transient failure; returns True if this failure tripped the breaker"""
+        with self._lock:
+            self._failures += 1
+            was_open = self._opened_at is not None
+            if was_open or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+            return not was_open and self._opened_at is not None
+
+class BackendCaller:
+    """Shared wrapper giving every backend call a deadline, retries for idempotent reads and a circuit breaker"""
+    
+    def __init__(self):
+        self.breakers = {"firestore": CircuitBreaker(), "smtp": CircuitBreaker()}
+        self._executor = ThreadPoolExecutor(max_workers=BACKEND_CALL_WORKERS, thread_name_prefix="backend-call")
+        self._counters_lock = threading.Lock()
+        self._counters: Dict[str, int] = {}
+    
+    def _count(self, name: str):
+        with self._counters_lock:
+            self._counters[name] = self._counters.get(name, 0) + 1
+    
+    def counters(self) -> Dict[str, int]:
+        """Snapshot of call, retry, timeout, failure and breaker-trip counters"""
+        with self._counters_lock:
+            return dict(sorted(self._counters.items()))
+    
+    def call(self, backend: str, operation: str, fn, kind: str = "read", idempotent: bool = None):
+        """Run fn(timeout=deadline) under the operation's deadline, retrying transient failures of idempotent calls.
+        
+        fn must pass the timeout on to its RPCs: the deadline here only stops waiting for the pool
+        thread, so without it a hung RPC keeps running (and a write may still land) after the call fails.
+        """
+        breaker = self.breakers[backend]
+        deadline = CALL_DEADLINES[kind]
+        idempotent = kind in IDEMPOTENT_KINDS if idempotent is None else idempotent
+        attempts = RETRY_ATTEMPTS if idempotent else 1
+        
+        for attempt in range(attempts):
+            if not breaker.allow():
+                self._count(f"{backend}.short_circuits")
+                raise BackendUnavailable(f"{backend} is unavailable, skipping {operation}")
+            
+            self._count(f"{backend}.calls")
+            future = self._executor.submit(fn, timeout=deadline)
+            try:
+                result = future.result(timeout=deadline + DEADLINE_GRACE_SECONDS)
+            except FutureTimeoutError:
+                self._count(f"{backend}.timeouts")
+                error = TimeoutError(f"{operation} exceeded its {deadline:.0f}s deadline")
+            except TRANSIENT_ERRORS as e:
+                error = e
+            except Exception:
+                # Not a backend health problem (bad input, permissions, ...): fail without retrying
+                breaker.record_success()
+                raise
+            else:
+                breaker.record_success()
+                return result
+            
+            self._count(f"{backend}.failures")
+            if breaker.record_failure():
+                self._count(f"{backend}.breaker_trips")
+                logger.warning("Circuit breaker for %s opened after %s failed", backend, operation)
+            if attempt + 1 < attempts:
+                self._count(f"{backend}.retries")
+                delay = min(RETRY_MAX_DELAY_SECONDS, RETRY_BASE_DELAY_SECONDS * 2 ** attempt)
+                time.sleep(random.uniform(0, delay))
+        
+        if not idempotent and isinstance(error, (TimeoutError, google_exceptions.DeadlineExceeded)):
+            raise OutcomeUnknown(f"{operation} timed out and may still have been applied") from error
+        raise error
+
+@functools.lru_cache(maxsize=None)
+def get_backend_caller() -> BackendCaller:
+    """Process-wide backend caller shared by every StallManager"""
+    return BackendCaller()
+
+# Last successfully fetched inventory per stall, served while the backend is unhealthy
+INVENTORY_FALLBACK: Dict[Optional[str], Dict[str, Any]] = {}
+# Process-wide inventory per stall kept current with delta syncs, shared by every StallManager
+INVENTORY_REPLICA: Dict[Optional[str], InventorySnapshot] = {}
+# Per-stall locks guarding the swap of a stall's replica (syncs themselves run outside them)
+INVENTORY_REPLICA_LOCKS: Dict[Optional[str], threading.Lock] = {}
+
+def inventory_replica_lock(stall_id: Optional[str]) -> threading.Lock:
+    return INVENTORY_REPLICA_LOCKS.setdefault(stall_id, threading.Lock())
+
+# 🔧 BACKEND CONNECTION
+def load_local_secrets(path: str = SECRETS_PATH) -> Dict[str, Any]:
+    """Read the Streamlit secrets file for entry points that run outside Streamlit"""
+    if not os.path.exists(path):
+        return {}
+    with open(path, "rb") as secrets_file:
+        return tomllib.load(secrets_file)
+
+def initialize_backend(firebase_config: Dict[str, Any]) -> Tuple[Any, AsyncFirestore]:
+    """Initialize the Firebase app once and return the sync client and async data layer"""
+    if not firebase_admin._apps:
+        firebase_admin.initialize_app(credentials.Certificate(dict(firebase_config)))
+    return firestore.client(), AsyncFirestore(firestore_async.client)
+
+# 📧 EMAIL CONFIGURATION
+def email_config_from_secrets(secrets: Dict[str, Any]) -> Dict[str, Any]:
+    if 'email' in secrets:
+        return {
+            "smtp_server": "smtp.gmail.com",
+            "smtp_port": 587,
+            "email": secrets["email"]["address"],
+            "password": secrets["email"]["password"]
+        }
+    else:
+        # For local development
+        return {
+            "smtp_server": "smtp.gmail.com",
+            "smtp_port": 587,
+            "email": "dsharma.workmain@gmail.com",
+            "password": "etth ppbi rmpl ikyc"
+        }
+
+# 🏪 BUSINESS CONFIGURATION
+BUSINESS_INFO = {
+    "name": "Cutiefy",
+    "brand": "Cutiefy",
+    "logo_url": "https://i.ibb.co/h1ZWHFbP/Untitled-design-1.png",
+    "contact": "Contact: +91-97178 87616",
+    "address": "Delhi, India"
+}
+
+# 💳 PAYMENT CONFIGURATION
+PAYMENT_INFO = {
+    "upi_id": "sakshi.sharma28011@okhdfcbank",
+    "payee_name": BUSINESS_INFO['brand']
+}
+
+# 🏬 STALL TENANCY
+# Each stall keeps its items, sales, customers, aggregates and ledger under stalls/{stall_id}/...,
+# so its queries and scans only touch its own documents. The default stall (no ID) keeps the
+# original top-level collections. Per-stall business and payment details come from secrets:
+#
+#     [stalls.mall-road]
+#     name = "Cutiefy Mall Road"
+#     address = "Mall Road, Shimla"
+#     upi_id = "mallroad@okhdfcbank"
+DEFAULT_STALL_ID = os.environ.get("CUTIEFY_STALL_ID") or None
+
+@dataclass(frozen=True)
+class StallConfig:
+    stall_id: Optional[str] = None
+    business_info: Dict[str, str] = field(default_factory=lambda: dict(BUSINESS_INFO))
+    payment_info: Dict[str, str] = field(default_factory=lambda: dict(PAYMENT_INFO))
+
+def stall_config_from_secrets(secrets: Dict[str, Any], stall_id: Optional[str] = DEFAULT_STALL_ID) -> Optional[StallConfig]:
+    """A stall's config with its secrets overriding the business defaults (None for an unknown stall)"""
+    if stall_id is None:
+        return StallConfig()
+    overrides = dict(secrets.get("stalls", {}).get(stall_id) or {})
+    if not overrides:
+        return None
+    business_info = {key: overrides.get(key, value) for key, value in BUSINESS_INFO.items()}
+    return StallConfig(stall_id, business_info, {
+        "upi_id": overrides.get("upi_id", PAYMENT_INFO['upi_id']),
+        "payee_name": overrides.get("payee_name", business_info['brand'])
+    })
+
+class StallScope:
+    """A Firestore client (sync or async) whose collections are the ones of a single stall"""
+
+    def __init__(self, client, stall_id: str):
+        self._client = client
+        self.stall_id = stall_id
+
+    def collection(self, name: str):
+        return self._client.collection('stalls').document(self.stall_id).collection(name)
+
+    def __getattr__(self, name: str):
+        # Batches, transactions, get_all and write options are client-wide
+        return getattr(self._client, name)
+
+def stall_client(client, stall_id: Optional[str]):
+    """The client itself for the default stall, otherwise a view scoped to the stall's collections"""
+    return client if stall_id is None else StallScope(client, stall_id)
+
+# 💳 PAYMENT QR CODES
+QR_CACHE_SIZE = 256
+QR_RENDER_WORKERS = 2
+QR_RENDER_TIMEOUT_SECONDS = 10
+
+def upi_payment_uri(upi_id: str, amount: float, payee_name: str) -> str:
+    """UPI deep link that pre-fills the payee and exact amount in any UPI app"""
+    return f"upi://pay?pa={quote(upi_id)}&pn={quote(payee_name)}&am={amount:.2f}&cu=INR"
+
+@functools.lru_cache(maxsize=QR_CACHE_SIZE)
+def render_upi_qr(upi_id: str, amount_paise: int, payee_name: str) -> bytes:
+    """Render a UPI payment QR code as PNG bytes (cached per UPI ID and amount)"""
+    qr = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_M, box_size=8, border=2)
+    qr.add_data(upi_payment_uri(upi_id, amount_paise / 100, payee_name))
+    qr.make(fit=True)
+    image: Image.Image = qr.make_image(fill_color="#B85450", back_color="white").convert("RGB")
+    
+    output = io.BytesIO()
+    image.save(output, format="PNG")
+    return output.getvalue()
+
+@functools.lru_cache(maxsize=None)
+def get_qr_executor() -> ThreadPoolExecutor:
+    """Worker pool that renders payment QR codes off the request thread"""
+    return ThreadPoolExecutor(max_workers=QR_RENDER_WORKERS, thread_name_prefix="qr-render")
+
+def submit_upi_qr(amount: float, payment_info: Dict[str, str] = PAYMENT_INFO) -> Future:
+    """Start rendering the payment QR for an amount in the background"""
+    return get_qr_executor().submit(render_upi_qr, payment_info['upi_id'], Money.of(amount).paise, payment_info['payee_name'])
+
+# 📈 SALES ROLLUP HELPERS
+def rollup_doc_id(day: str, key: str) -> str:
+    """Document ID for a rollup keyed by day and item/hour (slashes are not allowed in IDs)"""
+    return f"{day}_{str(key).replace('/', '_')}"
+
+# 🧮 SHARDED COUNTERS
+# Firestore sustains roughly one write per second to a single document, so aggregates that every
+# checkout touches are spread over shard documents in the same collection and summed on read.
+# Shard 0 is the unsuffixed document (totals written before sharding stay counted); shard k is
+# "shard{k}-<id>". The shard count can be raised at any time; after lowering it, the inventory
+# summary is only exact again once the reconciler has run.
+COUNTER_SHARDS = int(os.environ.get("CUTIEFY_COUNTER_SHARDS", "8"))
+
+def counter_shard_id(doc_id: str, shard: int) -> str:
+    return doc_id if shard == 0 else f"shard{shard}-{doc_id}"
+
+def sum_counter_shards(shards, key_fields: Tuple[str, ...] = ()) -> Dict[str, Any]:
+    """Fold shard documents into one: numeric fields are summed, key fields and other values are kept"""
+    merged = {}
+    for shard in shards:
+        for field_name, value in shard.items():
+            if field_name not in key_fields and isinstance(value, (int, float)) and not isinstance(value, bool):
+                merged[field_name] = merged.get(field_name, 0) + value
+            else:
+                merged.setdefault(field_name, value)
+    return merged
+
+class ShardedCounter:
+    """Numeric fields of one logical document, incremented on a random shard to spread write load"""
+
+    def __init__(self, db, collection: str, doc_id: str, shards: int = COUNTER_SHARDS):
+        self.db = db
+        self.collection = collection
+        self.doc_id = doc_id
+        self.shards = shards
+
+    def shard_refs(self) -> List[Any]:
+        collection_ref = self.db.collection(self.collection)
+        return [collection_ref.document(counter_shard_id(self.doc_id, shard)) for shard in range(self.shards)]
+
+    def increment(self, batch, deltas: Dict[str, float], labels: Dict[str, Any] = None):
+        """Queue increments on one random shard; labels are written alongside so shards stay queryable"""
+        shard_id = counter_shard_id(self.doc_id, random.randrange(self.shards))
+        batch.set(self.db.collection(self.collection).document(shard_id), {
+            **(labels or {}),
+            **{field_name: firestore.Increment(value) for field_name, value in deltas.items()}
+        }, merge=True)
+
+    def read(self, timeout: float = None) -> Optional[Dict[str, Any]]:
+        """The logical document summed over its shards (None if no shard exists yet)"""
+        shards = [doc.to_dict() for doc in self.db.get_all(self.shard_refs(), timeout=timeout) if doc.exists]
+        return sum_counter_shards(shards) if shards else None
+
+    def reset(self, batch, values: Dict[str, Any]):
+        """Queue an overwrite of the logical document: shard 0 takes the values, the other shards are deleted"""
+        refs = self.shard_refs()
+        batch.set(refs[0], values)
+        for ref in refs[1:]:
+            batch.delete(ref)
+
+def inventory_summary_counter(db) -> ShardedCounter:
+    return ShardedCounter(db, 'aggregates', 'inventory')
+
+# 📈 INVENTORY SUMMARY CONFIGURATION
+LOW_STOCK_THRESHOLD = 10
+RECONCILE_INTERVAL_SECONDS = 300
+SUMMARY_FIELDS = ('itemCount', 'inventoryValue', 'lowStockCount', 'salePriceTotal')
+
+# 🔄 DELTA INVENTORY SYNC
+# Item writes stamp a server-set updatedAt and deletes leave a tombstone in item_tombstones, so a
+# client holding a snapshot only reads what changed since its high-water mark. A periodic full
+# re-read catches anything written without a timestamp; tombstones outlive it by a wide margin.
+INVENTORY_FULL_RESYNC_SECONDS = 900
+ITEM_TOMBSTONE_RETENTION_DAYS = 7
+
+def stamp_item(fields: Dict[str, Any]) -> Dict[str, Any]:
+    """Item fields to write, with the server update timestamp delta syncs read from"""
+    return {**fields, 'updatedAt': firestore.SERVER_TIMESTAMP}
+
+def newest_timestamp(*timestamps) -> Any:
+    """Latest of the given timestamps, ignoring missing ones (None if there are none)"""
+    present = [timestamp for timestamp in timestamps if timestamp is not None]
+    return max(present) if present else None
+
+def prune_item_tombstones(db, retention_days: int = ITEM_TOMBSTONE_RETENTION_DAYS) -> int:
+    """Delete tombstones older than any snapshot could still be syncing from"""
+    cutoff = datetime.now(timezone.utc) - timedelta(days=retention_days)
+    expired = list(db.collection('item_tombstones').where('deletedAt', '<', cutoff).stream())
+    for start in range(0, len(expired), 500):
+        batch = db.batch()
+        for tombstone in expired[start:start + 500]:
+            batch.delete(tombstone.reference)
+        batch.commit()
+    return len(expired)
+
+# ✏️ BULK ITEM EDITS
+EDITABLE_ITEM_FIELDS = ('itemName', 'purchasePrice', 'salePrice', 'quantityAvailable')
+PRICE_FIELDS = ('purchasePrice', 'salePrice')
+# Items per write batch (Firestore allows 500 writes; a deleted item takes three: the item, its ledger
+# event and its tombstone, and each batch also updates the inventory summary)
+BULK_EDIT_BATCH_SIZE = 150
+
+def diff_item_fields(before: Dict, after: Dict) -> Dict[str, Any]:
+    """Editable fields whose edited value differs from the loaded item (prices compared to the paisa)"""
+    changes = {}
+    for field_name in EDITABLE_ITEM_FIELDS:
+        if field_name not in after:
+            continue
+        value, old = after[field_name], before.get(field_name)
+        if field_name in PRICE_FIELDS:
+            value = Money.of(value).rupees
+            changed = old is None or Money.of(old) != Money.of(value)
+        else:
+            if field_name == 'quantityAvailable':
+                value = int(value)
+            changed = old != value
+        if changed:
+            changes[field_name] = value
+    return changes
+
+def invalid_item_fields(changes: Dict[str, Any]) -> List[str]:
+    """Names of changed fields holding values an item cannot have"""
+    invalid = []
+    if 'itemName' in changes and not str(changes['itemName']).strip():
+        invalid.append('itemName')
+    invalid.extend(field_name for field_name in PRICE_FIELDS if field_name in changes and changes[field_name] < 0)
+    if changes.get('quantityAvailable', 0) < 0:
+        invalid.append('quantityAvailable')
+    return invalid
+
+def item_summary_contribution(item: Dict) -> Dict[str, float]:
+    """Contribution of a single item document to the inventory summary"""
+    if not item:
+        return {field_name: 0 for field_name in SUMMARY_FIELDS}
+    quantity = item.get('quantityAvailable', 0)
+    sale_price = item.get('salePrice', 0)
+    return {
+        'itemCount': 1,
+        'inventoryValue': sale_price * quantity,
+        'lowStockCount': 1 if quantity < LOW_STOCK_THRESHOLD else 0,
+        'salePriceTotal': sale_price
+    }
+
+def summary_delta(before: Dict, after: Dict) -> Dict[str, float]:
+    """Field-wise change to the inventory summary when an item goes from before to after"""
+    old = item_summary_contribution(before)
+    new = item_summary_contribution(after)
+    return {field_name: new[field_name] - old[field_name] for field_name in SUMMARY_FIELDS if new[field_name] != old[field_name]}
+
+def merge_summary_deltas(*deltas: Dict[str, float]) -> Dict[str, float]:
+    """Combine several summary deltas into one"""
+    merged = {}
+    for delta in deltas:
+        for field_name, value in delta.items():
+            merged[field_name] = merged.get(field_name, 0) + value
+    return {field_name: value for field_name, value in merged.items() if value != 0}
+
+def reconcile_inventory_summary(db, timeout: float = None) -> Dict[str, float]:
+    """Recompute the inventory summary from a full scan and overwrite the stored record.
+
+    Items written before update timestamps existed are stamped on the way, so delta syncs see them.
+    """
+    items = list(db.collection('items').stream(timeout=timeout))
+    summary = merge_summary_deltas(*(item_summary_contribution(item.to_dict()) for item in items))
+    summary = {field_name: summary.get(field_name, 0) for field_name in SUMMARY_FIELDS}
+    unstamped = [item for item in items if 'updatedAt' not in item.to_dict()]
+    for start in range(0, len(unstamped), 500):
+        batch = db.batch()
+        for item in unstamped[start:start + 500]:
+            batch.update(item.reference, stamp_item({}))
+        batch.commit(timeout=timeout)
+    batch = db.batch()
+    inventory_summary_counter(db).reset(batch, {
+        **summary,
+        'reconciledAt': firestore.SERVER_TIMESTAMP,
+        'updatedAt': firestore.SERVER_TIMESTAMP
+    })
+    batch.commit(timeout=timeout)
+    return summary
+
+def start_inventory_reconciler(db, interval_seconds: int = RECONCILE_INTERVAL_SECONDS) -> threading.Thread:
+    """Start the background job that corrects drift in the inventory summary"""
+    def _run():
+        while True:
+            time.sleep(interval_seconds)
+            try:
+                reconcile_inventory_summary(db)
+                prune_item_tombstones(db)
+                if compact_stock_ledger(db) is not None:
+                    for problem in verify_stock_ledger(db):
+                        logger.warning("Stock ledger mismatch: %s", problem)
+            except Exception:
+                logger.exception("Inventory summary reconciliation failed")
+
+    stall_id = getattr(db, 'stall_id', None)
+    thread = threading.Thread(target=_run, name=f"inventory-reconciler-{stall_id or 'default'}", daemon=True)
+    thread.start()
+    return thread
+
+# 📒 STOCK LEDGER
+# Every change to an item's quantityAvailable is also appended to stock_movements as an event
+# (signed delta, reason, resulting quantity, server timestamp); events are never updated. Writes
+# that change stock are preconditioned on the item's update time at the read their event's delta and
+# resulting quantity come from, so the events match the stock actually committed. The
+# reconciler periodically folds the events since the last stock_snapshots document into a new one,
+# so stock at any moment is the latest snapshot before it plus a short tail of events.
+STOCK_SNAPSHOT_INTERVAL_SECONDS = 3600
+# Events this recent may still be committing when a snapshot is cut, so they are left for the next one
+STOCK_SNAPSHOT_SETTLE_SECONDS = 60
+LEDGER_VERIFY_PARTITIONS = 8
+# Commits of a single-item edit to try while other terminals keep changing the item's stock
+ITEM_WRITE_ATTEMPTS = 5
+# Firestore auto-generated document IDs use these characters, in index order
+DOCUMENT_ID_ALPHABET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+
+def stock_movement(item_doc_id: str, item_id: str, delta: int, reason: str, quantity_after: int,
+                   sale_id: str = None) -> Dict[str, Any]:
+    """A ledger event; reason is one of added, sale, restock, adjustment or deleted"""
+    return {
+        'itemDocID': item_doc_id,
+        'itemID': item_id,
+        'delta': delta,
+        'reason': reason,
+        'quantityAfter': quantity_after,
+        'saleID': sale_id,
+        'at': firestore.SERVER_TIMESTAMP
+    }
+
+def manual_stock_reason(delta: int) -> str:
+    """Manual edits that add stock are restocks; ones that remove it are adjustments (counted shrinkage)"""
+    return 'restock' if delta > 0 else 'adjustment'
+
+def latest_stock_snapshot(db, at: datetime = None, timeout: float = None) -> Optional[Dict]:
+    """The newest stock snapshot, or the newest taken at or before `at`"""
+    query = db.collection('stock_snapshots')
+    if at is not None:
+        query = query.where('takenAt', '<=', at)
+    snapshots = list(query.order_by('takenAt', direction=firestore.Query.DESCENDING).limit(1).stream(timeout=timeout))
+    return snapshots[0].to_dict() if snapshots else None
+
+def stock_movements_between(db, after: datetime, until: datetime = None, timeout: float = None) -> List[Dict]:
+    """Ledger events in (after, until]"""
+    query = db.collection('stock_movements').where('at', '>', after)
+    if until is not None:
+        query = query.where('at', '<=', until)
+    return [movement.to_dict() for movement in query.stream(timeout=timeout)]
+
+def apply_stock_movements(quantities: Dict[str, int], movements: List[Dict]) -> Dict[str, int]:
+    """Stock per item document after adding the events' deltas to a snapshot's quantities"""
+    quantities = dict(quantities)
+    for movement in movements:
+        quantities[movement['itemDocID']] = quantities.get(movement['itemDocID'], 0) + movement['delta']
+    for movement in movements:
+        if movement['reason'] == 'deleted':
+            quantities.pop(movement['itemDocID'], None)
+    return quantities
+
+def stock_at(db, when: datetime, timeout: float = None) -> Optional[Tuple[Dict[str, int], Dict[str, str]]]:
+    """Stock and itemID per item document at a moment (None before the ledger's first snapshot)"""
+    snapshot = latest_stock_snapshot(db, when, timeout)
+    if snapshot is None:
+        return None
+    movements = stock_movements_between(db, snapshot['takenAt'], when, timeout)
+    quantities = apply_stock_movements(snapshot['quantities'], movements)
+    item_ids = {**snapshot['itemIDs'], **{movement['itemDocID']: movement['itemID'] for movement in movements}}
+    return quantities, {doc_id: item_ids.get(doc_id, doc_id) for doc_id in quantities}
+
+def compact_stock_ledger(db, min_interval_seconds: int = STOCK_SNAPSHOT_INTERVAL_SECONDS) -> Optional[Dict]:
+    """Cut a new stock snapshot from the last one plus the events since, if one is due.
+
+    Only the very first snapshot scans the items: it records today's stock as opening balances.
+    """
+    now = datetime.now(timezone.utc)
+    previous = latest_stock_snapshot(db)
+    if previous is None:
+        items = [(item.id, item.to_dict()) for item in db.collection('items').stream()]
+        taken_at = datetime.now(timezone.utc)
+        quantities = {doc_id: item.get('quantityAvailable', 0) for doc_id, item in items}
+        item_ids = {doc_id: item.get('itemID', doc_id) for doc_id, item in items}
+        movement_count = 0
+    else:
+        taken_at = now - timedelta(seconds=STOCK_SNAPSHOT_SETTLE_SECONDS)
+        if (taken_at - previous['takenAt']).total_seconds() < min_interval_seconds:
+            return None
+        movements = stock_movements_between(db, previous['takenAt'], taken_at)
+        quantities = apply_stock_movements(previous['quantities'], movements)
+        item_ids = {**previous['itemIDs'], **{movement['itemDocID']: movement['itemID'] for movement in movements}}
+        item_ids = {doc_id: item_ids.get(doc_id, doc_id) for doc_id in quantities}
+        movement_count = len(movements)
+
+    snapshot = {'takenAt': taken_at, 'quantities': quantities, 'itemIDs': item_ids, 'movementCount': movement_count}
+    db.collection('stock_snapshots').document(taken_at.strftime("%Y%m%dT%H%M%S")).set(snapshot)
+    return snapshot
+
+def item_id_partitions(partitions: int) -> List[Tuple[Optional[str], Optional[str]]]:
+    """Contiguous [start, end) document ID ranges covering every ID (None = unbounded)"""
+    bounds = [DOCUMENT_ID_ALPHABET[index * len(DOCUMENT_ID_ALPHABET) // partitions] for index in range(1, partitions)]
+    return list(zip([None] + bounds, bounds + [None]))
+
+def verify_stock_ledger(db, partitions: int = LEDGER_VERIFY_PARTITIONS) -> List[str]:
+    """Compare every item's stock with its ledger balance, scanning item ID partitions in parallel.
+
+    Items with events committed after the check started, including ones committed while the items
+    were being scanned, are skipped rather than reported.
+    """
+    started = datetime.now(timezone.utc)
+    snapshot = latest_stock_snapshot(db)
+    if snapshot is None:
+        return []
+    tail = stock_movements_between(db, snapshot['takenAt'])
+    balances = apply_stock_movements(snapshot['quantities'], tail)
+
+    items_ref = db.collection('items')
+
+    def scan(bounds: Tuple[Optional[str], Optional[str]]) -> Dict[str, Tuple[str, int]]:
+        query = items_ref
+        if bounds[0] is not None:
+            query = query.where('__name__', '>=', items_ref.document(bounds[0]))
+        if bounds[1] is not None:
+            query = query.where('__name__', '<', items_ref.document(bounds[1]))
+        return {item.id: (item.to_dict().get('itemID', item.id), item.to_dict().get('quantityAvailable', 0))
+                for item in query.stream()}
+
+    stocks = {}
+    with ThreadPoolExecutor(max_workers=partitions) as executor:
+        for partition_stocks in executor.map(scan, item_id_partitions(partitions)):
+            stocks.update(partition_stocks)
+
+    # Sales committed after the tail was read changed stock the scan saw but the balances lack:
+    # read the events since the tail's newest one and leave their items out
+    tail_end = max((movement['at'] for movement in tail), default=snapshot['takenAt'])
+    late = stock_movements_between(db, tail_end)
+    in_flight = ({movement['itemDocID'] for movement in tail if movement['at'] >= started}
+                 | {movement['itemDocID'] for movement in late})
+
+    problems = []
+    for doc_id, (item_id, stock) in stocks.items():
+        if doc_id in in_flight:
+            continue
+        expected = balances.get(doc_id)
+        if expected is None:
+            problems.append(f"{item_id}: stock {stock} but no ledger history")
+        elif stock != expected:
+            problems.append(f"{item_id}: stock {stock} but ledger implies {expected}")
+    for doc_id in balances.keys() - stocks.keys() - in_flight:
+        problems.append(f"{snapshot['itemIDs'].get(doc_id, doc_id)}: deleted but ledger still holds {balances[doc_id]}")
+    return problems
+
+# 👥 CUSTOMER DIRECTORY
+def normalize_phone(phone: str) -> str:
+    """Digits-only phone number without the country code"""
+    digits = ''.join(ch for ch in str(phone or '') if ch.isdigit())
+    return digits[-10:] if len(digits) > 10 else digits
+
+def normalize_email(email: str) -> str:
+    """Lower-cased, trimmed email address"""
+    return str(email or '').strip().lower()
+
+def phone_prefixes(prefix: str) -> List[str]:
+    """Digit prefixes a typed phone fragment may stand for, with and without a +91 or 0 trunk prefix"""
+    digits = ''.join(ch for ch in prefix if ch.isdigit())
+    candidates = [normalize_phone(digits)]
+    if digits.startswith('91') and len(digits) > 2:
+        candidates.append(digits[2:])
+    if digits.startswith('0') and len(digits) > 1:
+        candidates.append(digits[1:])
+    return list(dict.fromkeys(candidate for candidate in candidates if candidate))
+
+def customer_key(phone: str, email: str) -> str:
+    """Customer document ID: normalized phone when available, otherwise normalized email"""
+    phone_digits = normalize_phone(phone)
+    if phone_digits:
+        return f"phone_{phone_digits}"
+    email_address = normalize_email(email)
+    return f"email_{email_address.replace('/', '_')}" if email_address else ''
+
+class CustomerIndex:
+    """In-memory prefix index over customer names, phone numbers and emails"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._customers: Dict[str, Dict] = {}
+        self._entries: List[tuple] = []  # sorted (token, customer key) pairs
+    
+    @staticmethod
+    def _tokens(customer: Dict) -> set:
+        name = str(customer.get('name', '')).strip().lower()
+        tokens = {name, normalize_phone(customer.get('phone')), normalize_email(customer.get('email'))}
+        tokens.update(name.split())
+        return {token for token in tokens if token}
+    
+    def load(self, customers: List[Dict]):
+        """Replace the index contents with the given customer records"""
+        with self._lock:
+            self._customers = {customer['id']: customer for customer in customers}
+            self._entries = sorted((token, key) for key, customer in self._customers.items()
+                                   for token in self._tokens(customer))
+    
+    def upsert(self, key: str, customer: Dict):
+        """Add or refresh a single customer record"""
+        with self._lock:
+            if key in self._customers:
+                self._entries = [entry for entry in self._entries if entry[1] != key]
+            self._customers[key] = {'id': key, **customer}
+            for token in self._tokens(customer):
+                bisect.insort(self._entries, (token, key))
+    
+    def get(self, key: str) -> Dict:
+        with self._lock:
+            return self._customers.get(key)
+    
+    def search(self, prefix: str, limit: int = 5) -> List[Dict]:
+        """Customers with a name word, phone number or email starting with prefix"""
+        prefix = prefix.strip().lower()
+        if prefix and any(ch.isdigit() for ch in prefix) and not any(ch.isalpha() for ch in prefix):
+            # "+91 98765" and "098765" should find 9876543210
+            prefixes = phone_prefixes(prefix)
+        else:
+            prefixes = [prefix] if prefix else []
+        if not prefixes:
+            return []
+        
+        with self._lock:
+            matches = []
+            for prefix in prefixes:
+                position = bisect.bisect_left(self._entries, (prefix, ''))
+                while position < len(self._entries) and self._entries[position][0].startswith(prefix):
+                    key = self._entries[position][1]
+                    if key not in matches:
+                        matches.append(key)
+                    position += 1
+            customers = [self._customers[key] for key in matches]
+        
+        customers.sort(key=lambda customer: customer.get('visitCount', 0), reverse=True)
+        return customers[:limit]
+
+CUSTOMER_INDEX_TTL_SECONDS = 600
+_customer_index_state: Dict[Optional[str], Dict[str, Any]] = {}
+
+def _customer_index_entry(stall_id: Optional[str]) -> Dict[str, Any]:
+    return _customer_index_state.setdefault(stall_id, {"lock": threading.Lock(), "index": None, "loadedAt": 0.0})
+
+def load_customer_index(load_customers, stall_id: Optional[str] = None,
+                        ttl_seconds: float = CUSTOMER_INDEX_TTL_SECONDS) -> CustomerIndex:
+    """A stall's customer prefix index (shared per process), built with load_customers() and rebuilt after ttl"""
+    state = _customer_index_entry(stall_id)
+    with state["lock"]:
+        if state["index"] is None or time.monotonic() - state["loadedAt"] > ttl_seconds:
+            index = CustomerIndex()
+            index.load(load_customers())
+            state.update(index=index, loadedAt=time.monotonic())
+        return state["index"]
+
+def cached_customer_index(stall_id: Optional[str] = None) -> Optional[CustomerIndex]:
+    """The stall's customer index if this process has built one, without loading it"""
+    return _customer_index_entry(stall_id)["index"]
+
+# 📧 RECEIPT HELPERS
+def build_receipt_message(sender: str, customer_email: str, customer_name: str, cart_items: List, subtotal: float,
+                          discount: float, total_paid: float, sale_id: str, delivery_charges: float = 0.0,
+                          qr_png: bytes = None, receipt_time: datetime = None,
+                          stall: StallConfig = None) -> MIMEMultipart:
+    """Build the HTML receipt email, with the payment QR attached inline when provided"""
+    stall = stall or StallConfig()
+    business_info = stall.business_info
+    upi_id = stall.payment_info['upi_id']
+    if qr_png:
+        qr_img_html = '<img src="cid:upi_qr" alt="UPI QR Code" style="max-width:180px; margin: 20px auto; display:block;" />'
+    else:
+        qr_img_html = ''
+    
+    # Create HTML email template
+    html_template = f"""
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <meta charset="utf-8">
+        <meta name="viewport" content="width=device-width, initial-scale=1.0">
+        <title>Receipt - {business_info['brand']}</title>
+        <style>
+            body {{ font-family: 'Arial', sans-serif; background-color: #f5f5f5; margin: 0; padding: 20px; }}
+            .container {{ max-width: 600px; margin: 0 auto; background: white; border-radius: 12px; overflow: hidden; box-shadow: 0 4px 12px rgba(0,0,0,0.1); }}
+            .header {{ background: linear-gradient(135deg, #ECD0D4, #F5E6E8); padding: 30px; text-align: center; }}
+            .logo {{ max-width: 150px; height: auto; border-radius: 8px; }}
+            .brand-name {{ font-size: 2.5rem; color: #B85450; margin: 15px 0 5px 0; font-weight: bold; }}
+            .content {{ padding: 30px; }}
+            .receipt-title {{ font-size: 1.8rem; color: #B85450; margin-bottom: 20px; text-align: center; }}
+            .customer-info {{ background: #F5E6E8; padding: 20px; border-radius: 8px; margin-bottom: 25px; }}
+            .items-table {{ width: 100%; border-collapse: collapse; margin: 20px 0; }}
+            .items-table th, .items-table td {{ padding: 12px; text-align: left; border-bottom: 1px solid #ECD0D4; }}
+            .items-table th {{ background: #ECD0D4; color: #B85450; font-weight: bold; }}
+            .total-section {{ background: #F5E6E8; padding: 20px; border-radius: 8px; margin-top: 25px; }}
+            .total-row {{ display: flex; justify-content: space-between; margin: 8px 0; }}
+            .final-total {{ font-size: 1.3rem; font-weight: bold; color: #B85450; border-top: 2px solid #ECD0D4; padding-top: 15px; margin-top: 15px; }}
+            .footer {{ background: #ECD0D4; padding: 20px; text-align: center; color: #B85450; }}
+            .thank-you {{ font-size: 1.2rem; font-weight: bold; margin-bottom: 10px; }}
+        </style>
+    </head>
+    <body>
+        <div class="container">
+            <div class="header">
+                <img src="{business_info['logo_url']}" alt="Logo" class="logo">
+                <div class="brand-name">{business_info['brand']}</div>
+            </div>
+
+            <div class="content">
+                <h2 class="receipt-title">🧾 Purchase Receipt</h2>
+
+                <div class="customer-info">
+                    <h3 style="margin-top: 0; color: #B85450;">Customer Details</h3>
+                    <p><strong>Name:</strong> {customer_name}</p>
+                    <p><strong>Email:</strong> {customer_email}</p>
+                    <p><strong>Receipt ID:</strong> {sale_id}</p>
+                    <p><strong>Date:</strong> {(receipt_time or datetime.now()).strftime("%B %d, %Y at %I:%M %p")}</p>
+                </div>
+
+                <h3 style="color: #B85450;">Items Purchased</h3>
+                <table class="items-table">
+                    <thead>
+                        <tr>
+                            <th>Item</th>
+                            <th>Qty</th>
+                            <th>Price</th>
+                            <th>Total</th>
+                        </tr>
+                    </thead>
+                    <tbody>
+    """
+
+    # Add cart items to email
+    for item in cart_items:
+        html_template += f"""
+                        <tr>
+                            <td>{item['itemName']}</td>
+                            <td>{item['quantity']}</td>
+                            <td>₹{item['salePrice']:.2f}</td>
+                            <td>₹{item['total']:.2f}</td>
+                        </tr>
+        """
+
+    html_template += f"""
+                    </tbody>
+                </table>
+
+                <div class="total-section">
+                    <div class="total-row">
+                        <span>Subtotal:</span>
+                        <span>₹{subtotal:.2f}</span>
+                    </div>
+                    <div class="total-row">
+                        <span>Discount:</span>
+                        <span>-₹{discount:.2f}</span>
+                    </div>
+                    <div class="total-row">
+                        <span>Delivery Charges:</span>
+                        <span>₹{delivery_charges:.2f}</span>
+                    </div>
+                    <div class="total-row final-total">
+                        <span>Total Paid:</span>
+                        <span>₹{total_paid:.2f}</span>
+                    </div>
+                </div>
+                <div style="text-align:center; margin-top:30px;">
+                    <h3 style="color:#B85450;">Pay via UPI</h3>
+                    {qr_img_html}
+                    <p style="color:#B85450; font-weight:bold;">UPI ID: {upi_id}</p>
+                    <p style="color:#B85450;">Please scan the QR code above or pay to the UPI ID. After payment, reply to this email with a screenshot of your payment showing the <b>UPIRF number</b> for confirmation.</p>
+                </div>
+            </div>
+
+            <div class="footer">
+                <div class="thank-you">Thank you for shopping with us! 💖</div>
+                <p>{business_info['contact']}</p>
+                <p>{business_info['address']}</p>
+            </div>
+        </div>
+    </body>
+    </html>
+    """
+
+    msg = MIMEMultipart('related')
+    msg['From'] = sender
+    msg['To'] = customer_email
+    msg['Subject'] = f"Receipt from {business_info['brand']}"
+    
+    body = MIMEMultipart('alternative')
+    body.attach(MIMEText(html_template, 'html'))
+    msg.attach(body)
+    
+    if qr_png:
+        qr_part = MIMEImage(qr_png, 'png')
+        qr_part.add_header('Content-ID', '<upi_qr>')
+        qr_part.add_header('Content-Disposition', 'inline', filename='upi-qr.png')
+        msg.attach(qr_part)
+    
+    return msg
+
+def open_smtp_session(email_config: Dict[str, Any], timeout: float = CALL_DEADLINES["smtp"]) -> smtplib.SMTP:
+    """Connect and log in to the configured SMTP server (timeout also bounds every later command)"""
+    server = smtplib.SMTP(email_config['smtp_server'], email_config['smtp_port'], timeout=timeout)
+    server.starttls()
+    server.login(email_config['email'], email_config['password'])
+    return server
+
+def sale_delivery_charges(sale: Dict) -> float:
+    """Delivery charges of a stored sale (total paid minus discounted subtotal)"""
+    subtotal = sale.get('subtotal', sale['totalPaid'])
+    return max(0.0, sale['totalPaid'] - (subtotal - sale.get('discount', 0)))
+
+class RateLimiter:
+    """Thread-safe limiter allowing at most per_minute acquisitions per rolling minute"""
+    
+    def __init__(self, per_minute: int):
+        self.interval = 60.0 / max(1, per_minute)
+        self._lock = threading.Lock()
+        self._next_slot = time.monotonic()
+    
+    def acquire(self):
+        """Block until the next send slot is available"""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+# 🗂️ DAILY REPORT SHARDS
+REPORT_SHARD_DIR = os.environ.get("CUTIEFY_REPORT_SHARD_DIR", "report_shards")
+REPORT_SHARD_COMPACT_PARTS = 64
+REPORT_LINE_SCHEMA = pa.schema([
+    ('saleID', pa.string()),
+    ('time', pa.string()),
+    ('customerName', pa.string()),
+    ('customerEmail', pa.string()),
+    ('customerPhone', pa.string()),
+    ('line', pa.int32()),
+    ('itemID', pa.string()),
+    ('itemName', pa.string()),
+    ('quantity', pa.int64()),
+    ('purchasePrice', pa.float64()),
+    ('salePrice', pa.float64()),
+    ('itemRevenue', pa.float64()),
+    ('itemCost', pa.float64()),
+    ('itemProfit', pa.float64()),
+    ('profitMargin', pa.float64()),
+    ('saleSubtotal', pa.float64()),
+    ('saleDiscount', pa.float64()),
+    ('saleTotalPaid', pa.float64()),
+    ('saleCost', pa.float64()),
+    ('saleProfit', pa.float64())
+])
+
+def flatten_sale_lines(sale: Dict, current_inventory: Dict[str, Dict] = None) -> List[Dict]:
+    """Report rows for each cart line of a sale, with profit ALWAYS recalculated from the amount received"""
+    sale = normalize_sale(sale)
+    current_inventory = current_inventory or {}
+    sale_total_paid = Money.of(sale['totalPaid'])
+    sale_discount = Money.of(sale.get('discount', 0))
+    sale_subtotal = Money.of(sale.get('subtotal', sale['totalPaid'] + sale.get('discount', 0)))
+
+    def purchase_price(item: Dict) -> Money:
+        # Fallback to current inventory if no purchase price in sale record
+        price = item.get('purchasePrice', 0)
+        if price == 0 and item['itemID'] in current_inventory:
+            price = current_inventory[item['itemID']].get('purchasePrice', 0)
+        return Money.of(price)
+
+    # ACCURATE profit = Amount actually received - Total cost
+    purchase_prices = [purchase_price(item) for item in sale['cart']]
+    sale_cost = total_money(price * item['quantity'] for price, item in zip(purchase_prices, sale['cart']))
+    sale_profit = sale_total_paid - sale_cost
+
+    # Accurate item profit is an exact proportional share of the total sale profit
+    item_revenues = [Money.of(item['total']) for item in sale['cart']]
+    item_profits = sale_profit.allocate([revenue.paise for revenue in item_revenues])
+
+    rows = []
+    for line, item in enumerate(sale['cart']):
+        item_total_cost = purchase_prices[line] * item['quantity']
+        item_total_profit = item_profits[line]
+
+        # Profit margin based on actual revenue received (after discount effect)
+        if sale_subtotal.paise > 0:
+            effective_item_revenue = item_revenues[line].paise * sale_total_paid.paise / sale_subtotal.paise
+        else:
+            effective_item_revenue = item_revenues[line].paise
+        profit_margin = (item_total_profit.paise / effective_item_revenue * 100) if effective_item_revenue > 0 else 0
+
+        rows.append({
+            'saleID': sale['saleID'],
+            'time': sale['createdAt'].strftime("%I:%M %p"),
+            'customerName': sale['customerName'],
+            'customerEmail': sale['customerEmail'],
+            'customerPhone': sale['customerPhone'],
+            'line': line,
+            'itemID': item['itemID'],
+            'itemName': item['itemName'],
+            'quantity': item['quantity'],
+            'purchasePrice': purchase_prices[line].rupees,
+            'salePrice': item['salePrice'],
+            'itemRevenue': item_revenues[line].rupees,
+            'itemCost': item_total_cost.rupees,
+            'itemProfit': item_total_profit.rupees,
+            'profitMargin': profit_margin,
+            'saleSubtotal': sale_subtotal.rupees,
+            'saleDiscount': sale_discount.rupees,
+            'saleTotalPaid': sale_total_paid.rupees,
+            'saleCost': sale_cost.rupees,
+            'saleProfit': sale_profit.rupees
+        })
+    return rows
+
+def render_daily_report(lines: pd.DataFrame, selected_date: date) -> bytes:
+    """Excel report of flattened sale lines with a DAILY SUMMARY row"""
+    report_data = [{
+        'Receipt ID': row.saleID,
+        'Time': row.time,
+        'Customer Name': row.customerName,
+        'Customer Email': row.customerEmail,
+        'Customer Phone': row.customerPhone,
+        'Item Name': row.itemName,
+        'Item ID': row.itemID,
+        'Quantity': row.quantity,
+        'Purchase Price (₹)': f"₹{row.purchasePrice:.2f}",
+        'Sale Price (₹)': f"₹{row.salePrice:.2f}",
+        'Item Revenue (₹)': f"₹{row.itemRevenue:.2f}",
+        'Item Cost (₹)': f"₹{row.itemCost:.2f}",
+        'Item Profit (₹)': f"₹{row.itemProfit:.2f}",
+        'Profit Margin (%)': f"{row.profitMargin:.1f}%",
+        'Sale Subtotal (₹)': f"₹{row.saleSubtotal:.2f}",
+        'Sale Discount (₹)': f"₹{row.saleDiscount:.2f}",
+        'Sale Total Paid (₹)': f"₹{row.saleTotalPaid:.2f}",
+        'Sale Profit (₹)': f"₹{row.saleProfit:.2f}"
+    } for row in lines.itertuples(index=False)]
+
+    # Summary totals count each sale once
+    sales = lines.drop_duplicates('saleID')
+    total_revenue = sales['saleTotalPaid'].sum()
+    total_cost = sales['saleCost'].sum()
+    total_profit = sales['saleProfit'].sum()
+
+    report_data.append({
+        'Receipt ID': '=== DAILY SUMMARY ===',
+        'Time': '',
+        'Customer Name': f'📊 Total Sales: {len(sales)}',
+        'Customer Email': f'💰 Total Revenue: ₹{total_revenue:.2f}',
+        'Customer Phone': f'💸 Total Cost: ₹{total_cost:.2f}',
+        'Item Name': f'💵 Total Profit: ₹{total_profit:.2f}',
+        'Item ID': f'📈 Profit Margin: {((total_profit / total_revenue) * 100):.1f}%' if total_revenue > 0 else '0.0%',
+        'Quantity': f'✅ Calculation: Revenue({total_revenue:.2f}) - Cost({total_cost:.2f}) = Profit({total_profit:.2f})',
+        'Purchase Price (₹)': '',
+        'Sale Price (₹)': '',
+        'Item Revenue (₹)': '',
+        'Item Cost (₹)': '',
+        'Item Profit (₹)': '',
+        'Profit Margin (%)': '',
+        'Sale Subtotal (₹)': '',
+        'Sale Discount (₹)': '',
+        'Sale Total Paid (₹)': '',
+        'Sale Profit (₹)': ''
+    })
+
+    # Create Excel file
+    df = pd.DataFrame(report_data)
+
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        sheet_name = f'Sales_Profit_{selected_date.strftime("%Y-%m-%d")}'
+        df.to_excel(writer, sheet_name=sheet_name, index=False)
+
+    return output.getvalue()
+
+class ReportShardStore:
+    """Per-day Parquet shards of flattened report lines on local disk.
+
+    Every append writes a new immutable part file, so the Streamlit server, API workers and sync
+    jobs on the same host can append concurrently. Readers keep each day's lines in memory and only
+    read parts they have not seen, and the rendered Excel report is reused until new parts land.
+    A day is "seeded" once its sales saved before the shard existed have been backfilled.
+    """
+
+    def __init__(self, root: str = REPORT_SHARD_DIR, compact_parts: int = REPORT_SHARD_COMPACT_PARTS):
+        self.root = root
+        self.compact_parts = compact_parts
+        self._lock = threading.Lock()
+        self._days: Dict[str, Dict[str, Any]] = {}
+
+    def _day_dir(self, day: date) -> str:
+        return os.path.join(self.root, day.strftime("%Y-%m-%d"))
+
+    def _parts(self, day: date) -> List[str]:
+        day_dir = self._day_dir(day)
+        if not os.path.isdir(day_dir):
+            return []
+        return sorted(os.path.join(day_dir, name) for name in os.listdir(day_dir)
+                      if name.startswith("part-") and name.endswith(".parquet"))
+
+    def _write_part(self, day: date, table: pa.Table) -> str:
+        day_dir = self._day_dir(day)
+        os.makedirs(day_dir, exist_ok=True)
+        # Sortable by write time, unique across processes; renamed into place so readers never see partial files
+        path = os.path.join(day_dir, f"part-{time.time_ns():020d}-{uuid.uuid4().hex[:8]}.parquet")
+        pq.write_table(table, path + ".tmp")
+        os.replace(path + ".tmp", path)
+        return path
+
+    def is_seeded(self, day: date) -> bool:
+        return os.path.exists(os.path.join(self._day_dir(day), "_SEEDED"))
+
+    def mark_seeded(self, day: date):
+        os.makedirs(self._day_dir(day), exist_ok=True)
+        with open(os.path.join(self._day_dir(day), "_SEEDED"), "w") as marker:
+            marker.write(datetime.now().isoformat())
+
+    def append(self, day: date, rows: List[Dict]):
+        """Append report lines for one or more sales of a day"""
+        if rows:
+            self._write_part(day, pa.Table.from_pylist(rows, schema=REPORT_LINE_SCHEMA))
+            self.compact(day)
+
+    def lines(self, day: date) -> pd.DataFrame:
+        """All report lines of a day, reading only parts added since the last call"""
+        key = day.strftime("%Y-%m-%d")
+        with self._lock:
+            state = self._days.setdefault(key, {
+                "parts": set(),
+                "lines": REPORT_LINE_SCHEMA.empty_table().to_pandas(),
+                "report": None
+            })
+            new_tables = []
+            for path in self._parts(day):
+                if path in state["parts"]:
+                    continue
+                try:
+                    new_tables.append(pq.read_table(path, schema=REPORT_LINE_SCHEMA))
+                except FileNotFoundError:
+                    # Removed by a concurrent compaction; its lines are in the compacted part
+                    continue
+                state["parts"].add(path)
+            if new_tables:
+                state["lines"] = (pd.concat([state["lines"], pa.concat_tables(new_tables).to_pandas()], ignore_index=True)
+                                  .drop_duplicates(['saleID', 'line'], keep='last')
+                                  .reset_index(drop=True))
+                state["report"] = None
+            return state["lines"]
+
+    def report(self, day: date) -> bytes:
+        """Excel report for a day, re-rendered only when new lines have arrived (None if no sales)"""
+        lines = self.lines(day)
+        if lines.empty:
+            return None
+        key = day.strftime("%Y-%m-%d")
+        with self._lock:
+            state = self._days[key]
+            if state["report"] is None:
+                state["report"] = render_daily_report(lines, day)
+            return state["report"]
+
+    def sale_ids(self, day: date) -> set:
+        return set(self.lines(day)['saleID'])
+
+    def compact(self, day: date) -> bool:
+        """Merge a day's part files into one once there are more than compact_parts of them"""
+        parts = self._parts(day)
+        if len(parts) <= self.compact_parts:
+            return False
+        tables = []
+        for path in parts:
+            try:
+                tables.append(pq.read_table(path, schema=REPORT_LINE_SCHEMA))
+            except FileNotFoundError:
+                return False  # another process is already compacting
+        self._write_part(day, pa.concat_tables(tables))
+        for path in parts:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        return True
+
+def stall_data_dir(root: str, stall_id: Optional[str]) -> str:
+    """Local data directory of a stall (the root itself for the default stall)"""
+    return root if stall_id is None else os.path.join(root, f"stall={stall_id}")
+
+@functools.lru_cache(maxsize=None)
+def get_report_shard_store(stall_id: Optional[str] = None) -> ReportShardStore:
+    """Process-wide report shard store of a stall, shared by its StallManagers"""
+    return ReportShardStore(stall_data_dir(REPORT_SHARD_DIR, stall_id))
+
+class StallManager:
+    """Stall operations (inventory, billing, receipts, customers, reports) without any UI dependency"""
+
+    def __init__(self, db, aio: AsyncFirestore, email_config: Dict[str, Any], smtp_factory=None,
+                 report_shards: ReportShardStore = None, stall: StallConfig = None):
+        self.stall = stall or StallConfig()
+        self.stall_id = self.stall.stall_id
+        # Every collection this manager touches is the stall's own
+        self.db = stall_client(db, self.stall_id)
+        self.aio = aio.for_stall(self.stall_id)
+        self.calls = get_backend_caller()
+        self.email_config = email_config
+        self.smtp_factory = smtp_factory or functools.partial(open_smtp_session, email_config)
+        self.report_shards = report_shards or get_report_shard_store(self.stall_id)
+
+    # 🛡️ BACKEND CALL HELPERS
+    def _read(self, operation: str, fn):
+        """Idempotent Firestore read with deadline, retries and circuit breaker"""
+        return self.calls.call("firestore", operation, fn, kind="read")
+
+    def _scan(self, operation: str, fn):
+        """Firestore read of a whole collection or date range, under the longer scan deadline"""
+        return self.calls.call("firestore", operation, fn, kind="scan")
+
+    def _write(self, operation: str, fn):
+        """Firestore write with deadline and circuit breaker (never retried)"""
+        return self.calls.call("firestore", operation, fn, kind="write")
+
+    def _smtp(self, operation: str, fn):
+        """SMTP call with deadline and circuit breaker (never retried)"""
+        return self.calls.call("smtp", operation, fn, kind="smtp")
+
+    def backend_health(self) -> Dict[str, Any]:
+        """Breaker states and call counters for display"""
+        return {
+            "breakers": {name: breaker.state for name, breaker in self.calls.breakers.items()},
+            "counters": self.calls.counters()
+        }
+
+    # 📦 INVENTORY MANAGEMENT METHODS
+    def get_all_items(self) -> Result[List[Dict]]:
+        """All items from the delta-synced process replica, falling back to the last good copy if the backend is unhealthy"""
+        try:
+            # Sync without holding the lock, so one slow sync does not queue every reader behind it,
+            # then store the result only if no concurrent sync replaced the replica meanwhile
+            lock = inventory_replica_lock(self.stall_id)
+            with lock:
+                base = INVENTORY_REPLICA.get(self.stall_id)
+            snapshot = self._sync_snapshot(base)
+            with lock:
+                if INVENTORY_REPLICA.get(self.stall_id) is base:
+                    INVENTORY_REPLICA[self.stall_id] = snapshot
+            items = [{'id': doc_id, **item} for doc_id, item in sorted(snapshot.items.items())]
+            INVENTORY_FALLBACK[self.stall_id] = {"items": items, "fetchedAt": datetime.now()}
+            return Result.success(items)
+        except Exception as e:
+            fallback = INVENTORY_FALLBACK.get(self.stall_id)
+            if fallback is not None:
+                fetched_at = fallback['fetchedAt'].strftime('%I:%M:%S %p')
+                return Result.success(fallback["items"]).note(
+                    "warning", f"⚠️ Database unavailable ({e}). Showing cached inventory from {fetched_at}.")
+            return Result.from_exception("Error fetching items", e, [])
+
+    def get_inventory_snapshot(self) -> Result[InventorySnapshot]:
+        """All items with their document update times, as the base for bulk edits and delta syncs"""
+        try:
+            return Result.success(self._load_snapshot())
+        except Exception as e:
+            return Result.from_exception("Error fetching items", e)
+
+    def sync_inventory(self, snapshot: InventorySnapshot = None) -> Result[InventorySnapshot]:
+        """Bring a snapshot up to date, reading only items changed since it was last synced.
+
+        A full load happens when there is no snapshot yet or its last full load is older than
+        INVENTORY_FULL_RESYNC_SECONDS. On failure the given snapshot is handed back unchanged.
+        """
+        try:
+            return Result.success(self._sync_snapshot(snapshot))
+        except Exception as e:
+            return Result.from_exception("Error syncing items", e, snapshot)
+
+    def _load_snapshot(self) -> InventorySnapshot:
+        items_ref = self.db.collection('items')
+        docs = self._scan("items.snapshot", lambda timeout: list(items_ref.stream(timeout=timeout)))
+        items = {doc.id: doc.to_dict() for doc in docs}
+        return InventorySnapshot(items, {doc.id: doc.update_time for doc in docs},
+                                 newest_timestamp(*(item.get('updatedAt') for item in items.values())), datetime.now())
+
+    def _sync_snapshot(self, snapshot: Optional[InventorySnapshot]) -> InventorySnapshot:
+        """Apply items updated and tombstones written at or after the snapshot's high-water mark"""
+        if (snapshot is None or snapshot.high_water_mark is None
+                or (datetime.now() - snapshot.loaded_at).total_seconds() > INVENTORY_FULL_RESYNC_SECONDS):
+            return self._load_snapshot()
+
+        # Inclusive bounds: writes sharing the mark's timestamp are re-applied rather than missed
+        since = snapshot.high_water_mark
+        changed_query = self.aio.client.collection('items').where('updatedAt', '>=', since)
+        deleted_query = self.aio.client.collection('item_tombstones').where('deletedAt', '>=', since)
+        changed, deleted = self._read("items.sync", lambda timeout: self.aio.collect_many([changed_query, deleted_query], timeout))
+        if not changed and not deleted:
+            return snapshot
+
+        items, update_times = dict(snapshot.items), dict(snapshot.update_times)
+        for doc in changed:
+            items[doc.id], update_times[doc.id] = doc.to_dict(), doc.update_time
+        for tombstone in deleted:
+            items.pop(tombstone.id, None)
+            update_times.pop(tombstone.id, None)
+        high_water_mark = newest_timestamp(since, *(doc.to_dict().get('updatedAt') for doc in changed),
+                                           *(tombstone.to_dict().get('deletedAt') for tombstone in deleted))
+        return InventorySnapshot(items, update_times, high_water_mark, snapshot.loaded_at)
+
+    def bulk_update_items(self, snapshot: InventorySnapshot, edits: Dict[str, Dict],
+                          deletions: List[str] = ()) -> Result[BulkEditOutcome]:
+        """Write only the changed fields of edited items and delete the given items, in chunked batches.
+
+        Every update and delete is conditioned on the document's update time in the snapshot. Items
+        changed or deleted by someone else since then are reported as conflicts and left untouched;
+        the rest of their chunk is retried without them.
+        """
+        # None marks a deletion
+        changes = {doc_id: None for doc_id in deletions if doc_id in snapshot.items}
+        invalid = []
+        for doc_id, edited in edits.items():
+            if doc_id not in snapshot.items or doc_id in changes:
+                continue
+            item_id = snapshot.items[doc_id].get('itemID', doc_id)
+            try:
+                item_changes = diff_item_fields(snapshot.items[doc_id], edited)
+            except (TypeError, ValueError, ArithmeticError):
+                invalid.append(f"{item_id} (missing or non-numeric value)")
+                continue
+            if invalid_item_fields(item_changes):
+                invalid.append(f"{item_id} ({', '.join(invalid_item_fields(item_changes))})")
+            elif item_changes:
+                changes[doc_id] = item_changes
+
+        if invalid:
+            return Result.failure(f"❌ Invalid values for: {'; '.join(invalid)}", "invalid")
+
+        updated, conflicts = [], []
+        doc_ids = list(changes)
+        edit_count = sum(1 for change in changes.values() if change is not None)
+        try:
+            for start in range(0, len(doc_ids), BULK_EDIT_BATCH_SIZE):
+                chunk = doc_ids[start:start + BULK_EDIT_BATCH_SIZE]
+                try:
+                    self._commit_item_changes(snapshot, chunk, changes)
+                except google_exceptions.FailedPrecondition:
+                    stale = self._stale_items(snapshot, chunk)
+                    conflicts.extend(stale)
+                    chunk = [doc_id for doc_id in chunk if doc_id not in stale]
+                    self._commit_item_changes(snapshot, chunk, changes)
+                updated.extend(chunk)
+        except Exception as e:
+            return Result.from_exception(f"Error saving item changes ({len(updated)} saved)", e,
+                                         self._bulk_edit_outcome(updated, conflicts, len(edits) - edit_count, changes))
+
+        outcome = self._bulk_edit_outcome(updated, conflicts, len(edits) - edit_count, changes)
+        result = Result.success(outcome)
+        if outcome.updated:
+            result.note("success", f"✅ Saved changes to {len(outcome.updated)} items")
+        if outcome.deleted:
+            result.note("success", f"🗑️ Deleted {len(outcome.deleted)} items")
+        if conflicts:
+            conflicting = ', '.join(snapshot.items[doc_id].get('itemID', doc_id) for doc_id in conflicts)
+            result.note("warning", f"⚠️ {len(conflicts)} items were changed by someone else and were not saved: {conflicting}")
+        return result
+
+    @staticmethod
+    def _bulk_edit_outcome(committed: List[str], conflicts: List[str], unchanged: int,
+                           changes: Dict[str, Optional[Dict]]) -> BulkEditOutcome:
+        return BulkEditOutcome([doc_id for doc_id in committed if changes[doc_id] is not None], conflicts, unchanged,
+                               [doc_id for doc_id in committed if changes[doc_id] is None])
+
+    def _commit_item_changes(self, snapshot: InventorySnapshot, doc_ids: List[str], changes: Dict[str, Optional[Dict]]):
+        """One batch updating or deleting (None) the given items, preconditioned on their snapshot update time, and the summary"""
+        if not doc_ids:
+            return
+        items_ref = self.db.collection('items')
+        batch = self.db.batch()
+        deltas = []
+        for doc_id in doc_ids:
+            before = snapshot.items[doc_id]
+            precondition = self.db.write_option(last_update_time=snapshot.update_times[doc_id])
+            if changes[doc_id] is None:
+                batch.delete(items_ref.document(doc_id), option=precondition)
+                self._record_movement(batch, doc_id, before.get('itemID', doc_id), -before.get('quantityAvailable', 0), 'deleted', 0)
+                # Tells delta syncs to drop the item
+                batch.set(self.db.collection('item_tombstones').document(doc_id), {'deletedAt': firestore.SERVER_TIMESTAMP})
+                deltas.append(summary_delta(before, {}))
+                continue
+            batch.update(items_ref.document(doc_id), stamp_item(changes[doc_id]), option=precondition)
+            if 'quantityAvailable' in changes[doc_id]:
+                delta = changes[doc_id]['quantityAvailable'] - before.get('quantityAvailable', 0)
+                self._record_movement(batch, doc_id, before.get('itemID', doc_id), delta,
+                                      manual_stock_reason(delta), changes[doc_id]['quantityAvailable'])
+            deltas.append(summary_delta(before, {**before, **changes[doc_id]}))
+        self._apply_summary_delta(batch, merge_summary_deltas(*deltas))
+        self._write("items.bulk_update", batch.commit)
+
+    def _stale_items(self, snapshot: InventorySnapshot, doc_ids: List[str]) -> List[str]:
+        """Items deleted or updated since the snapshot was taken"""
+        refs = [self.db.collection('items').document(doc_id) for doc_id in doc_ids]
+        docs = self._read("items.get_all", lambda timeout: list(self.db.get_all(refs, timeout=timeout)))
+        current = {doc.id: doc.update_time for doc in docs if doc.exists}
+        return [doc_id for doc_id in doc_ids if current.get(doc_id) != snapshot.update_times[doc_id]]
+
+    def get_inventory_summary(self) -> Result[Dict[str, float]]:
+        """Read the incrementally maintained inventory summary, rebuilding it if missing"""
+        try:
+            counter = inventory_summary_counter(self.db)
+            summary = self._read("inventory_summary.get", counter.read)
+            if summary is None:
+                summary = self.calls.call("firestore", "inventory_summary.reconcile",
+                                          functools.partial(reconcile_inventory_summary, self.db), kind="scan", idempotent=False)
+            summary = {field_name: summary.get(field_name, 0) for field_name in SUMMARY_FIELDS}
+            summary['avgPrice'] = summary['salePriceTotal'] / summary['itemCount'] if summary['itemCount'] > 0 else 0
+            return Result.success(summary)
+        except Exception as e:
+            return Result.from_exception("Error fetching inventory summary", e,
+                                         {**{field_name: 0 for field_name in SUMMARY_FIELDS}, 'avgPrice': 0})
+
+    def _record_movement(self, batch, item_doc_id: str, item_id: str, delta: int, reason: str,
+                         quantity_after: int, sale_id: str = None):
+        """Queue a stock ledger event alongside the write that changes the item's stock"""
+        if delta == 0 and reason not in ('added', 'deleted'):
+            return
+        batch.set(self.db.collection('stock_movements').document(),
+                  stock_movement(item_doc_id, item_id, delta, reason, quantity_after, sale_id))
+
+    def _precondition(self, item_doc):
+        """Write option failing the commit if the item changed since this snapshot of it (None if it did not exist)"""
+        return self.db.write_option(last_update_time=item_doc.update_time) if item_doc.exists else None
+
+    def _commit_item_write(self, operation: str, item_ref, queue_writes):
+        """Read an item, queue writes derived from it and commit them preconditioned on that read.
+
+        queue_writes(batch, item_doc) must pass self._precondition(item_doc) to its item write. If a
+        sale or another edit changes the item first, it is re-read and the writes are rebuilt.
+        """
+        for attempt in range(ITEM_WRITE_ATTEMPTS):
+            item_doc = self._read("items.get", lambda timeout: item_ref.get(timeout=timeout))
+            batch = self.db.batch()
+            queue_writes(batch, item_doc)
+            try:
+                return self._write(operation, batch.commit)
+            except google_exceptions.FailedPrecondition:
+                if attempt + 1 == ITEM_WRITE_ATTEMPTS:
+                    raise
+
+    def _apply_summary_delta(self, batch, delta: Dict[str, float]):
+        """Queue an increment of the inventory summary on a write batch"""
+        if not delta:
+            return
+        inventory_summary_counter(self.db).increment(batch, delta, {'updatedAt': firestore.SERVER_TIMESTAMP})
+
+    def add_item(self, item_data: Dict) -> Result[None]:
+        """Add new item to inventory"""
+        try:
+            # Check if itemID already exists
+            existing_items = self.get_all_items()
+            if not existing_items.ok:
+                return existing_items
+            if any(item['itemID'] == item_data['itemID'] for item in existing_items.value):
+                return Result.failure(f"Item ID '{item_data['itemID']}' already exists!", "invalid")
+
+            batch = self.db.batch()
+            item_ref = self.db.collection('items').document()
+            batch.set(item_ref, stamp_item(item_data))
+            self._record_movement(batch, item_ref.id, item_data['itemID'], item_data.get('quantityAvailable', 0),
+                                  'added', item_data.get('quantityAvailable', 0))
+            self._apply_summary_delta(batch, summary_delta({}, item_data))
+            self._write("items.add", batch.commit)
+            return Result.success()
+        except Exception as e:
+            return Result.from_exception("Error adding item", e)
+
+    def update_item(self, doc_id: str, item_data: Dict) -> Result[None]:
+        """Update existing item"""
+        try:
+            item_ref = self.db.collection('items').document(doc_id)
+
+            def queue_update(batch, item_doc):
+                before = item_doc.to_dict() or {}
+                batch.update(item_ref, stamp_item(item_data), option=self._precondition(item_doc))
+                if 'quantityAvailable' in item_data:
+                    delta = item_data['quantityAvailable'] - before.get('quantityAvailable', 0)
+                    self._record_movement(batch, doc_id, item_data.get('itemID', before.get('itemID', doc_id)), delta,
+                                          manual_stock_reason(delta), item_data['quantityAvailable'])
+                self._apply_summary_delta(batch, summary_delta(before, {**before, **item_data}))
+
+            self._commit_item_write("items.update", item_ref, queue_update)
+            return Result.success()
+        except Exception as e:
+            return Result.from_exception("Error updating item", e)
+
+    def delete_item(self, doc_id: str) -> Result[None]:
+        """Delete item from inventory"""
+        try:
+            item_ref = self.db.collection('items').document(doc_id)
+
+            def queue_delete(batch, item_doc):
+                before = item_doc.to_dict()
+                batch.delete(item_ref, option=self._precondition(item_doc))
+                if before:
+                    self._record_movement(batch, doc_id, before.get('itemID', doc_id), -before.get('quantityAvailable', 0), 'deleted', 0)
+                # Tells delta syncs to drop the item
+                batch.set(self.db.collection('item_tombstones').document(doc_id), {'deletedAt': firestore.SERVER_TIMESTAMP})
+                self._apply_summary_delta(batch, summary_delta(before, {}))
+
+            self._commit_item_write("items.delete", item_ref, queue_delete)
+            return Result.success()
+        except Exception as e:
+            return Result.from_exception("Error deleting item", e)
+
+    # 🧾 BILLING METHODS
+    def add_to_cart(self, cart: List[Dict], item: Dict, quantity: int) -> Result[None]:
+        """Add item to the given cart with real-time inventory check"""
+        try:
+            # Get the latest inventory data to ensure accuracy
+            items_ref = self.db.collection('items')
+            current_items = self._read("items.lookup", lambda timeout: list(items_ref.where('itemID', '==', item['itemID']).stream(timeout=timeout)))
+
+            if not current_items:
+                return Result.failure(f"❌ Item '{item['itemName']}' not found in database!", "not_found")
+
+            current_item_data = current_items[0].to_dict()
+            current_available = current_item_data.get('quantityAvailable', 0)
+
+            # Check if item already in cart and calculate total needed
+            existing_in_cart = sum(cart_item['quantity'] for cart_item in cart
+                                 if cart_item['itemID'] == item['itemID'])
+            total_needed = existing_in_cart + quantity
+
+            if current_available < total_needed:
+                available_to_add = max(0, current_available - existing_in_cart)
+                if available_to_add > 0:
+                    return Result.failure(f"❌ Only {available_to_add} more items available! (You already have {existing_in_cart} in cart)", "invalid")
+                return Result.failure(f"❌ No more items available! (You already have {existing_in_cart} in cart, only {current_available} in stock)", "invalid")
+
+            # Add to cart
+            cart_item = {
+                'itemID': item['itemID'],
+                'itemName': item['itemName'],
+                'salePrice': current_item_data['salePrice'],  # Use latest price
+                'quantity': quantity,
+                'total': (Money.of(current_item_data['salePrice']) * quantity).rupees
+            }
+
+            # Check if item already in cart
+            existing_index = next((i for i, cart_item_check in enumerate(cart)
+                                  if cart_item_check['itemID'] == item['itemID']), None)
+
+            if existing_index is not None:
+                cart[existing_index]['quantity'] += quantity
+                cart[existing_index]['total'] = (
+                    Money.of(current_item_data['salePrice']) *
+                    cart[existing_index]['quantity']
+                ).rupees
+            else:
+                cart.append(cart_item)
+
+            return Result.success()
+
+        except Exception as e:
+            return Result.from_exception("Error adding to cart", e)
+
+    def remove_from_cart(self, cart: List[Dict], index: int):
+        """Remove item from cart"""
+        if 0 <= index < len(cart):
+            cart.pop(index)
+
+    def calculate_cart_total(self, cart: List[Dict]) -> float:
+        """Calculate total cart amount"""
+        return total_money(Money.of(item['total']) for item in cart).rupees
+
+    def validate_cart_inventory(self, cart: List[Dict]) -> Result[None]:
+        """Validate that all cart items have sufficient inventory"""
+        try:
+            # Look up every cart line concurrently
+            item_ids = [cart_item['itemID'] for cart_item in cart]
+            current_items = self._read("items.batch_lookup", lambda timeout: self.aio.find_items(item_ids, timeout))
+
+            for cart_item in cart:
+                if cart_item['itemID'] not in current_items:
+                    return Result.failure(f"❌ Item '{cart_item['itemName']}' no longer exists!", "not_found")
+
+                current_available = current_items[cart_item['itemID']].to_dict().get('quantityAvailable', 0)
+                if current_available < cart_item['quantity']:
+                    return Result.failure(f"❌ Insufficient stock for '{cart_item['itemName']}': Need {cart_item['quantity']}, Available {current_available}", "invalid")
+
+            return Result.success()
+        except Exception as e:
+            return Result.from_exception("Error validating inventory", e)
+
+    def apply_discount(self, subtotal: float, discount_type: str, discount_value: float) -> float:
+        """Apply discount to subtotal (rounded to the nearest paisa)"""
+        if discount_type == "Percentage":
+            return Money.of(subtotal).percent(discount_value).rupees
+        else:  # Flat discount
+            return min(Money.of(discount_value), Money.of(subtotal)).rupees
+
+    def get_item(self, item_id: str) -> Result[Dict]:
+        """Fetch a single item by itemID"""
+        try:
+            items_ref = self.db.collection('items')
+            current_items = self._read("items.lookup", lambda timeout: list(items_ref.where('itemID', '==', item_id).limit(1).stream(timeout=timeout)))
+        except Exception as e:
+            return Result.from_exception("Error fetching item", e)
+        if not current_items:
+            return Result.failure(f"Item '{item_id}' not found", "not_found")
+        return Result.success({'id': current_items[0].id, **current_items[0].to_dict()})
+
+    def checkout(self, customer_data: Dict, lines: List[Dict], discount_type: str = "None",
+                 discount_value: float = 0.0, delivery_charges: float = 0.0, send_receipt: bool = True) -> Result[CheckoutReceipt]:
+        """Cart-free one-shot checkout: price lines at current prices, check stock, save the sale and email the receipt"""
+        if not all(customer_data.get(field_name) for field_name in ('name', 'email', 'phone')):
+            return Result.failure("Customer name, email and phone are required", "invalid")
+        if discount_type not in ("None", "Percentage", "Flat Amount"):
+            return Result.failure(f"Unknown discount type '{discount_type}'", "invalid")
+        if not all(math.isfinite(amount) and amount >= 0 for amount in (discount_value, delivery_charges)):
+            return Result.failure("Discount and delivery charges must be zero or positive amounts", "invalid")
+        if discount_type == "Percentage" and discount_value > 100:
+            return Result.failure("A percentage discount cannot exceed 100%", "invalid")
+
+        quantities = {}
+        for line in lines:
+            quantity = line.get('quantity')
+            # bool is an int subclass, but `true` is not a quantity
+            if not line.get('itemID') or not isinstance(quantity, int) or isinstance(quantity, bool) or quantity <= 0:
+                return Result.failure("Each line needs an itemID and a positive integer quantity", "invalid")
+            quantities[line['itemID']] = quantities.get(line['itemID'], 0) + quantity
+        if not quantities:
+            return Result.failure("At least one line is required", "invalid")
+
+        try:
+            current_items = self._read("items.batch_lookup", lambda timeout: self.aio.find_items(list(quantities), timeout))
+        except Exception as e:
+            return Result.from_exception("Error looking up items", e)
+        cart = []
+        for item_id, quantity in quantities.items():
+            if item_id not in current_items:
+                return Result.failure(f"Item '{item_id}' not found", "invalid")
+            item_data = current_items[item_id].to_dict()
+            available = item_data.get('quantityAvailable', 0)
+            if available < quantity:
+                return Result.failure(f"Insufficient stock for '{item_data['itemName']}': Need {quantity}, Available {available}", "invalid")
+            cart.append({
+                'itemID': item_id,
+                'itemName': item_data['itemName'],
+                'salePrice': item_data['salePrice'],
+                'quantity': quantity,
+                'total': (Money.of(item_data['salePrice']) * quantity).rupees
+            })
+
+        subtotal = self.calculate_cart_total(cart)
+        discount = self.apply_discount(subtotal, discount_type, discount_value) if discount_type != "None" else 0
+        total_paid = (Money.of(subtotal) - Money.of(discount) + Money.of(delivery_charges)).rupees
+        qr_future = submit_upi_qr(total_paid, self.stall.payment_info) if send_receipt else None
+
+        saved = self.save_sale(customer_data, cart, subtotal, discount, total_paid)
+        result = Result(ok=saved.ok, code=saved.code).extend(saved)
+        if not saved.ok:
+            return result
+        sale_id = saved.value.sale_id
+
+        email_sent = None
+        if send_receipt:
+            sent = self.send_email_receipt(customer_data['email'], customer_data['name'], cart, subtotal,
+                                           discount, total_paid, sale_id, delivery_charges, qr_future)
+            result.extend(sent)
+            email_sent = sent.ok
+            result.extend(self.record_email_status(sale_id, 'sent' if email_sent else 'failed'))
+
+        result.value = CheckoutReceipt(sale_id, cart, subtotal, discount, delivery_charges, total_paid, email_sent)
+        return result
+
+    def save_sale(self, customer_data: Dict, cart_items: List, subtotal: float,
+                  discount: float, total_paid: float) -> Result[SavedSale]:
+        """Save sale to Firestore and update inventory quantities.
+
+        Each item's decrement is preconditioned on the update time of the stock it was computed from,
+        so terminals selling the same item never overwrite each other: the loser re-reads and retries.
+        """
+        try:
+            items_ref = self.db.collection('items')
+            item_ids = [cart_item['itemID'] for cart_item in cart_items]
+            unit_prices = [Money.of(cart_item['salePrice']) for cart_item in cart_items]
+            amount_received = Money.of(total_paid)
+
+            for attempt in range(SALE_SAVE_ATTEMPTS):
+                # Get current item data (purchase price and stock) for all lines concurrently
+                current_items = self._read("items.batch_lookup", lambda timeout: self.aio.find_items(item_ids, timeout))
+                for cart_item in cart_items:
+                    if cart_item['itemID'] in current_items:
+                        available = current_items[cart_item['itemID']].to_dict().get('quantityAvailable', 0)
+                        if available < cart_item['quantity']:
+                            return Result.failure(f"Insufficient stock for '{cart_item['itemName']}': "
+                                                  f"Need {cart_item['quantity']}, Available {available}", "invalid")
+
+                # All amounts in exact paise; unit cost falls back to 0 if the item no longer exists
+                unit_costs = [Money.of(current_items[cart_item['itemID']].to_dict().get('purchasePrice', 0))
+                              if cart_item['itemID'] in current_items else Money()
+                              for cart_item in cart_items]
+                total_cost = total_money(cost * cart_item['quantity'] for cost, cart_item in zip(unit_costs, cart_items))
+
+                # Calculate ACCURATE total profit: Amount Actually Received - Total Cost
+                total_profit = amount_received - total_cost
+
+                # Distribute profit exactly among items in proportion to their revenue contribution
+                line_profits = total_profit.allocate([(price * cart_item['quantity']).paise
+                                                      for price, cart_item in zip(unit_prices, cart_items)])
+
+                # The short receipt ID is the sale's document ID; create() refuses to overwrite an existing sale
+                sale_data = {
+                    'v': SALE_FORMAT_VERSION,
+                    'saleID': new_sale_id(),
+                    'customerName': customer_data['name'],
+                    'customerEmail': customer_data['email'],
+                    'customerPhone': customer_data['phone'],
+                    'lines': [encode_sale_line(cart_item['itemID'], cart_item['itemName'], cart_item['quantity'], price, cost, profit)
+                              for cart_item, price, cost, profit in zip(cart_items, unit_prices, unit_costs, line_profits)],
+                    'subtotalPaise': Money.of(subtotal).paise,
+                    'discountPaise': Money.of(discount).paise,
+                    'totalPaidPaise': amount_received.paise,
+                    'totalProfitPaise': total_profit.paise,
+                    'createdAt': datetime.now(),
+                    'emailStatus': 'pending'
+                }
+
+                # Update inventory and the inventory summary together with the sale
+                batch = self.db.batch()
+                summary_deltas = []
+                alerts = []
+                for cart_item in cart_items:
+                    if cart_item['itemID'] in current_items:
+                        item_doc = current_items[cart_item['itemID']]
+                        current_data = item_doc.to_dict()
+                        current_qty = current_data.get('quantityAvailable', 0)
+                        new_qty = current_qty - cart_item['quantity']
+
+                        # Update inventory and record the movement in the stock ledger; the precondition makes
+                        # new_qty the committed stock, so the event's quantityAfter is exact
+                        batch.update(items_ref.document(item_doc.id), stamp_item({'quantityAvailable': new_qty}),
+                                     option=self.db.write_option(last_update_time=item_doc.update_time))
+                        self._record_movement(batch, item_doc.id, cart_item['itemID'], -cart_item['quantity'],
+                                              'sale', new_qty, sale_data['saleID'])
+                        summary_deltas.append(summary_delta(current_data, {**current_data, 'quantityAvailable': new_qty}))
+
+                        # Stock alerts
+                        if new_qty < LOW_STOCK_THRESHOLD:
+                            alerts.append(StockAlert(cart_item['itemID'], cart_item['itemName'], new_qty))
+
+                self._apply_summary_delta(batch, merge_summary_deltas(*summary_deltas))
+                self._apply_sales_rollups(batch, sale_data['lines'], amount_received, total_cost, total_profit, sale_data['createdAt'])
+                customer_id = self._apply_customer_stats(batch, customer_data, amount_received.rupees, sale_data['createdAt'])
+
+                # Save the sale
+                sale_ref = self.db.collection('sales').document(sale_data['saleID'])
+                batch.create(sale_ref, sale_data)
+                try:
+                    self._write("sales.save", batch.commit)
+                    break
+                except (google_exceptions.Conflict, google_exceptions.FailedPrecondition):
+                    # Receipt ID collision, or another terminal changed an item's stock since it was read
+                    if attempt + 1 == SALE_SAVE_ATTEMPTS:
+                        raise
+                    time.sleep(random.uniform(0, min(RETRY_MAX_DELAY_SECONDS, RETRY_BASE_DELAY_SECONDS * 2 ** attempt)))
+                except OutcomeUnknown as e:
+                    # The commit may have landed after the deadline: a blind retry would sell the cart twice
+                    try:
+                        saved = self._read("sales.get", lambda timeout: sale_ref.get(timeout=timeout).exists)
+                    except Exception:
+                        return Result.failure(f"Sale {sale_data['saleID']} may or may not have been saved ({e}). "
+                                              f"Check the sales history before billing it again.", "unavailable")
+                    if not saved:
+                        return Result.failure(f"Error saving sale and updating inventory: {e}. "
+                                              f"Sale {sale_data['saleID']} was not recorded, so it is safe to retry.", "unavailable")
+                    break
+            self._refresh_customer_index(customer_id)
+            self._append_report_lines(sale_data)
+
+            result = Result.success(SavedSale(sale_data['saleID'], total_cost.rupees, total_profit.rupees, amount_received.rupees))
+            result.alerts.extend(alerts)
+            result.note("success", "✅ Inventory updated automatically!")
+            result.note("info", f"💰 Accurate Profit on this sale: {total_profit}")
+            result.note("info", f"💸 Total Cost: {total_cost} | 💵 Amount Received: {amount_received}")
+            return result
+
+        except Exception as e:
+            return Result.from_exception("Error saving sale and updating inventory", e)
+
+    def send_email_receipt(self, customer_email: str, customer_name: str,
+                          cart_items: List, subtotal: float, discount: float,
+                          total_paid: float, sale_id: str, delivery_charges: float = 0.0,
+                          qr_future: Future = None) -> Result[None]:
+        """Send beautiful HTML email receipt with a per-sale UPI QR code for the exact amount"""
+        result = Result.success()
+        try:
+            result.note("info", f"📧 Sending email to {customer_email}...")
+
+            # Payment QR encoding the UPI ID and exact amount, attached inline
+            if qr_future is None:
+                qr_future = submit_upi_qr(total_paid, self.stall.payment_info)
+            try:
+                qr_png = qr_future.result(timeout=QR_RENDER_TIMEOUT_SECONDS)
+            except Exception as e:
+                result.note("warning", f"⚠️ Could not render payment QR code: {e}")
+                qr_png = None
+
+            msg = build_receipt_message(self.email_config['email'], customer_email, customer_name, cart_items,
+                                        subtotal, discount, total_paid, sale_id, delivery_charges, qr_png,
+                                        stall=self.stall)
+
+            result.note("info", "🔗 Connecting and logging into Gmail SMTP server...")
+            server = self._smtp("smtp.connect", self.smtp_factory)
+
+            result.note("info", "📤 Sending email...")
+            try:
+                self._smtp("smtp.send", lambda timeout: server.send_message(msg))
+            finally:
+                server.quit()
+
+            return result.note("success", "✅ Email sent successfully!")
+
+        except smtplib.SMTPAuthenticationError as e:
+            failure = Result.failure(f"❌ Gmail Authentication Failed: {e}")
+            failure.note("error", "Check if your app password is correct and 2FA is enabled")
+        except smtplib.SMTPException as e:
+            failure = Result.failure(f"❌ SMTP Error: {e}")
+        except BackendUnavailable as e:
+            failure = Result.failure(f"❌ Email temporarily unavailable: {e}", "unavailable")
+        except Exception as e:
+            failure = Result.failure(f"❌ Email Error: {e}")
+            failure.note("error", "Make sure your Gmail credentials are correct")
+        failure.messages[:0] = result.messages
+        return failure
+
+    def record_email_status(self, sale_doc_id: str, status: str, error: str = '') -> Result[None]:
+        """Record the outcome of a receipt delivery attempt on the sale document"""
+        try:
+            sale_ref = self.db.collection('sales').document(sale_doc_id)
+            self._write("sales.email_status", lambda timeout: sale_ref.update({
+                'emailStatus': status,
+                'emailError': error,
+                'emailAttempts': firestore.Increment(1),
+                'emailLastAttemptAt': datetime.now()
+            }, timeout=timeout))
+            return Result.success()
+        except Exception as e:
+            return Result.from_exception(f"Error recording email status for {sale_doc_id}", e)
+
+    def resend_receipts(self, sales: List[Dict], per_minute: int = 20, max_sessions: int = 3):
+        """Re-send receipts for stored sales through a bounded pool of SMTP sessions.
+
+        Yields (saleID, sent, error) as each delivery finishes so the caller can show progress.
+        """
+        limiter = RateLimiter(per_minute)
+        session_state = threading.local()
+        sessions = []
+        sessions_lock = threading.Lock()
+
+        # Render all payment QR codes up front; repeated amounts come from the LRU cache
+        qr_futures = {sale['id']: submit_upi_qr(sale['totalPaid'], self.stall.payment_info) for sale in sales}
+
+        def deliver(sale: Dict):
+            msg = build_receipt_message(
+                self.email_config['email'], sale['customerEmail'], sale['customerName'], sale['cart'],
+                sale.get('subtotal', sale['totalPaid']), sale.get('discount', 0), sale['totalPaid'], sale['saleID'],
+                sale_delivery_charges(sale), qr_futures[sale['id']].result(timeout=QR_RENDER_TIMEOUT_SECONDS),
+                sale['createdAt'], self.stall
+            )
+            limiter.acquire()
+
+            server = getattr(session_state, 'server', None)
+            if server is None:
+                server = session_state.server = self._smtp("smtp.connect", self.smtp_factory)
+                with sessions_lock:
+                    sessions.append(server)
+            try:
+                self._smtp("smtp.send", lambda timeout: server.send_message(msg))
+            except smtplib.SMTPServerDisconnected:
+                # Reconnect once if the server dropped an idle session
+                server = session_state.server = self._smtp("smtp.connect", self.smtp_factory)
+                with sessions_lock:
+                    sessions.append(server)
+                self._smtp("smtp.send", lambda timeout: server.send_message(msg))
+
+        try:
+            with ThreadPoolExecutor(max_workers=max_sessions, thread_name_prefix="receipt-resend") as pool:
+                futures = {pool.submit(deliver, sale): sale for sale in sales}
+                for future in as_completed(futures):
+                    sale = futures[future]
+                    try:
+                        future.result()
+                        status, error = 'sent', ''
+                    except Exception as e:
+                        status, error = 'failed', str(e)
+                    recorded = self.record_email_status(sale['id'], status, error)
+                    if not recorded.ok:
+                        logger.warning("; ".join(recorded.errors))
+                    yield sale['saleID'], status == 'sent', error
+        finally:
+            for server in sessions:
+                try:
+                    server.quit()
+                except Exception:
+                    pass
+
+    def _apply_sales_rollups(self, batch, lines: List[Dict], total_paid: Money, total_cost: Money,
+                             total_profit: Money, created_at: datetime):
+        """Queue per-item/per-day, per-hour and per-day rollup increments (in exact paise) for a sale's compact lines.
+
+        The hourly and daily totals, which every checkout writes, are sharded counters. Per-item rollups
+        stay single documents: they only contend when one item sells on several terminals at once,
+        and sharding them would multiply the reads of every analytics range.
+        """
+        day = created_at.strftime("%Y-%m-%d")
+        hour = created_at.hour
+
+        for line in lines:
+            line_cost = line['c'] * line['q']
+            batch.set(self.db.collection('sales_rollups_daily_items').document(rollup_doc_id(day, line['i'])), {
+                'date': day,
+                'itemID': line['i'],
+                'itemName': line['n'],
+                'quantity': firestore.Increment(line['q']),
+                'revenuePaise': firestore.Increment(line_cost + line['f']),
+                'costPaise': firestore.Increment(line_cost),
+                'profitPaise': firestore.Increment(line['f']),
+                'saleCount': firestore.Increment(1)
+            }, merge=True)
+
+        sale_totals = {
+            'quantity': sum(line['q'] for line in lines),
+            'revenuePaise': total_paid.paise,
+            'costPaise': total_cost.paise,
+            'profitPaise': total_profit.paise,
+            'saleCount': 1
+        }
+        ShardedCounter(self.db, 'sales_rollups_hourly', rollup_doc_id(day, f"{hour:02d}")).increment(
+            batch, sale_totals, {'date': day, 'hour': hour})
+        ShardedCounter(self.db, 'sales_rollups_daily', day).increment(batch, sale_totals, {'date': day})
+
+    # 👥 CUSTOMER METHODS
+    def search_customers(self, prefix: str, limit: int = 5) -> Result[List[Dict]]:
+        """Autocomplete returning customers from the in-memory prefix index"""
+        try:
+            return Result.success(load_customer_index(self._load_customers, self.stall_id).search(prefix, limit))
+        except Exception as e:
+            return Result.from_exception("Error searching customers", e, [])
+
+    def get_top_customers(self, limit: int = 20) -> Result[List[Dict]]:
+        """Customers with the highest lifetime spend"""
+        try:
+            customers_ref = self.db.collection('customers')
+            query = customers_ref.order_by('lifetimeSpend', direction=firestore.Query.DESCENDING).limit(limit)
+            return Result.success(self._read("customers.top", lambda timeout: [{'id': customer.id, **customer.to_dict()} for customer in query.stream(timeout=timeout)]))
+        except Exception as e:
+            return Result.from_exception("Error fetching customers", e, [])
+
+    def _load_customers(self) -> List[Dict]:
+        customers_ref = self.db.collection('customers')
+        return self._scan("customers.index", lambda timeout: [{'id': customer.id, **customer.to_dict()}
+                                                              for customer in customers_ref.stream(timeout=timeout)])
+
+    def _apply_customer_stats(self, batch, customer_data: Dict, total_paid: float, created_at: datetime) -> str:
+        """Queue the customer record upsert and lifetime stats increment on a write batch"""
+        customer_id = customer_key(customer_data.get('phone'), customer_data.get('email'))
+        if not customer_id:
+            return ''
+
+        batch.set(self.db.collection('customers').document(customer_id), {
+            'name': customer_data['name'],
+            'email': customer_data['email'],
+            'phone': customer_data['phone'],
+            'lifetimeSpend': firestore.Increment(total_paid),
+            'visitCount': firestore.Increment(1),
+            'lastPurchaseAt': created_at
+        }, merge=True)
+        return customer_id
+
+    def _refresh_customer_index(self, customer_id: str):
+        """Copy a committed customer record into this process's prefix index, if one is built.
+
+        The stored record is re-read rather than adjusted by this sale's amounts, since an index
+        (re)built concurrently may already include the sale. Building the index is left to search.
+        """
+        index = cached_customer_index(self.stall_id)
+        if not customer_id or index is None:
+            return
+        try:
+            customer_ref = self.db.collection('customers').document(customer_id)
+            customer = self._read("customers.get", lambda timeout: customer_ref.get(timeout=timeout).to_dict())
+            if customer:
+                index.upsert(customer_id, customer)
+        except Exception:
+            logger.exception("Failed to refresh customer index")
+
+    # 📊 REPORTING METHODS
+    def get_daily_sales(self, selected_date: date) -> Result[List[Dict]]:
+        """Get all sales for a specific date"""
+        return self.get_sales_in_range(selected_date, selected_date)
+
+    def get_sales_in_range(self, start: date, end: date) -> Result[List[Dict]]:
+        """Get all sales between two dates (inclusive)"""
+        try:
+            start_date = datetime.combine(start, datetime.min.time())
+            end_date = datetime.combine(end, datetime.max.time())
+
+            sales_ref = self.db.collection('sales')
+            query = sales_ref.where('createdAt', '>=', start_date).where('createdAt', '<=', end_date)
+
+            return Result.success(self._scan("sales.range", lambda timeout: [{'id': sale.id, **normalize_sale(sale.to_dict())} for sale in query.stream(timeout=timeout)]))
+        except Exception as e:
+            return Result.from_exception("Error fetching daily sales", e, [])
+
+    def get_rollups(self, collection: str, start: date, end: date, key_fields: Tuple[str, ...] = ('date',)) -> Result[List[Dict]]:
+        """Read rollups for an inclusive date range, summing the counter shards of each key"""
+        try:
+            rollups_ref = self.db.collection(collection)
+            query = rollups_ref.where('date', '>=', start.strftime("%Y-%m-%d")).where('date', '<=', end.strftime("%Y-%m-%d"))
+            shards = self._scan(f"{collection}.range", lambda timeout: [rollup.to_dict() for rollup in query.stream(timeout=timeout)])
+            by_key = {}
+            for shard in shards:
+                by_key.setdefault(tuple(shard.get(field_name) for field_name in key_fields), []).append(shard)
+            rollups = [sum_counter_shards(key_shards, key_fields) for key_shards in by_key.values()]
+            for rollup in rollups:
+                for field_name in ('revenue', 'cost', 'profit'):
+                    rollup[field_name] = rollup_amount(rollup, field_name)
+            return Result.success(rollups)
+        except Exception as e:
+            return Result.from_exception("Error fetching sales analytics", e, [])
+
+    def get_item_rollups(self, start: date, end: date) -> Result[List[Dict]]:
+        """Per-item, per-day sales rollups for a date range"""
+        return self.get_rollups('sales_rollups_daily_items', start, end, ('date', 'itemID'))
+
+    def get_daily_rollups(self, start: date, end: date) -> Result[List[Dict]]:
+        """Per-day sales totals for a date range (one set of counter shards per day)"""
+        return self.get_rollups('sales_rollups_daily', start, end)
+
+    def get_hourly_rollups(self, start: date, end: date) -> Result[List[Dict]]:
+        """Per-hour sales rollups for a date range"""
+        return self.get_rollups('sales_rollups_hourly', start, end, ('date', 'hour'))
+
+    def get_daily_totals(self, selected_date: date) -> Result[Dict]:
+        """Sales count, quantity, revenue, cost and profit of one day, summed over its counter shards"""
+        try:
+            counter = ShardedCounter(self.db, 'sales_rollups_daily', selected_date.strftime("%Y-%m-%d"))
+            totals = self._read("sales_rollups_daily.get", counter.read) or {}
+            return Result.success({
+                'saleCount': totals.get('saleCount', 0),
+                'quantity': totals.get('quantity', 0),
+                **{field_name: rollup_amount(totals, field_name) for field_name in ('revenue', 'cost', 'profit')}
+            })
+        except Exception as e:
+            return Result.from_exception("Error fetching daily totals", e,
+                                         {'saleCount': 0, 'quantity': 0, 'revenue': 0, 'cost': 0, 'profit': 0})
+
+    # 📒 STOCK LEDGER METHODS
+    def get_stock_at(self, when: datetime) -> Result[List[Dict]]:
+        """Stock of every item at a moment, from the latest ledger snapshot before it plus the events since"""
+        try:
+            stock = self._scan("stock_ledger.at", lambda timeout: stock_at(self.db, when.astimezone(timezone.utc), timeout))
+            if stock is None:
+                return Result.failure("No stock history before that time yet.", "not_found", [])
+            quantities, item_ids = stock
+            names = {item['id']: item['itemName'] for item in self.get_all_items().value}
+            return Result.success(sorted(({'itemID': item_ids[doc_id], 'itemName': names.get(doc_id, ''), 'quantity': quantity}
+                                          for doc_id, quantity in quantities.items()), key=lambda row: row['itemID']))
+        except Exception as e:
+            return Result.from_exception("Error fetching stock history", e, [])
+
+    def get_stock_movement_report(self, start: date, end: date) -> Result[List[Dict]]:
+        """Per item: opening stock, units sold, restocked and lost to adjustments (shrinkage), and closing stock"""
+        try:
+            opening_at = datetime.combine(start, datetime.min.time()).astimezone(timezone.utc)
+            closing_at = min(datetime.combine(end + timedelta(days=1), datetime.min.time()).astimezone(timezone.utc),
+                             datetime.now(timezone.utc))
+            opening = self._scan("stock_ledger.at", lambda timeout: stock_at(self.db, opening_at, timeout))
+            if opening is None:
+                return Result.failure("No stock history before that date yet.", "not_found", [])
+            movements = self._scan("stock_movements.range", lambda timeout: stock_movements_between(self.db, opening_at, closing_at, timeout))
+            quantities, item_ids = opening
+            names = {item['id']: item['itemName'] for item in self.get_all_items().value}
+
+            rows = {}
+            def row(doc_id: str, item_id: str) -> Dict:
+                return rows.setdefault(doc_id, {'itemID': item_id, 'itemName': names.get(doc_id, ''),
+                                                'opening': quantities.get(doc_id, 0), 'sold': 0, 'restocked': 0,
+                                                'shrinkage': 0, 'closing': quantities.get(doc_id, 0)})
+            for doc_id, item_id in item_ids.items():
+                row(doc_id, item_id)
+            for movement in movements:
+                entry = row(movement['itemDocID'], movement['itemID'])
+                entry['closing'] += movement['delta']
+                if movement['reason'] == 'sale':
+                    entry['sold'] -= movement['delta']
+                elif movement['reason'] in ('added', 'restock'):
+                    entry['restocked'] += movement['delta']
+                elif movement['reason'] == 'adjustment':
+                    entry['shrinkage'] -= movement['delta']
+            return Result.success(sorted(rows.values(), key=lambda entry: entry['itemID']))
+        except Exception as e:
+            return Result.from_exception("Error building stock movement report", e, [])
+
+    def _append_report_lines(self, sale_data: Dict):
+        """Append a committed sale to its day's report shard (the sale itself is already saved)"""
+        try:
+            self.report_shards.append(sale_data['createdAt'].date(), flatten_sale_lines(sale_data))
+        except Exception:
+            logger.exception("Failed to append sale %s to the report shard", sale_data['saleID'])
+
+    def seed_report_shard(self, selected_date: date) -> Result[int]:
+        """Backfill a day's report shard from Firestore with the sales it does not have yet.
+
+        Sales are immutable, so a refresh only appends sales saved elsewhere since the last one.
+        """
+        start_date = datetime.combine(selected_date, datetime.min.time())
+        end_date = datetime.combine(selected_date, datetime.max.time())
+        sales_query = self.aio.client.collection('sales').where('createdAt', '>=', start_date).where('createdAt', '<=', end_date)
+        try:
+            sale_docs, = self._scan("reports.daily", lambda timeout: self.aio.collect_many([sales_query], timeout))
+            known_sales = self.report_shards.sale_ids(selected_date)
+            new_sales = [sale_doc.to_dict() for sale_doc in sale_docs if sale_doc.to_dict()['saleID'] not in known_sales]
+            # The current inventory (for fallback profit calculations) is only needed for sales being added
+            item_docs = self._scan("reports.items", lambda timeout: list(self.db.collection('items').stream(timeout=timeout))) if new_sales else []
+        except Exception as e:
+            return Result.from_exception("Error generating report", e)
+
+        current_inventory = {item.to_dict()['itemID']: item.to_dict() for item in item_docs}
+        rows = [row for sale in new_sales for row in flatten_sale_lines(sale, current_inventory)]
+        self.report_shards.append(selected_date, rows)
+        self.report_shards.mark_seeded(selected_date)
+        return Result.success(len(sale_docs))
+
+    def get_daily_report_lines(self, selected_date: date, refresh: bool = False) -> Result[pd.DataFrame]:
+        """Flattened report lines for a day from its local report shard.
+
+        Firestore is only read the first time a day is viewed on this host, or when refresh is set
+        to pick up sales saved elsewhere.
+        """
+        if refresh or not self.report_shards.is_seeded(selected_date):
+            seeded = self.seed_report_shard(selected_date)
+            if not seeded.ok:
+                return Result(ok=False, value=REPORT_LINE_SCHEMA.empty_table().to_pandas(), code=seeded.code).extend(seeded)
+        return Result.success(self.report_shards.lines(selected_date))
+
+    def generate_daily_report(self, selected_date: date, refresh: bool = False) -> Result[bytes]:
+        """Generate Excel report for daily sales with ALWAYS ACCURATE profit analysis"""
+        lines = self.get_daily_report_lines(selected_date, refresh)
+        if not lines.ok:
+            return Result(ok=False, code=lines.code).extend(lines)
+
+        report = self.report_shards.report(selected_date)
+        if report is None:
+            return Result.failure(f"No sales found for {selected_date.strftime('%B %d, %Y')}", "not_found")
+        return Result.success(report)